@@ -1,60 +1,66 @@
 #!/usr/bin/env python3
-import os, re, csv
-from difflib import SequenceMatcher
+import os, csv, sys, json, hashlib, argparse, fnmatch
+import media_fingerprint
+import media_metrics
+from pathlib import Path
+from library_scan import iter_libraries, path_key
+from sub_lang import strip_lang_flags_only
+from sub_match import VideoIndex, norm_for_score
 
 ROOT="/srv/media/movies"
-VIDEO_EXTS={'.mkv','.mp4','.m4v','.avi','.mov'}
-LANG_KEYS=['en','eng','english','es','spa','spanish','fr','fra','french','pt','por','pt-br','ptbr','it','ita','de','deu','ger','ru','rus','zh','chi','chs','cht','ja','jpn','ko','kor']
-RES_TAGS = ['2160p','1080p','720p','480p','x265','hevc','x264','h264','remux','bluray','web','webrip','web-dl','dvdrip','hdr','hdr10','dv','atmos','dts','aac']
+TV_ROOT="/srv/media/tv"  # season folders; subs matched by episode key before fuzzy scoring
+SCAN_JOBS=1  # >1 scans movie folders in parallel (network mounts)
+FINGERPRINTS=True  # same main video / duplicate filter as fix_movie_subs.py (--no-fingerprints: names only)
+OUT="/srv/backup/reports/movies_subs_audit.csv"   # .jsonl with --format jsonl
+COLUMNS=["sub_path","video_path","sub_name","video_name","lang","forced","hi","match_score","suggested_new_path","reason"]
+# incremental state: one JSON line per folder (mtime + listing hash + last rows), in scan
+# order (library_scan.path_key) so it is merged against the scan without loading it all;
+# --full ignores it, and so does a run with the other --no-fingerprints setting.
+# Lives next to the report: <report stem>.state.jsonl
+STATE_VERSION=3
 
-def strip_lang_flags_only(s):
-    n = s
-    # drop trailing language & flags variants anywhere
-    for k in LANG_KEYS + ['forced','forcedsub','sdh','hi','hearing']:
-        n = re.sub(r'(?i)(?:^|[^A-Za-z0-9])'+re.escape(k)+r'(?:[^A-Za-z0-9]|$)', ' ', n)
-    # collapse separators
-    n = re.sub(r'[^A-Za-z0-9\(\)]+',' ', n).strip()
-    return n.lower()
+def listing_hash(folder):
+    h = hashlib.sha1()
+    for p in folder.videos + [''] + folder.subs:
+        h.update(p.encode('utf-8', 'surrogateescape') + b'\0')
+    return h.hexdigest()
 
-def norm_for_score(s):
-    # for similarity score we still downplay release tokens, groups, brackets
-    s = s.lower()
-    s = re.sub(r'[\[\(][^\]\)]*[\]\)]',' ', s)  # remove bracketed text
-    for t in RES_TAGS:
-        s = re.sub(r'(?:^|[^a-z0-9])'+re.escape(t)+r'(?:[^a-z0-9]|$)',' ', s)
-    s = re.sub(r'[^a-z0-9]+',' ', s).strip()
-    return s
+def load_state(state, full=False):
+    """Yield (folder_path, entry) from the last run in scan order; nothing with --full."""
+    if full:
+        return
+    try:
+        with open(state) as f:
+            header = json.loads(f.readline() or '{}')
+            if header.get('version') != STATE_VERSION or header.get('fingerprints') != FINGERPRINTS:
+                return
+            for line in f:
+                entry = json.loads(line)
+                yield entry.pop('path'), entry
+    except (OSError, ValueError):
+        return  # unreadable/truncated state: what was read is still valid, the rest is re-scored
 
-def best_video_for(sub, videos):
-    sbase = os.path.splitext(os.path.basename(sub))[0]
-    s_norm = norm_for_score(sbase)
-    best, bestscore = None, -1.0
-    for v in videos:
-        vbase = os.path.splitext(os.path.basename(v))[0]
-        v_norm = norm_for_score(vbase)
-        score = SequenceMatcher(None, s_norm, v_norm).ratio()
-        for t in RES_TAGS:
-            if t in sbase.lower() and t in vbase.lower():
-                score += 0.2
-        score += min(len(vbase)/200.0, 0.4)
-        if score>bestscore:
-            best, bestscore = v, score
-    return best, bestscore
+def parse_filters(ap, specs):
+    filters = {}
+    for spec in specs:
+        col, sep, values = spec.partition('=')
+        if not sep or col not in COLUMNS:
+            ap.error(f"--filter expects COLUMN=VALUE with COLUMN one of {', '.join(COLUMNS)}: {spec!r}")
+        filters.setdefault(COLUMNS.index(col), set()).update(values.split(','))
+    return filters
 
-rows=[]
-for movie_dir in sorted([os.path.join(ROOT,d) for d in os.listdir(ROOT) if os.path.isdir(os.path.join(ROOT,d))]):
-    videos = [os.path.join(movie_dir,f) for f in os.listdir(movie_dir)
-              if os.path.splitext(f)[1].lower() in VIDEO_EXTS]
+def audit_folder(folder):
+    rows=[]
+    videos = folder.videos
     # subs up to depth 2
-    subs=[]
-    for root, dirs, files in os.walk(movie_dir):
-        if root[len(movie_dir):].count(os.sep) > 2: 
-            continue
-        for f in files:
-            if f.lower().endswith('.srt'):
-                subs.append(os.path.join(root,f))
+    subs = folder.subs
     if not subs: 
-        continue
+        return rows
+    main = None
+    if FINGERPRINTS:
+        # match against the videos fix_movie_subs.py would (copies dropped, main video preferred)
+        videos, _, main = media_fingerprint.match_candidates(videos, folder.tv)
+    index = VideoIndex(videos, norm_for_score, lower_len=False, episode_keys=folder.tv, main=main)
     for s in subs:
         sdir = os.path.dirname(s)
         sfile = os.path.basename(s)
@@ -62,7 +68,7 @@ for movie_dir in sorted([os.path.join(ROOT,d) for d in os.listdir(ROOT) if os.pa
         if not videos:
             rows.append([s,'',sfile,'','','','',0.0,'','no_video_in_folder'])
             continue
-        best, score = best_video_for(s, videos)
+        best, score = index.best(s)
         vfile = os.path.basename(best) if best else ''
         vbase = os.path.splitext(vfile)[0]
         same_dir = (os.path.dirname(best)==sdir) if best else False
@@ -80,11 +86,107 @@ for movie_dir in sorted([os.path.join(ROOT,d) for d in os.listdir(ROOT) if os.pa
             reason += '_lowconf'
         new = os.path.splitext(best)[0] + '.srt' if best else ''
         rows.append([s, best or '', sfile, vbase, '', '', '', round(score,3), new, reason])
+    return rows
+
+def audit_library(roots, prev, state_out, stats):
+    """
+    Yield each folder's rows as soon as it is done. Unchanged folders reuse the rows
+    from the last run; every folder's entry is streamed to state_out as it goes.
+    """
+    old_path, old = next(prev, (None, None))
+    for folder in iter_libraries(roots, jobs=SCAN_JOBS):
+        # both sides are in scan order: skip state entries for vanished folders
+        key = path_key(folder.path)
+        while old_path is not None and path_key(old_path) < key:
+            old_path, old = next(prev, (None, None))
+        lh = listing_hash(folder)
+        # the scan is cheap; scoring is not -> re-score only folders whose mtime or listing changed
+        hit = old_path == folder.path and old['mtime_ns'] == folder.mtime_ns and old['listing'] == lh
+        media_metrics.cache_lookup('audit_state', hit)
+        if hit:
+            frows = old['rows']
+            stats['reused'] += 1
+        else:
+            with media_metrics.phase('match'):
+                frows = audit_folder(folder)
+            stats['rescored'] += 1
+        media_metrics.inc('files_total', len(frows), result='audited')
+        state_out.write(json.dumps({'path': folder.path, 'mtime_ns': folder.mtime_ns, 'listing': lh, 'rows': frows}) + '\n')
+        yield frows
+
+def filtered(folders, filters):
+    for frows in folders:
+        yield [r for r in frows
+               if all(any(fnmatch.fnmatchcase(str(r[i]), v) for v in values) for i, values in filters.items())]
+
+def open_report(path):
+    """(file, tmp) -- rows go to path.partial, renamed over path once the scan completes."""
+    if path == '-':
+        return sys.stdout, None
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = path + '.partial'
+    return open(tmp, 'w', newline=''), tmp
+
+def write_report(f, folders, fmt):
+    if fmt == 'csv':
+        w = csv.writer(f)
+        w.writerow(COLUMNS)
+        emit = w.writerows
+    else:
+        def emit(rows):
+            for r in rows:
+                f.write(json.dumps(dict(zip(COLUMNS, r)), ensure_ascii=False) + '\n')
+    for rows in folders:
+        if rows:
+            emit(rows)
+            f.flush()  # readers tailing the .partial file see each folder as it lands
+
+def main(argv=None):
+    """Run the audit; returns {'out', 'rescored', 'reused'}."""
+    ap = argparse.ArgumentParser(description="Audit movie and TV subtitles against their videos.")
+    ap.add_argument("--root", action="append", help="movie library root, one folder per movie; repeatable")
+    ap.add_argument("--tv-root", action="append", help="TV library root, Show/Season NN/ folders; repeatable "
+                                                       "(default without either option: %s and %s)" % (ROOT, TV_ROOT))
+    ap.add_argument("--full", action="store_true", help="ignore the incremental state and re-score every folder")
+    ap.add_argument("--format", choices=["csv", "jsonl"], default="csv")
+    ap.add_argument("--out", help="report path, '-' for stdout (default: %s, .jsonl for --format jsonl)" % OUT)
+    ap.add_argument("--state", help="incremental state file (default: <report stem>.state.jsonl)")
+    ap.add_argument("--filter", action="append", default=[], metavar="COLUMN=VALUE[,VALUE]",
+                    help="only report rows whose column matches one of the values, shell-style "
+                         "wildcards allowed (e.g. reason=needs_move*); repeatable")
+    ap.add_argument("--fingerprint-index", default=str(media_fingerprint.DEFAULT_INDEX_PATH),
+                    help="SQLite content fingerprint index (default: %(default)s)")
+    ap.add_argument("--no-fingerprints", action="store_true",
+                    help="pick the main video by name length, like fix_movie_subs.py --no-fingerprints")
+    args = ap.parse_args(argv)
+    global FINGERPRINTS
+    FINGERPRINTS = not args.no_fingerprints
+    if FINGERPRINTS:
+        media_fingerprint.configure_index(Path(args.fingerprint_index))
+
+    media_metrics.serve_from_env()
+    out = args.out or (os.path.splitext(OUT)[0] + '.jsonl' if args.format == 'jsonl' else OUT)
+    filters = parse_filters(ap, args.filter)
+    state = args.state or os.path.splitext(OUT if out == '-' else out)[0] + '.state.jsonl'
+    os.makedirs(os.path.dirname(state) or '.', exist_ok=True)
+    stats = {'rescored': 0, 'reused': 0}
+    report, report_tmp = open_report(out)
+    state_tmp = state + '.tmp'
+    with open(state_tmp, 'w') as state_out:
+        state_out.write(json.dumps({'version': STATE_VERSION, 'fingerprints': FINGERPRINTS}) + '\n')
+        roots = [(r, False) for r in args.root or []] + [(r, True) for r in args.tv_root or []]
+        folders = audit_library(roots or [(ROOT, False), (TV_ROOT, True)], load_state(state, args.full), state_out, stats)
+        write_report(report, filtered(folders, filters), args.format)
+    # only a complete scan replaces the previous report and state
+    os.replace(state_tmp, state)
+    if report_tmp:
+        report.close()
+        os.replace(report_tmp, out)
+    print(f"folders: rescored={stats['rescored']} reused={stats['reused']}", file=sys.stderr)
+    media_metrics.finish()
+    if report_tmp:
+        print(out)
+    return {'out': out, **stats}
 
-out="/srv/backup/reports/movies_subs_audit.csv"
-os.makedirs(os.path.dirname(out), exist_ok=True)
-with open(out,'w',newline='') as f:
-    w=csv.writer(f)
-    w.writerow(["sub_path","video_path","sub_name","video_name","lang","forced","hi","match_score","suggested_new_path","reason"])
-    w.writerows(rows)
-print(out)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for the media tools on synthetic libraries (never touches /srv/media).
+
+- generates movie folders with release-style names, season packs, Subs/ and
+  Subtitles/<lang>/ subfolders and small .srt files (videos are empty placeholders;
+  the scan and match code never reads them)
+- with ffmpeg in PATH, also makes tiny real MKV/MP4 files from lavfi test sources
+  for copy_with_progress, mkv_apply (needs mkvpropedit) and mp4_apply
+- times parse_lang_flags, best_video_for, VideoIndex, the library scan and the
+  fix/audit main() end to end at each --sizes value; best of --repeat runs
+- writes JSON (--out) and compares rates against a saved baseline (--baseline);
+  exits 1 when anything is slower than the baseline by more than --threshold
+
+  python3 bench_media_tools.py --sizes 100,1000 --out bench.json
+  python3 bench_media_tools.py --sizes 100,1000 --baseline bench.json
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import audit_movie_subs
+import bench_sub_match
+import fix_movie_subs
+import library_scan
+import media_metrics
+import media_probe
+import sub_lang
+import sub_match
+import tag_audio_lang
+
+SRT_TEXT = {
+    "en": ["I don't know what you want from me.", "We have to get out of here right now.", "Is that all you can do?"],
+    "es": ["¿Qué es lo que quieres de mí?", "Tenemos que salir de aquí ahora mismo.", "Eso es todo lo que puedes hacer."],
+}
+SUB_LAYOUTS = ["{base}.{lang}.srt", "{base}.srt", "Subs/{base}.{lang}.srt", "Subs/{n}_{language}.srt",
+               "Subtitles/{language}/{n}_{language}.srt", "{base}.{lang}.forced.srt"]
+LANGUAGES = {"en": "English", "es": "Spanish"}
+
+# ---------- synthetic library ----------
+
+def write_srt(path: Path, lang: str, cues: int = 30):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    lines = SRT_TEXT[lang]
+    with path.open("w", encoding="utf-8") as f:
+        for i in range(cues):
+            f.write(f"{i + 1}\n00:00:{i % 60:02d},000 --> 00:00:{i % 60:02d},900\n{lines[i % len(lines)]}\n\n")
+
+def generate_library(root: Path, movies: int, seed: int) -> Dict[str, int]:
+    """One folder per movie; every 10th folder is a season pack with 8 episodes."""
+    rng = random.Random(seed)
+    counts = {"folders": 0, "videos": 0, "subs": 0}
+    for i in range(movies):
+        video = Path(bench_sub_match.synth_video(rng, i)).name
+        stem, ext = os.path.splitext(video)
+        folder = root / f"{stem.split('.')[0]} {i:05d}"
+        folder.mkdir(parents=True, exist_ok=True)
+        counts["folders"] += 1
+        if i % 10 == 9:
+            bases = [f"{stem}.S01E{e:02d}" for e in range(1, 9)]
+        else:
+            bases = [stem]
+        for base in bases:
+            (folder / f"{base}{ext}").touch()
+            counts["videos"] += 1
+            for n in range(rng.randint(0, 3)):
+                lang = rng.choice(list(LANGUAGES))
+                rel = rng.choice(SUB_LAYOUTS).format(base=base, lang=lang, language=LANGUAGES[lang], n=n + 2)
+                write_srt(folder / rel, lang)
+                counts["subs"] += 1
+    return counts
+
+def make_media(out_dir: Path) -> Dict[str, Path]:
+    """Tiny MKV/MP4 (1 video + 2 audio tracks) from lavfi sources; {} without ffmpeg."""
+    ffmpeg = shutil.which("ffmpeg")
+    if not ffmpeg:
+        return {}
+    made = {}
+    for ext in ("mkv", "mp4"):
+        dst = out_dir / f"lavfi.{ext}"
+        cmd = [ffmpeg, "-y", "-v", "error",
+               "-f", "lavfi", "-i", "testsrc=size=160x120:rate=10:duration=2",
+               "-f", "lavfi", "-i", "sine=frequency=440:duration=2",
+               "-f", "lavfi", "-i", "sine=frequency=660:duration=2",
+               "-map", "0", "-map", "1", "-map", "2", "-c:v", "mpeg4", "-c:a", "aac",
+               "-metadata:s:a:0", "title=Stereo track", "-metadata:s:a:1", "title=Commentary track",
+               str(dst)]
+        if subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode == 0:
+            made[ext] = dst
+    return made
+
+# ---------- timing ----------
+
+def best_of(fn: Callable[[], int], repeat: int) -> Dict[str, float]:
+    """Run fn (returns the number of ops it did) repeat times; keep the fastest."""
+    best, ops = None, 0
+    for _ in range(repeat):
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            t0 = time.perf_counter()
+            ops = fn()
+            dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return {"seconds": round(best, 6), "ops": ops, "rate": round(ops / max(best, 1e-9), 3)}
+
+def library_benches(root: Path, work: Path) -> Dict[str, Callable[[], int]]:
+    folders = list(library_scan.iter_library(str(root)))
+    names = [os.path.basename(s) for f in folders for s in f.subs]
+    pairs = [(s, f.videos) for f in folders if f.videos for s in f.subs]
+
+    def parse_lang_flags():
+        sub_lang.parse_lang_flags.cache_clear()
+        for n in names:
+            sub_lang.parse_lang_flags(n)
+        return len(names)
+
+    def best_video_for():
+        for s, videos in pairs:
+            sub_match.best_video_for(s, videos)
+        return len(pairs)
+
+    def video_index():
+        for f in folders:
+            if f.videos and f.subs:
+                index = sub_match.VideoIndex(f.videos, sub_match.norm_loose)
+                for s in f.subs:
+                    index.best(s)
+        return len(pairs)
+
+    def scan(jobs):
+        return lambda: sum(1 for _ in library_scan.iter_library(str(root), jobs=jobs))
+
+    def fix_dry_run():
+        fix_movie_subs.main(["--root", str(root), "--fingerprint-index", str(work / "fingerprint.sqlite")])
+        return len(folders)
+
+    def audit_full():
+        audit_movie_subs.main(["--root", str(root), "--full", "--out", str(work / "audit.csv"),
+                               "--fingerprint-index", str(work / "fingerprint.sqlite")])
+        return len(folders)
+
+    return {"parse_lang_flags": parse_lang_flags, "best_video_for": best_video_for, "video_index": video_index,
+            "scan_jobs1": scan(1), "scan_jobs4": scan(4), "fix_dry_run": fix_dry_run, "audit_full": audit_full}
+
+def file_benches(work: Path, media: Dict[str, Path], copy_mb: int, edits: int) -> Dict[str, Callable[[], int]]:
+    benches = {}
+    src = work / "copy.src"
+    if not src.exists():
+        block = os.urandom(1024 * 1024)
+        with src.open("wb") as f:
+            for _ in range(copy_mb):
+                f.write(block)
+
+    def copy():
+        dst = work / "copy.dst"
+        tag_audio_lang.copy_with_progress(src, dst)
+        dst.unlink()
+        return copy_mb  # MB -> rate is MB/s
+
+    benches["copy_with_progress_mb"] = copy
+
+    def apply_bench(path: Path, fn):
+        def run():
+            data = media_probe.probe(path)
+            tracks = {"audio": media_probe.audio_streams(data), "subtitle": media_probe.subtitle_streams(data)}
+            audio = tracks["audio"]
+            tracker = tag_audio_lang.ChangeTracker(keep_backups=False, backup_strategy="auto", journal=None)
+            for i in range(edits):
+                chosen = audio[i % len(audio)]["ff_index"]
+                lang = ("eng", "spa")[i % 2]
+                fn(path, tracks, tag_audio_lang.audio_choice(audio, chosen, lang, tag_audio_lang.lang_title(lang)), tracker)
+            tracker.cleanup_backups()
+            return edits
+        return run
+
+    if "mkv" in media and shutil.which("mkvpropedit"):
+        benches["mkv_apply"] = apply_bench(media["mkv"], tag_audio_lang.mkv_apply)
+    if "mp4" in media:
+        benches["mp4_apply"] = apply_bench(media["mp4"], tag_audio_lang.mp4_apply)
+    return benches
+
+# ---------- baseline ----------
+
+def compare(results: Dict, baseline: Dict, threshold: float) -> List[str]:
+    regressions = []
+    print(f"\n{'benchmark':32} {'baseline/s':>12} {'now/s':>12} {'ratio':>7}")
+    for key, now in sorted(results["results"].items()):
+        base = baseline.get("results", {}).get(key)
+        if not base:
+            print(f"{key:32} {'-':>12} {now['rate']:12.1f}    new")
+            continue
+        ratio = now["rate"] / max(base["rate"], 1e-9)
+        flag = ""
+        if ratio < 1 - threshold:
+            flag = "  REGRESSION"
+            regressions.append(key)
+        print(f"{key:32} {base['rate']:12.1f} {now['rate']:12.1f} {ratio:7.2f}{flag}")
+    return regressions
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmark the media tools on generated synthetic libraries.")
+    ap.add_argument("--sizes", default="100,1000", help="comma-separated movie folder counts (default: %(default)s)")
+    ap.add_argument("--repeat", type=int, default=3, help="runs per benchmark, fastest kept (default: %(default)s)")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--copy-mb", type=int, default=64, help="size of the copy_with_progress test file (default: %(default)s)")
+    ap.add_argument("--edits", type=int, default=10, help="mkv_apply/mp4_apply calls per run (default: %(default)s)")
+    ap.add_argument("--workdir", help="where libraries are generated (default: a temp dir, removed afterwards)")
+    ap.add_argument("--out", help="write results as JSON")
+    ap.add_argument("--baseline", help="JSON from an earlier --out to compare against")
+    ap.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown vs baseline (default: %(default)s)")
+    args = ap.parse_args(argv)
+
+    media_metrics.textfile_dir = None  # never publish benchmark runs to the real dashboards
+    media_probe.configure_cache(None)
+    work = Path(args.workdir or tempfile.mkdtemp(prefix="bench_media_tools."))
+    results = {"meta": {"python": platform.python_version(), "platform": platform.platform(), "seed": args.seed,
+                        "sizes": args.sizes, "repeat": args.repeat, "date": time.strftime("%Y-%m-%dT%H:%M:%S")},
+               "libraries": {}, "results": {}}
+    try:
+        for size in (int(s) for s in args.sizes.split(",") if s.strip()):
+            root = work / f"lib{size}"
+            shutil.rmtree(root, ignore_errors=True)
+            results["libraries"][str(size)] = generate_library(root, size, args.seed)
+            for name, fn in library_benches(root, work).items():
+                key = f"{name}@{size}"
+                results["results"][key] = best_of(fn, args.repeat)
+                print(f"{key:32} {results['results'][key]['rate']:12.1f}/s", file=sys.stderr)
+        media = make_media(work)
+        if not media:
+            print("ffmpeg not found: skipping mkv_apply/mp4_apply", file=sys.stderr)
+        for name, fn in file_benches(work, media, args.copy_mb, args.edits).items():
+            results["results"][name] = best_of(fn, args.repeat)
+            print(f"{name:32} {results['results'][name]['rate']:12.1f}/s", file=sys.stderr)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(work, ignore_errors=True)
+
+    if args.out:
+        Path(args.out).write_text(json.dumps(results, indent=2) + "\n")
+    if args.baseline:
+        regressions = compare(results, json.loads(Path(args.baseline).read_text()), args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}: {', '.join(regressions)}")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: sub_lang classifier vs the old per-call regex loops.
+
+Runs parse_lang_flags / strip_lang_flags_only over a corpus of release-style subtitle
+names, checks every result against the old implementations, and reports calls/s for
+cold (LRU cleared) and warm (memoized) runs.
+
+  python3 bench_sub_lang.py --repeat 20
+"""
+
+import argparse
+import os
+import re
+import time
+
+import sub_lang
+
+LANG_MAP = sub_lang.LANG_MAP
+LANG_KEYS = sub_lang.LANG_KEYS
+
+# ---------- old implementations (verbatim) ----------
+
+def legacy_parse_lang_flags(name):
+    n = name.lower()
+    m = re.search(r'(en|eng|english|es|spa|spanish|fr|fra|french|pt|por|pt-?br|it|ita|de|deu|ger|ru|rus|zh|chi|chs|cht|ja|jpn|ko|kor)(?!.*[a-z])', n)
+    lang = None
+    if m:
+        lang = LANG_MAP.get(m.group(1).replace('-',''), None)
+    if not lang:
+        for k in LANG_MAP:
+            if re.search(r'(?:^|[^a-z0-9])'+re.escape(k)+r'(?:[^a-z0-9]|$)', n):
+                lang = LANG_MAP[k]; break
+    forced = bool(re.search(r'(?:^|[^a-z0-9])(forced|forcedsub)(?:[^a-z0-9]|$)', n))
+    hi = bool(re.search(r'(?:^|[^a-z0-9])(sdh|hi|hearing)(?:[^a-z0-9]|$)', n))
+    return lang, forced, hi
+
+def legacy_strip_lang_flags_only(s):
+    n = s
+    for k in LANG_KEYS + ['forced','forcedsub','sdh','hi','hearing']:
+        n = re.sub(r'(?i)(?:^|[^A-Za-z0-9])'+re.escape(k)+r'(?:[^A-Za-z0-9]|$)', ' ', n)
+    n = re.sub(r'[^A-Za-z0-9\(\)]+',' ', n).strip()
+    return n.lower()
+
+# ---------- corpus ----------
+
+CORPUS = [
+    "The.Dark.Knight.2008.1080p.BluRay.x264-SPARKS.en.srt",
+    "The.Dark.Knight.2008.1080p.BluRay.x264-SPARKS.eng.forced.srt",
+    "The Dark Knight (2008) [1080p] [BluRay] [YTS.MX].English.srt",
+    "2_English.srt",
+    "3_Spanish.srt",
+    "4_Spanish (Latin America).srt",
+    "Dune.Part.Two.2024.2160p.WEB-DL.DDP5.1.Atmos.DV.HDR.H.265-FLUX.es-419.srt",
+    "Dune.Part.Two.2024.2160p.WEB-DL.DDP5.1.Atmos.DV.HDR.H.265-FLUX.spa.sdh.srt",
+    "Amelie.2001.FRENCH.1080p.BluRay.x264-LOST.fr.srt",
+    "Amelie.2001.1080p.BluRay.x264.French.HI.srt",
+    "Cidade.de.Deus.2002.720p.BluRay.x264-NTb.pt-BR.srt",
+    "Cidade.de.Deus.2002.720p.BluRay.x264-NTb.ptbr.forced.srt",
+    "Spirited.Away.2001.1080p.BluRay.x265-RARBG.jpn.srt",
+    "Spirited.Away.2001.1080p.BluRay.x265-RARBG.chs.srt",
+    "Oldboy.2003.REMASTERED.1080p.BluRay.x264.kor.srt",
+    "Parasite.2019.1080p.WEB-DL.H264.AAC-EVO.English.SDH.srt",
+    "Das.Boot.1981.Directors.Cut.1080p.BluRay.ger.srt",
+    "Leviathan.2014.720p.BluRay.rus.srt",
+    "La.vita.e.bella.1997.ita.srt",
+    "Movie.srt",
+    "movie.forced.srt",
+    "Golden.Eye.1995.srt",
+    "Hidden.Figures.2016.1080p.BluRay.hi.srt",
+    "The.Office.US.S02E01.The.Dundies.720p.WEB-DL.en.srt",
+    "The.Office.US.S02E01.The.Dundies.720p.WEB-DL.es.forcedsub.srt",
+    "Breaking.Bad.S05E14.Ozymandias.1080p.BluRay.x264-ROVERS.English.srt",
+    "Breaking Bad - 5x14 - Ozymandias.eng.hearing.srt",
+]
+
+def corpus(size: int):
+    """Corpus names plus season-pack style variants (the kind the LRU pays off on)."""
+    out = list(CORPUS)
+    i = 0
+    while len(out) < size:
+        base = CORPUS[i % len(CORPUS)]
+        stem, ext = os.path.splitext(base)
+        out.append(f"{stem.replace('S02E01', f'S02E{i % 24 + 1:02d}')}{ext}")
+        i += 1
+    return out
+
+def timed(fn, names, repeat):
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        for n in names:
+            fn(n)
+    return len(names) * repeat / max(time.perf_counter() - t0, 1e-9)
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark subtitle language/flag classification.")
+    ap.add_argument("--size", type=int, default=2000, help="names in the corpus (default: %(default)s)")
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+    names = corpus(args.size)
+
+    for label, new, old in (
+        ("parse_lang_flags", sub_lang.parse_lang_flags, legacy_parse_lang_flags),
+        ("strip_lang_flags_only", sub_lang.strip_lang_flags_only, legacy_strip_lang_flags_only),
+    ):
+        bad = [n for n in names if new(n) != old(n)]
+        if bad:
+            raise SystemExit(f"{label}: differs from the old implementation for {bad[:3]}")
+        old_rate = timed(old, names, args.repeat)
+        new.cache_clear()
+        cold = timed(new.__wrapped__, names, args.repeat)
+        warm = timed(new, names, args.repeat)
+        print(f"{label:22} old {old_rate:10.0f}/s  new(cold) {cold:10.0f}/s x{cold / old_rate:5.1f}  "
+              f"new(warm) {warm:10.0f}/s x{warm / old_rate:6.1f}")
+
+if __name__ == "__main__":
+    main()
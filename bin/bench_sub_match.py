@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Benchmark: indexed sub_match.VideoIndex vs the old per-pair best_video_for loops.
+
+Builds synthetic release-style names (no files needed), checks that every pick and
+score is identical to the old implementation, and prints the speedup.
+
+  python3 bench_sub_match.py --subs 1000 --videos 200
+"""
+
+import argparse
+import os
+import random
+import re
+import time
+from difflib import SequenceMatcher
+
+import sub_match
+
+RES_TAGS = sub_match.RES_TAGS
+
+# ---------- old implementations (verbatim scoring) ----------
+
+def legacy_fix_best(sub_path, videos):
+    sbase = os.path.splitext(os.path.basename(sub_path))[0].lower()
+    best, bestscore = None, -1.0
+    s_norm = re.sub(r'\W+',' ', sbase)
+    for v in videos:
+        vbase = os.path.splitext(os.path.basename(v))[0].lower()
+        v_norm = re.sub(r'\W+',' ', vbase)
+        score = SequenceMatcher(None, s_norm, v_norm).ratio()
+        for t in RES_TAGS:
+            if t in sbase and t in vbase:
+                score += 0.2
+        score += min(len(vbase)/200.0, 0.4)
+        if score > bestscore:
+            best, bestscore = v, score
+    return best, bestscore
+
+def legacy_norm_for_score(s):
+    s = s.lower()
+    s = re.sub(r'[\[\(][^\]\)]*[\]\)]',' ', s)
+    for t in RES_TAGS:
+        s = re.sub(r'(?:^|[^a-z0-9])'+re.escape(t)+r'(?:[^a-z0-9]|$)',' ', s)
+    s = re.sub(r'[^a-z0-9]+',' ', s).strip()
+    return s
+
+def legacy_audit_best(sub, videos):
+    sbase = os.path.splitext(os.path.basename(sub))[0]
+    s_norm = legacy_norm_for_score(sbase)
+    best, bestscore = None, -1.0
+    for v in videos:
+        vbase = os.path.splitext(os.path.basename(v))[0]
+        v_norm = legacy_norm_for_score(vbase)
+        score = SequenceMatcher(None, s_norm, v_norm).ratio()
+        for t in RES_TAGS:
+            if t in sbase.lower() and t in vbase.lower():
+                score += 0.2
+        score += min(len(vbase)/200.0, 0.4)
+        if score>bestscore:
+            best, bestscore = v, score
+    return best, bestscore
+
+# ---------- synthetic names ----------
+
+WORDS = ["the", "night", "river", "stone", "city", "last", "king", "dark", "summer", "ghost",
+         "iron", "blue", "house", "road", "winter", "star", "red", "lost", "empire", "shadow"]
+GROUPS = ["RARBG", "YTS", "FLUX", "NTb", "SPARKS", "GECKOS", "AMIABLE"]
+LANGS = ["en", "eng", "English", "es", "spa", "Spanish", "fr", "pt-BR", ""]
+
+def synth_video(rng: random.Random, i: int) -> str:
+    title = ".".join(rng.choice(WORDS).capitalize() for _ in range(rng.randint(1, 4)))
+    tags = rng.sample(RES_TAGS, rng.randint(1, 4))
+    if rng.random() < 0.4:  # season-pack / extras style
+        title += f".S{rng.randint(1, 9):02d}E{i % 40 + 1:02d}"
+    name = f"{title}.{rng.randint(1970, 2024)}.{'.'.join(tags)}-{rng.choice(GROUPS)}"
+    return f"/lib/folder/{name}.{rng.choice(['mkv', 'mp4'])}"
+
+def synth_sub(rng: random.Random, videos) -> str:
+    base = os.path.splitext(os.path.basename(rng.choice(videos)))[0]
+    if rng.random() < 0.5:
+        base = re.sub(r"[.\-]", rng.choice([" ", "_", "."]), base)
+    if rng.random() < 0.3:
+        base = base.split("-")[0]
+    lang = rng.choice(LANGS)
+    flags = rng.choice(["", ".forced", ".sdh", ".hi"])
+    return f"/lib/folder/Subs/{base}{'.' + lang if lang else ''}{flags}.srt"
+
+def bench(fn, subs):
+    t0 = time.perf_counter()
+    out = [fn(s) for s in subs]
+    return out, time.perf_counter() - t0
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark indexed subtitle matching against the old pairwise loop.")
+    ap.add_argument("--subs", type=int, default=1000)
+    ap.add_argument("--videos", type=int, default=200)
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+
+    rng = random.Random(args.seed)
+    videos = [synth_video(rng, i) for i in range(args.videos)]
+    subs = [synth_sub(rng, videos) for _ in range(args.subs)]
+    print(f"synthetic folder: {len(subs)} subs x {len(videos)} videos")
+
+    for name, legacy, normalize, lower_len in (
+        ("fix_movie_subs", legacy_fix_best, sub_match.norm_loose, True),
+        ("audit_movie_subs", legacy_audit_best, sub_match.norm_for_score, False),
+    ):
+        old, t_old = bench(lambda s: legacy(s, videos), subs)
+        t0 = time.perf_counter()
+        index = sub_match.VideoIndex(videos, normalize, lower_len)
+        new, _ = bench(index.best, subs)
+        t_total = time.perf_counter() - t0  # includes building the index
+        mismatches = sum(1 for a, b in zip(old, new) if a != b)
+        print(f"{name:17} old {t_old:7.2f}s  new {t_total:7.2f}s  speedup x{t_old / max(t_total, 1e-9):5.1f}  "
+              f"mismatches={mismatches}")
+        if mismatches:
+            raise SystemExit(f"{name}: indexed matcher disagrees with the old scoring on {mismatches} subs")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+Minimal EBML (Matroska) layout reader.
+
+Works on an mmap (or any bytes-like buffer) and only touches element headers,
+so locating the header elements of a multi-GB MKV costs a few KB of reads.
+read_track_streams() decodes the Tracks element into the same dicts as
+media_probe.audio_streams() / subtitle_streams(), so tag_audio_lang.py can skip
+ffprobe for MKV.
+"""
+
+import mmap
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# element ids (with length marker, as written in the spec)
+EBML_HEADER = 0x1A45DFA3
+SEGMENT = 0x18538067
+SEEKHEAD = 0x114D9B74
+SEEK = 0x4DBB
+SEEK_ID = 0x53AB
+SEEK_POSITION = 0x53AC
+INFO = 0x1549A966
+TRACKS = 0x1654AE6B
+CLUSTER = 0x1F43B675
+VOID = 0xEC
+# Tracks children
+TRACK_ENTRY = 0xAE
+TRACK_TYPE = 0x83
+CODEC_ID = 0x86
+FLAG_DEFAULT = 0x88
+FLAG_FORCED = 0x55AA
+NAME = 0x536E
+LANGUAGE = 0x22B59C
+LANGUAGE_BCP47 = 0x22B59D
+AUDIO = 0xE1
+CHANNELS = 0x9F
+BIT_DEPTH = 0x6264
+CONTENT_ENCODINGS = 0x6D80
+CONTENT_ENCODING = 0x6240
+CONTENT_ENCRYPTION = 0x5035
+
+TRACK_VIDEO, TRACK_AUDIO, TRACK_SUBTITLE = 1, 2, 17
+
+# Matroska CodecID -> ffprobe codec_name (prefix match; PCM handled separately)
+AUDIO_CODECS = [
+    ("A_AAC", "aac"), ("A_AC3", "ac3"), ("A_EAC3", "eac3"), ("A_DTS", "dts"), ("A_TRUEHD", "truehd"),
+    ("A_MLP", "mlp"), ("A_FLAC", "flac"), ("A_OPUS", "opus"), ("A_VORBIS", "vorbis"), ("A_MPEG/L3", "mp3"),
+    ("A_MPEG/L2", "mp2"), ("A_MPEG/L1", "mp1"), ("A_ALAC", "alac"), ("A_TTA1", "tta"), ("A_WAVPACK4", "wavpack"),
+]
+DEFAULT_LAYOUTS = {1: "mono", 2: "stereo", 6: "5.1", 8: "7.1"}
+SUBTITLE_CODECS = {
+    "S_TEXT/UTF8": "subrip", "S_TEXT/ASCII": "text", "S_TEXT/ASS": "ass", "S_TEXT/SSA": "ass", "S_ASS": "ass",
+    "S_SSA": "ass", "S_TEXT/WEBVTT": "webvtt", "S_HDMV/PGS": "hdmv_pgs_subtitle", "S_VOBSUB": "dvd_subtitle",
+    "S_DVBSUB": "dvb_subtitle", "S_HDMV/TEXTST": "hdmv_text_subtitle", "S_ARIBSUB": "arib_caption",
+}
+
+class EBMLError(ValueError): pass
+
+class Unsupported(EBMLError):
+    """Valid file, but ffprobe's view of it may differ from ours; ask ffprobe."""
+
+@dataclass
+class Element:
+    id: int
+    offset: int        # absolute offset of the id
+    header_size: int   # id + size field
+    size: Optional[int]  # None = unknown size
+
+    @property
+    def data_offset(self) -> int:
+        return self.offset + self.header_size
+
+    @property
+    def end(self) -> int:
+        if self.size is None:
+            raise EBMLError(f"element 0x{self.id:X} at {self.offset} has unknown size")
+        return self.data_offset + self.size
+
+def read_vint(buf, pos: int, keep_marker: bool = False) -> Tuple[int, int]:
+    """Variable-length integer at pos -> (value, length). Unknown sizes come back as -1."""
+    if pos >= len(buf):
+        raise EBMLError(f"read past end of buffer at {pos}")
+    first = buf[pos]
+    if first == 0:
+        raise EBMLError(f"invalid vint at {pos}")
+    length = 9 - first.bit_length()
+    if pos + length > len(buf):
+        raise EBMLError(f"truncated vint at {pos}")
+    value = first if keep_marker else first & ((1 << (8 - length)) - 1)
+    for b in buf[pos + 1:pos + length]:
+        value = (value << 8) | b
+    if not keep_marker and value == (1 << (7 * length)) - 1:
+        return -1, length
+    return value, length
+
+def read_element(buf, pos: int) -> Element:
+    eid, id_len = read_vint(buf, pos, keep_marker=True)
+    if id_len > 4:
+        raise EBMLError(f"invalid element id at {pos}")
+    size, size_len = read_vint(buf, pos + id_len)
+    return Element(eid, pos, id_len + size_len, None if size < 0 else size)
+
+def iter_children(buf, start: int, end: int) -> Iterator[Element]:
+    pos = start
+    while pos < end:
+        el = read_element(buf, pos)
+        yield el
+        if el.size is None:
+            return
+        pos = el.end
+
+def read_uint(buf, el: Element) -> int:
+    return int.from_bytes(buf[el.data_offset:el.end], "big")
+
+def open_segment(buf) -> Element:
+    """Validate the EBML header and return the (first) Segment element."""
+    head = read_element(buf, 0)
+    if head.id != EBML_HEADER:
+        raise EBMLError("not an EBML file")
+    seg = read_element(buf, head.end)
+    if seg.id != SEGMENT:
+        raise EBMLError("no Segment after EBML header")
+    return seg
+
+def segment_end(buf, seg: Element) -> int:
+    return len(buf) if seg.size is None else min(seg.end, len(buf))
+
+def seek_entries(buf, seek_head: Element) -> List[Tuple[int, int]]:
+    """SeekHead -> [(element id, position relative to segment data)]."""
+    out = []
+    for seek in iter_children(buf, seek_head.data_offset, seek_head.end):
+        if seek.id != SEEK:
+            continue
+        sid = spos = None
+        for ch in iter_children(buf, seek.data_offset, seek.end):
+            if ch.id == SEEK_ID:
+                sid = read_uint(buf, ch)
+            elif ch.id == SEEK_POSITION:
+                spos = read_uint(buf, ch)
+        if sid is not None and spos is not None:
+            out.append((sid, spos))
+    return out
+
+def header_layout(buf) -> Tuple[Element, List[Element], Dict[int, List[Element]]]:
+    """
+    Top-level Segment children before the first Cluster, plus any SeekHead/Info/Tracks
+    elements that SeekHead places after it (without walking the Clusters).
+    Returns (segment, leading children, {id: [elements found via SeekHead]}).
+    """
+    seg = open_segment(buf)
+    end = segment_end(buf, seg)
+    leading: List[Element] = []
+    for el in iter_children(buf, seg.data_offset, end):
+        if el.id == CLUSTER:
+            break
+        leading.append(el)
+    seen = {el.offset for el in leading}
+    sought: Dict[int, List[Element]] = {}
+    pending = [el for el in leading if el.id == SEEKHEAD]
+    while pending:
+        for sid, rel in seek_entries(buf, pending.pop()):
+            pos = seg.data_offset + rel
+            if sid not in (SEEKHEAD, INFO, TRACKS) or pos in seen or pos >= end:
+                continue
+            el = read_element(buf, pos)
+            if el.id != sid:
+                raise EBMLError(f"SeekHead points at 0x{el.id:X}, expected 0x{sid:X}")
+            seen.add(pos)
+            sought.setdefault(sid, []).append(el)
+            if sid == SEEKHEAD:
+                pending.append(el)
+    return seg, leading, sought
+
+# ---------- Tracks ----------
+
+def read_string(buf, el: Element) -> str:
+    return bytes(buf[el.data_offset:el.end]).rstrip(b"\0").decode("utf-8", "replace")
+
+def find_tracks(buf) -> Element:
+    _, leading, sought = header_layout(buf)
+    for el in leading + sought.get(TRACKS, []):
+        if el.id == TRACKS:
+            return el
+    raise EBMLError("no Tracks element before the first Cluster or in SeekHead")
+
+def _track_fields(buf, entry: Element) -> Dict:
+    # spec defaults, as ffmpeg's matroska demuxer applies them
+    t = {"type": None, "codec_id": None, "default": True, "forced": False, "name": "", "language": "eng",
+         "bcp47": None, "channels": 1, "bit_depth": None, "encrypted": False}
+    for el in iter_children(buf, entry.data_offset, entry.end):
+        if el.id == TRACK_TYPE:
+            t["type"] = read_uint(buf, el)
+        elif el.id == CODEC_ID:
+            t["codec_id"] = read_string(buf, el)
+        elif el.id == FLAG_DEFAULT:
+            t["default"] = bool(read_uint(buf, el))
+        elif el.id == FLAG_FORCED:
+            t["forced"] = bool(read_uint(buf, el))
+        elif el.id == NAME:
+            t["name"] = read_string(buf, el)
+        elif el.id == LANGUAGE:
+            t["language"] = read_string(buf, el)
+        elif el.id == LANGUAGE_BCP47:
+            t["bcp47"] = read_string(buf, el)
+        elif el.id == AUDIO:
+            for a in iter_children(buf, el.data_offset, el.end):
+                if a.id == CHANNELS:
+                    t["channels"] = read_uint(buf, a)
+                elif a.id == BIT_DEPTH:
+                    t["bit_depth"] = read_uint(buf, a)
+        elif el.id == CONTENT_ENCODINGS:
+            for enc in iter_children(buf, el.data_offset, el.end):
+                if enc.id == CONTENT_ENCODING and any(
+                        c.id == CONTENT_ENCRYPTION for c in iter_children(buf, enc.data_offset, enc.end)):
+                    t["encrypted"] = True
+    return t
+
+def audio_codec_name(codec_id: str, bit_depth: Optional[int]) -> str:
+    if codec_id.startswith("A_PCM/"):
+        depth = bit_depth or 16
+        if codec_id == "A_PCM/FLOAT/IEEE":
+            return f"pcm_f{depth}le"
+        if depth == 8:
+            return "pcm_u8"
+        return f"pcm_s{depth}{'be' if codec_id == 'A_PCM/INT/BIG' else 'le'}"
+    for prefix, name in AUDIO_CODECS:
+        if codec_id.startswith(prefix):
+            return name
+    raise Unsupported(f"audio codec {codec_id!r} not mapped")
+
+def track_streams(buf) -> Tuple[List[Dict], List[Dict]]:
+    """
+    (audio, subtitle) tracks as media_probe.audio_streams() / subtitle_streams() dicts,
+    ff_index = TrackEntry order (ffprobe's stream index). Raises Unsupported for anything
+    that could shift that order or change ffprobe's answer: track types ffmpeg skips, a
+    missing CodecID, encryption, BCP47-only languages, unmapped codecs. layout is the
+    default layout for the channel count (ffprobe reports the decoder's, e.g. "5.1(side)").
+    """
+    tracks = find_tracks(buf)
+    audio, subs = [], []
+    for index, entry in enumerate(e for e in iter_children(buf, tracks.data_offset, tracks.end) if e.id == TRACK_ENTRY):
+        t = _track_fields(buf, entry)
+        if t["type"] not in (TRACK_VIDEO, TRACK_AUDIO, TRACK_SUBTITLE) or not t["codec_id"]:
+            raise Unsupported(f"track {index}: type {t['type']} / codec {t['codec_id']!r}")
+        if t["encrypted"]:
+            raise Unsupported(f"track {index} is encrypted")
+        if t["type"] == TRACK_VIDEO:
+            continue
+        if t["bcp47"] and t["language"] == "eng" and t["bcp47"].split("-")[0] not in ("en", "eng"):
+            raise Unsupported(f"track {index}: BCP47 language {t['bcp47']!r} without a matching Language")
+        common = {"language": t["language"] or "und", "title": t["name"], "default": t["default"], "forced": t["forced"]}
+        if t["type"] == TRACK_AUDIO:
+            audio.append({
+                "ff_index": index,
+                "codec": audio_codec_name(t["codec_id"], t["bit_depth"]),
+                "channels": t["channels"],
+                "layout": DEFAULT_LAYOUTS.get(t["channels"]),
+                **common,
+            })
+        else:
+            if t["codec_id"] not in SUBTITLE_CODECS:
+                raise Unsupported(f"subtitle codec {t['codec_id']!r} not mapped")
+            subs.append({"ff_index": index, "codec": SUBTITLE_CODECS[t["codec_id"]], **common})
+    return audio, subs
+
+def audio_streams(buf) -> List[Dict]:
+    """Audio tracks only; see track_streams()."""
+    return track_streams(buf)[0]
+
+def read_track_streams(path: Path) -> Tuple[List[Dict], List[Dict]]:
+    """track_streams() of an MKV file through a read-only mapping (only the header pages are read)."""
+    with Path(path).open("rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return track_streams(mm)
+
+def read_audio_streams(path: Path) -> List[Dict]:
+    return read_track_streams(path)[0]
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+ffmpeg stream-copy remux runner with live progress, used by tag_audio_lang.py for MP4.
+
+- stdout (-progress key=value blocks) and stderr are drained concurrently, so a chatty
+  ffmpeg can never block on a full pipe; only the last STDERR_TAIL lines are kept
+- progress callbacks are throttled by time (RemuxOptions.redraw_interval), not per line
+- -fflags +genpts and -max_muxing_queue_size are tunables (RemuxOptions)
+- the output is fsync'd before returning, so the caller's replace() never exposes a
+  file whose data is still only in the page cache
+- returns bytes written, wall time and achieved MB/s (compare USB vs SSD targets)
+- optional pacing: pace(bytes since last block) -> seconds; ffmpeg is stopped
+  (SIGSTOP) for that long, which is how io_sched.py caps its write rate
+"""
+
+import os
+import shutil
+import signal
+import subprocess
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, List, Optional
+
+STDERR_TAIL = 50
+STATS_PERIOD_S = 0.5  # how often ffmpeg emits a -progress block
+
+@dataclass
+class RemuxOptions:
+    genpts: bool = False                        # -fflags +genpts: regenerate missing PTS (old AVI/TS sources)
+    max_muxing_queue_size: Optional[int] = None  # raise for "Too many packets buffered for output stream"
+    redraw_interval: float = 0.25               # seconds between progress callbacks
+    fsync: bool = True
+
+@dataclass
+class RemuxResult:
+    bytes_out: int
+    seconds: float
+
+    @property
+    def mb_per_s(self) -> float:
+        return self.bytes_out / (1024 * 1024) / max(self.seconds, 1e-6)
+
+# progress(fraction 0..1 or None when the duration is unknown, bytes written so far, MB/s so far)
+ProgressFn = Callable[[Optional[float], int, float], None]
+# pace(bytes written since the last call) -> seconds ffmpeg must pause
+PaceFn = Callable[[int], float]
+
+def build_cmd(ffmpeg: str, src: Path, dst: Path, args: List[str], opts: RemuxOptions) -> List[str]:
+    cmd = [ffmpeg, "-y", "-nostats", "-loglevel", "error",
+           "-progress", "pipe:1", "-stats_period", str(STATS_PERIOD_S)]
+    if opts.genpts:
+        cmd += ["-fflags", "+genpts"]
+    cmd += ["-i", str(src)] + args
+    if opts.max_muxing_queue_size:
+        cmd += ["-max_muxing_queue_size", str(opts.max_muxing_queue_size)]
+    return cmd + [str(dst)]
+
+def _drain(stream, sink: deque):
+    for line in iter(stream.readline, b""):
+        sink.append(line.decode("utf-8", "replace").rstrip())
+    stream.close()
+
+def remux(src: Path, dst: Path, args: List[str], duration_s: Optional[float],
+          opts: Optional[RemuxOptions] = None, progress: Optional[ProgressFn] = None,
+          ffmpeg: Optional[str] = None, pace: Optional[PaceFn] = None) -> RemuxResult:
+    """
+    Run one ffmpeg remux of src into dst (a temp path next to the final file).
+    args: mapping/codec/disposition/metadata options, without -i, -progress or the output.
+    Raises RuntimeError with ffmpeg's last stderr lines on failure; dst is removed then.
+    """
+    opts = opts or RemuxOptions()
+    ffmpeg = ffmpeg or shutil.which("ffmpeg") or "ffmpeg"
+    cmd = build_cmd(ffmpeg, src, dst, args, opts)
+    start = time.monotonic()
+    proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    err_tail: deque = deque(maxlen=STDERR_TAIL)
+    err_thread = threading.Thread(target=_drain, args=(proc.stderr, err_tail), daemon=True)
+    err_thread.start()
+    total_us = duration_s * 1_000_000.0 if duration_s and duration_s > 0 else None
+    out_us, size, last_draw, paced = 0, 0, 0.0, 0
+    try:
+        for raw in iter(proc.stdout.readline, b""):
+            key, _, value = raw.decode("ascii", "replace").strip().partition("=")
+            if key in ("out_time_us", "out_time_ms"):  # both are microseconds
+                out_us = int(value) if value.isdigit() else out_us
+            elif key == "total_size":
+                size = int(value) if value.isdigit() else size
+            elif key == "progress" and pace is not None and size > paced:
+                wait = pace(size - paced)
+                paced = size
+                if wait > 0 and value != "end":
+                    proc.send_signal(signal.SIGSTOP)
+                    try:
+                        time.sleep(wait)
+                    finally:
+                        proc.send_signal(signal.SIGCONT)
+            if key == "progress" and progress is not None:
+                now = time.monotonic()
+                if value == "end" or now - last_draw >= opts.redraw_interval:
+                    last_draw = now
+                    frac = 1.0 if value == "end" else (min(out_us / total_us, 1.0) if total_us else None)
+                    progress(frac, size, size / (1024 * 1024) / max(now - start, 1e-6))
+        proc.wait()
+    except BaseException:
+        proc.kill()
+        proc.wait()
+        dst.unlink(missing_ok=True)
+        raise
+    finally:
+        proc.stdout.close()
+        err_thread.join(timeout=5)
+    if proc.returncode != 0:
+        dst.unlink(missing_ok=True)
+        tail = "\n".join(err_tail)
+        raise RuntimeError(f"ffmpeg failed with code {proc.returncode}. {tail}")
+    if opts.fsync:
+        with dst.open("rb") as f:
+            os.fsync(f.fileno())
+    return RemuxResult(bytes_out=dst.stat().st_size, seconds=time.monotonic() - start)
+
+def fsync_dir(path: Path):
+    """Make a rename inside `path` durable."""
+    fd = os.open(str(path), os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
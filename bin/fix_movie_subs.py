@@ -1,87 +1,71 @@
 #!/usr/bin/env python3
-import os, re, sys, shutil
-from difflib import SequenceMatcher
+import os, shutil, time, argparse
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+import media_fingerprint
+import media_metrics
+from library_scan import iter_libraries
+from sub_detect import detect_file
+from sub_lang import parse_lang_flags
+from sub_match import VideoIndex, norm_loose
 
 # -------- CONFIG --------
 ROOT = "/srv/media/movies"
+TV_ROOT = "/srv/media/tv"   # Show/Season NN/ layout; subs matched to episodes by SxxEyy / 1x02 / absolute number
 DEFAULT_LANG = "en"   # change to "es" if you want default Spanish instead
-VIDEO_EXTS = {'.mkv', '.mp4', '.m4v', '.avi', '.mov'}
-
-# Canonicalize common language tokens -> ISO code
-LANG_MAP = {
-  'en':'en','eng':'en','english':'en',
-  'es':'es','spa':'es','spanish':'es','es-419':'es','es-es':'es',
-  'pt':'pt','por':'pt','pt-br':'pt','ptbr':'pt',
-  'fr':'fr','fra':'fr','french':'fr',
-  'it':'it','ita':'it',
-  'de':'de','deu':'de','ger':'de',
-  'ru':'ru','rus':'ru',
-  'zh':'zh','chi':'zh','chs':'zh','cht':'zh',
-  'ja':'ja','jpn':'ja',
-  'ko':'ko','kor':'ko'
-}
-# Tokens that often appear in releases; used to improve matching
-RES_TAGS = ['2160p','1080p','720p','480p','x265','hevc','x264','h264','remux','bluray','web','webrip','web-dl','dvdrip','hdr','hdr10','dv','atmos','dts','aac']
-
-def best_video_for(sub_path, videos):
-    """Pick best matching video by name similarity and token overlap."""
-    sbase = os.path.splitext(os.path.basename(sub_path))[0].lower()
-    best, bestscore = None, -1.0
-    s_norm = re.sub(r'\W+',' ', sbase)
-    for v in videos:
-        vbase = os.path.splitext(os.path.basename(v))[0].lower()
-        v_norm = re.sub(r'\W+',' ', vbase)
-        score = SequenceMatcher(None, s_norm, v_norm).ratio()
-        for t in RES_TAGS:
-            if t in sbase and t in vbase:
-                score += 0.2
-        # prefer longer video names a bit (often the main cut)
-        score += min(len(vbase)/200.0, 0.4)
-        if score > bestscore:
-            best, bestscore = v, score
-    return best
-
-def parse_lang_flags(name):
-    n = name.lower()
-    # detect language tokens; keep what exists; normalize to ISO if possible
-    m = re.search(r'(en|eng|english|es|spa|spanish|fr|fra|french|pt|por|pt-?br|it|ita|de|deu|ger|ru|rus|zh|chi|chs|cht|ja|jpn|ko|kor)(?!.*[a-z])', n)
-    lang = None
-    if m:
-        lang = LANG_MAP.get(m.group(1).replace('-',''), None)
-    if not lang:
-        # look anywhere as a fallback
-        for k in LANG_MAP:
-            if re.search(r'(?:^|[^a-z0-9])'+re.escape(k)+r'(?:[^a-z0-9]|$)', n):
-                lang = LANG_MAP[k]; break
-    forced = bool(re.search(r'(?:^|[^a-z0-9])(forced|forcedsub)(?:[^a-z0-9]|$)', n))
-    hi = bool(re.search(r'(?:^|[^a-z0-9])(sdh|hi|hearing)(?:[^a-z0-9]|$)', n))
-    return lang, forced, hi
-
-def ensure_dir(p): os.makedirs(p, exist_ok=True)
-
-APPLY = '--apply' in sys.argv
-changed = moved = skipped = 0
-
-# Process each movie folder
-for movie_dir in sorted([os.path.join(ROOT, d) for d in os.listdir(ROOT) if os.path.isdir(os.path.join(ROOT, d))]):
-    # videos: only top-level files inside the movie folder (Radarr layout)
-    videos = [os.path.join(movie_dir, f) for f in os.listdir(movie_dir)
-              if os.path.splitext(f)[1].lower() in VIDEO_EXTS]
-    if not videos:
-        continue
+SCAN_JOBS = 1         # >1 scans movie folders in parallel (helps on high-latency network mounts)
+APPLY_JOBS = 4        # folders renamed in parallel with --apply (each folder stays in order)
+FINGERPRINTS = True   # content fingerprints pick the main video / spot duplicate subs (--no-fingerprints: names only)
 
-    # collect .srt in the folder and up to 2 levels below (Subs/, Subtitles/, etc.)
-    subs = []
-    for root, dirs, files in os.walk(movie_dir):
-        depth = root[len(movie_dir):].count(os.sep)
-        if depth > 2:
-            continue
-        for f in files:
-            if f.lower().endswith('.srt'):
-                subs.append(os.path.join(root, f))
 
-    for s in subs:
-        v = best_video_for(s, videos)
+def alt_name(new, occupied):
+    """First free name.altN.srt for `new` against the planned folder contents."""
+    final, n = new, 1
+    while final in occupied:
+        name, ext = os.path.splitext(new)
+        final = f"{name}.alt{n}{ext}"
+        n += 1
+    return final
+
+def detect_lang(sub):
+    try:
+        found = detect_file(sub)
+    except OSError as e:
+        print(f"[WARN] Cannot read {sub}: {e}")
+        return None
+    if found:
+        print(f"[DETECT] {found[0]} ({found[1]:.2f}) {sub}")
+        return found[0]
+    print(f"[DETECT] inconclusive, using {DEFAULT_LANG}: {sub}")
+    return None
+
+def plan_folder(folder, detect_content=False):
+    with media_metrics.phase("match"):
+        return _plan_folder(folder, detect_content)
+
+def _plan_folder(folder, detect_content):
+    """
+    Phase one: (src, dst) renames for one folder, decided in memory. `occupied` tracks
+    what the folder will contain as each planned rename lands, so two subs both aiming
+    at Movie.en.srt get .alt1/.alt2 here instead of on disk, and the dry-run shows
+    exactly what --apply will do.
+    """
+    ops, skipped = [], 0
+    videos = folder.videos
+    if not videos:
+        return ops, skipped
+    main = None
+    if FINGERPRINTS:
+        # byte-identical copies of a video are matched as one (the original)
+        videos, copies, main = media_fingerprint.match_candidates(videos, folder.tv)
+        for v in copies:
+            print(f"[DUP] Video is a copy, not matched: {v}")
+    index = VideoIndex(videos, norm_loose, episode_keys=folder.tv, main=main)
+    occupied = set(videos) | {s for s in folder.subs if os.path.dirname(s) == folder.path}
+    source = {s: s for s in occupied}  # planned name -> the file that will hold it
+
+    for s in folder.subs:
+        v, _ = index.best(s)
         if not v:
             skipped += 1
             print(f"[SKIP] No video match for: {s}")
@@ -90,47 +74,125 @@ for movie_dir in sorted([os.path.join(ROOT, d) for d in os.listdir(ROOT) if os.p
         base = os.path.splitext(v)[0]
         lang, forced, hi = parse_lang_flags(os.path.basename(s))
 
-        # If no language tag present, default to DEFAULT_LANG (e.g., 'en')
+        # No language tag: optionally guess from the subtitle text, else DEFAULT_LANG (e.g., 'en')
+        if not lang and detect_content:
+            lang = detect_lang(s)
         if not lang:
             lang = DEFAULT_LANG
 
         new = f"{base}.{lang}{'.forced' if forced else ''}{'.hi' if hi else ''}.srt"
+        if os.path.abspath(s) == os.path.abspath(new):
+            continue
+        if FINGERPRINTS and new in occupied and media_fingerprint.same_content(s, source[new]):
+            # an identical copy of the sub already there/planned there: no .altN duplicate
+            skipped += 1
+            print(f"[SKIP] Duplicate of {source[new]}: {s}")
+            continue
+        # subs in subfolders go straight up next to the video under their final name
+        occupied.discard(s)
+        final = alt_name(new, occupied)
+        occupied.add(final)
+        source[final] = s
+        if final == s:
+            continue  # already at its free .altN name (e.g. from an earlier run)
+        ops.append((s, final))
+    return ops, skipped
+
+def describe(src, dst):
+    if os.path.dirname(src) == os.path.dirname(dst):
+        return "RENAME"
+    return "MOVE" if os.path.basename(src) == os.path.basename(dst) else "MOVE+RENAME"
+
+def count_op(result):
+    """One files_total sample per op: rename / move / move_rename / failed."""
+    media_metrics.inc("files_total", result=result.lower().replace("+", "_"))
+
+def apply_folder(ops):
+    """Phase two: run one folder's renames in plan order (later ones may reuse freed names)."""
+    with media_metrics.phase("rename"):
+        return _apply_folder(ops)
+
+def _apply_folder(ops):
+    changed = moved = failed = 0
+    for src, dst in ops:
+        kind = describe(src, dst)
+        if os.path.exists(dst):
+            # the folder changed since planning; never overwrite
+            print(f"[SKIP] {kind} target exists {src} -> {dst}")
+            count_op("failed")
+            failed += 1
+            continue
+        try:
+            shutil.move(src, dst)
+        except Exception as e:
+            print(f"[SKIP] {kind} failed {src}: {e}")
+            count_op("failed")
+            failed += 1
+            continue
+        print(f"[{kind}] {src} -> {dst}")
+        count_op(kind)
+        if kind != "RENAME":
+            moved += 1
+        if kind != "MOVE":
+            changed += 1
+    return changed, moved, failed
+
+def main(argv=None):
+    """Plan and (with --apply) run the renames; returns the summary counts."""
+    ap = argparse.ArgumentParser(description="Rename/move movie and TV subtitles next to their video as <video>.<lang>[.forced][.hi].srt.")
+    ap.add_argument("--root", action="append", help="movie library root, one folder per movie; repeatable")
+    ap.add_argument("--tv-root", action="append", help="TV library root, Show/Season NN/ folders; repeatable "
+                                                       "(default without either option: %s and %s)" % (ROOT, TV_ROOT))
+    ap.add_argument("--apply", action="store_true", help="do the renames (default: dry-run)")
+    ap.add_argument("--detect-content", action="store_true",
+                    help="untagged subs: read the text before falling back to DEFAULT_LANG")
+    ap.add_argument("--fingerprint-index", default=str(media_fingerprint.DEFAULT_INDEX_PATH),
+                    help="SQLite content fingerprint index (default: %(default)s)")
+    ap.add_argument("--no-fingerprints", action="store_true",
+                    help="pick the main video by name length and keep identical subs as .altN (old behaviour)")
+    args = ap.parse_args(argv)
+    global FINGERPRINTS
+    FINGERPRINTS = not args.no_fingerprints
+    if FINGERPRINTS:
+        media_fingerprint.configure_index(Path(args.fingerprint_index))
+    media_metrics.serve_from_env()
+    roots = [(r, False) for r in args.root or []] + [(r, True) for r in args.tv_root or []]
+
+    # Phase one: plan the whole library
+    # videos: only top-level files inside the movie folder (Radarr layout)
+    # subs: .srt in the folder and up to 2 levels below (Subs/, Subtitles/, etc.)
+    # TV: every season (any folder with videos) is planned on its own
+    plans = []
+    skipped = 0
+    for folder in iter_libraries(roots or [(ROOT, False), (TV_ROOT, True)], jobs=SCAN_JOBS):
+        ops, n = plan_folder(folder, args.detect_content)
+        skipped += n
+        if ops:
+            plans.append(ops)
+
+    changed = moved = failed = 0
+    nops = sum(len(ops) for ops in plans)
+    if args.apply:
+        # Phase two: folders in parallel, each folder's renames in order
+        start = time.time()
+        with ThreadPoolExecutor(max_workers=APPLY_JOBS) as pool:
+            for c, m, f in pool.map(apply_folder, plans):
+                changed += c; moved += m; failed += f
+        elapsed = max(time.time() - start, 0.001)
+        print(f"\nApplied {nops} ops in {len(plans)} folders in {elapsed:.2f}s ({nops/elapsed:.1f} ops/s)")
+    else:
+        for ops in plans:
+            for src, dst in ops:
+                kind = describe(src, dst)
+                print(f"[DRY] {kind} {src} -> {dst}")
+                count_op(kind)
+                if kind != "RENAME": moved += 1
+                if kind != "MOVE": changed += 1
+
+    print(f"\nSummary: changed={changed}, moved={moved}, skipped={skipped}, failed={failed}, mode={'APPLY' if args.apply else 'DRY-RUN'}")
+    media_metrics.inc("files_total", skipped, result="skipped")
+    media_metrics.finish(files=nops + skipped, success=not failed)
+    return {"changed": changed, "moved": moved, "skipped": skipped, "failed": failed}
 
-        # Move from subfolders up next to the video first
-        if os.path.dirname(s) != os.path.dirname(v):
-            target_dir = os.path.dirname(v)
-            ensure_dir(target_dir)
-            s_target = os.path.join(target_dir, os.path.basename(s))
-            if APPLY:
-                if os.path.abspath(s) != os.path.abspath(s_target):
-                    try:
-                        shutil.move(s, s_target)
-                        print(f"[MOVE] {s} -> {s_target}")
-                        moved += 1
-                        s = s_target
-                    except Exception as e:
-                        print(f"[SKIP] Move failed {s}: {e}")
-                        continue
-            else:
-                print(f"[DRY] Move up: {s} -> {s_target}")
-                s = s_target
-
-        # Rename if needed
-        if os.path.abspath(s) != os.path.abspath(new):
-            if APPLY:
-                final = new
-                n = 1
-                while os.path.exists(final):
-                    name, ext = os.path.splitext(new)
-                    final = f"{name}.alt{n}{ext}"
-                    n += 1
-                try:
-                    os.rename(s, final)
-                    print(f"[RENAME] {s} -> {final}")
-                    changed += 1
-                except Exception as e:
-                    print(f"[SKIP] Rename failed {s}: {e}")
-            else:
-                print(f"[DRY] Rename: {s} -> {new}")
-
-print(f"\nSummary: changed={changed}, moved={moved}, skipped={skipped}, mode={'APPLY' if APPLY else 'DRY-RUN'}")
+if __name__ == "__main__":
+    main()
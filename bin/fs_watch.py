@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Filesystem change feed for media_watch.py: inotify through ctypes (no extra packages),
+with a polling fallback.
+
+- InotifyWatcher: recursive watches, new directories picked up as they appear;
+  reports paths on close_write / moved_to / create / delete
+- PollingWatcher: stat() snapshot of the roots every `interval` seconds, reports
+  paths whose (size, mtime) changed; used when inotify is unavailable or out of
+  watches (fs.inotify.max_user_watches), and on network mounts where inotify is blind
+- open_watcher(): inotify if possible, else polling
+Both return plain paths from read(timeout); debouncing is the caller's job.
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import time
+from typing import Dict, List, Tuple
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_ONLYDIR
+_EVENT = struct.Struct("iIII")  # wd, mask, cookie, len (name follows, NUL padded)
+
+class WatchUnavailable(OSError): pass
+
+class InotifyWatcher:
+    def __init__(self, roots: List[str]):
+        libc_name = ctypes.util.find_library("c")
+        if not libc_name:
+            raise WatchUnavailable("libc not found")
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self._libc, "inotify_init1"):
+            raise WatchUnavailable("inotify not supported by libc")
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise WatchUnavailable(ctypes.get_errno(), "inotify_init1 failed")
+        self.wds: Dict[int, str] = {}
+        self.overflowed = False
+        try:
+            for root in roots:
+                self.add_tree(root)
+        except OSError:
+            self.close()
+            raise
+
+    def _add(self, path: str):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err == errno.ENOSPC:
+                raise WatchUnavailable(err, "out of inotify watches (raise fs.inotify.max_user_watches)")
+            if err not in (errno.ENOENT, errno.ENOTDIR):  # vanished in the meantime
+                raise OSError(err, f"inotify_add_watch failed for {path}")
+            return
+        self.wds[wd] = path
+
+    def add_tree(self, top: str):
+        for dirpath, _, _ in os.walk(top):
+            self._add(dirpath)
+
+    def read(self, timeout: float) -> List[str]:
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            buf = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        paths, pos = [], 0
+        while pos + _EVENT.size <= len(buf):
+            wd, mask, _cookie, length = _EVENT.unpack_from(buf, pos)
+            name = buf[pos + _EVENT.size:pos + _EVENT.size + length].rstrip(b"\0")
+            pos += _EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                self.overflowed = True
+                continue
+            base = self.wds.get(wd)
+            if mask & IN_IGNORED:
+                self.wds.pop(wd, None)
+                continue
+            if base is None:
+                continue
+            path = os.path.join(base, os.fsdecode(name)) if name else base
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                self.add_tree(path)  # a moved-in tree brings files no event will mention
+            paths.append(path)
+        return paths
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+class PollingWatcher:
+    def __init__(self, roots: List[str], interval: float = 60.0):
+        self.roots = roots
+        self.interval = interval
+        self.overflowed = False
+        self._snap = self._snapshot()
+        self._next = time.monotonic() + interval
+
+    def _snapshot(self) -> Dict[str, Tuple[int, int]]:
+        snap = {}
+        for root in self.roots:
+            for dirpath, _, files in os.walk(root):
+                for name in files:
+                    p = os.path.join(dirpath, name)
+                    try:
+                        st = os.stat(p)
+                    except OSError:
+                        continue
+                    snap[p] = (st.st_size, st.st_mtime_ns)
+        return snap
+
+    def read(self, timeout: float) -> List[str]:
+        wait = self._next - time.monotonic()
+        if wait > 0:
+            time.sleep(min(wait, timeout))
+            if time.monotonic() < self._next:
+                return []
+        snap = self._snapshot()
+        self._next = time.monotonic() + self.interval
+        changed = [p for p, v in snap.items() if self._snap.get(p) != v]
+        changed += [p for p in self._snap if p not in snap]
+        self._snap = snap
+        return changed
+
+    def close(self):
+        pass
+
+def open_watcher(roots: List[str], poll: bool = False, interval: float = 60.0):
+    if not poll:
+        try:
+            return InotifyWatcher(roots)
+        except OSError as e:
+            print(f"WARN: inotify unavailable ({e}); polling every {interval:g}s", file=sys.stderr)
+    return PollingWatcher(roots, interval)
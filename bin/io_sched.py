@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Device-aware scheduling for heavy file operations (backup copies, MP4 remuxes).
+
+- work is keyed by st_dev: at most `per_device` heavy operations hold a slot on one
+  device at a time; other devices (SSD cache vs USB media disk) are not held back
+- optional token bucket per device caps the rate (--max-io-rate MB/s), leaving
+  bandwidth for Plex/Jellyfin streaming from the same disk; copies sleep between
+  chunks, ffmpeg is paused (SIGSTOP/SIGCONT) when it runs ahead of the budget
+- optional idle I/O class (ioprio_set, like `ionice -c3`) for the thread holding a
+  slot and any ffmpeg it starts; honoured by the BFQ (and old CFQ) elevators only
+- DevicePool: one small executor per device, so queued files on different disks
+  are worked on in parallel while each disk sees at most `per_device` of them
+`scheduler` is the process-wide instance; CLIs call configure() once at startup.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import platform
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterator, Optional
+
+MB = 1024 * 1024
+THROTTLED_CHUNK = 4 * MB  # copy chunk while a rate cap is set (smoother pacing)
+
+IOPRIO_WHO_PROCESS = 1
+IOPRIO_CLASS_IDLE = 3
+IOPRIO_CLASS_SHIFT = 13
+# (ioprio_set, ioprio_get) syscall numbers
+IOPRIO_SYSCALLS = {"x86_64": (251, 252), "aarch64": (30, 31), "armv7l": (314, 315), "i686": (289, 290)}
+
+class Cancelled(Exception):
+    """Raised inside heavy operations once their DevicePool is shut down with cancel=True."""
+
+class TokenBucket:
+    """rate bytes/s with `burst` bytes of credit; reserve() returns how long the caller must wait."""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst or rate
+        self.tokens = self.burst
+        self.stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, n: int) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+            self.tokens -= n  # may go negative: the debt is the wait
+            return max(-self.tokens / self.rate, 0.0)
+
+    def consume(self, n: int):
+        wait = self.reserve(n)
+        if wait > 0:
+            time.sleep(wait)
+
+class Device:
+    def __init__(self, dev: int, per_device: int, rate: Optional[float], cancelled: threading.Event):
+        self.dev = dev
+        self.slots = threading.BoundedSemaphore(per_device)
+        self.bucket = TokenBucket(rate) if rate else None
+        self.cancelled = cancelled
+
+    def throttle(self, n: int):
+        """Account n bytes; sleeps while over the rate cap."""
+        if self.cancelled.is_set():
+            raise Cancelled("cancelled")
+        if self.bucket is not None:
+            self.bucket.consume(n)
+
+    def pace(self, n: int) -> float:
+        """Account n bytes done by someone else (ffmpeg); seconds it should pause."""
+        if self.cancelled.is_set():
+            raise Cancelled("cancelled")
+        return self.bucket.reserve(n) if self.bucket is not None else 0.0
+
+# ---------- ioprio ----------
+
+_ioprio_calls = None
+
+def _ioprio_syscalls():
+    global _ioprio_calls
+    if _ioprio_calls is None:
+        nums = IOPRIO_SYSCALLS.get(platform.machine())
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True) if nums else None
+        _ioprio_calls = (libc, nums)
+    return _ioprio_calls
+
+def get_ioprio() -> Optional[int]:
+    libc, nums = _ioprio_syscalls()
+    if libc is None:
+        return None
+    value = libc.syscall(nums[1], IOPRIO_WHO_PROCESS, 0)
+    return value if value >= 0 else None
+
+def set_ioprio(value: int) -> bool:
+    """Set the calling thread's I/O priority (children it forks inherit it)."""
+    libc, nums = _ioprio_syscalls()
+    return libc is not None and libc.syscall(nums[0], IOPRIO_WHO_PROCESS, 0, value) == 0
+
+# ---------- scheduler ----------
+
+class IOScheduler:
+    def __init__(self, per_device: int = 1, rate_mb_s: Optional[float] = None, idle: bool = False):
+        self.configure(per_device, rate_mb_s, idle)
+
+    def configure(self, per_device: int = 1, rate_mb_s: Optional[float] = None, idle: bool = False):
+        self.per_device = max(per_device, 1)
+        self.rate = rate_mb_s * MB if rate_mb_s else None
+        self.idle = idle
+        self.devices: Dict[int, Device] = {}
+        self.active = 0  # slots held right now, all devices
+        self.cancelled = threading.Event()
+        self._lock = threading.Lock()
+        if idle and _ioprio_syscalls()[0] is None:
+            print(f"WARN: idle I/O priority not supported on {platform.machine()}; ignoring.", file=sys.stderr)
+            self.idle = False
+
+    @property
+    def limited(self) -> bool:
+        return self.rate is not None
+
+    def device_id(self, path: Path) -> int:
+        """st_dev of path, or of its nearest existing parent (for files about to be created)."""
+        p = Path(path)
+        while True:
+            try:
+                return os.stat(p).st_dev
+            except FileNotFoundError:
+                if p.parent == p:
+                    raise
+                p = p.parent
+
+    def device(self, path: Path) -> Device:
+        dev = self.device_id(path)
+        with self._lock:
+            d = self.devices.get(dev)
+            if d is None:
+                d = self.devices[dev] = Device(dev, self.per_device, self.rate, self.cancelled)
+            return d
+
+    @contextmanager
+    def slot(self, path: Path) -> Iterator[Device]:
+        """Hold one of the device's heavy-I/O slots (idle ioprio meanwhile, if configured)."""
+        d = self.device(path)
+        d.slots.acquire()
+        previous = get_ioprio() if self.idle else None
+        if self.idle:
+            set_ioprio(IOPRIO_CLASS_IDLE << IOPRIO_CLASS_SHIFT)
+        with self._lock:
+            self.active += 1
+        try:
+            yield d
+        finally:
+            with self._lock:
+                self.active -= 1
+            if previous is not None:
+                set_ioprio(previous)
+            d.slots.release()
+
+scheduler = IOScheduler()
+
+def configure(per_device: int = 1, rate_mb_s: Optional[float] = None, idle: bool = False) -> IOScheduler:
+    scheduler.configure(per_device, rate_mb_s, idle)
+    return scheduler
+
+class DevicePool:
+    """submit(path, fn, ...) runs fn on the executor of path's device (per_device workers each)."""
+
+    def __init__(self, sched: IOScheduler = scheduler):
+        self.sched = sched
+        self.pools: Dict[int, ThreadPoolExecutor] = {}
+
+    def submit(self, path: Path, fn: Callable, *args, **kwargs) -> Future:
+        dev = self.sched.device_id(path)
+        pool = self.pools.get(dev)
+        if pool is None:
+            pool = self.pools[dev] = ThreadPoolExecutor(max_workers=self.sched.per_device, thread_name_prefix=f"io-{dev:x}")
+        return pool.submit(fn, *args, **kwargs)
+
+    def shutdown(self, cancel: bool = False):
+        """Wait for the workers; cancel=True drops queued work and interrupts running copies/remuxes."""
+        if cancel:
+            self.sched.cancelled.set()
+        try:
+            for pool in self.pools.values():
+                pool.shutdown(wait=True, cancel_futures=cancel)
+        finally:
+            self.sched.cancelled.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *_):
+        self.shutdown(cancel=exc_type is not None)
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Single-pass library scanner shared by fix_movie_subs.py and audit_movie_subs.py.
+
+One os.scandir pass per movie folder:
+- videos: top-level files with a video extension (Radarr layout)
+- subs: .srt files in the folder and up to 2 levels below (Subs/, Subtitles/<lang>/, ...);
+  deeper directories are never entered
+- DirEntry type info (d_type) is used, so no extra stat() per file
+Folders come back in sorted order; jobs > 1 scans them on a thread pool, which helps
+on high-latency network mounts.
+TV roots (Show/Season NN/episodes) are walked per show: every directory holding videos
+is one folder (tv=True), owning the .srt files up to 2 levels below it that are not
+inside another video directory. iter_libraries() chains movie and TV roots in one pass.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+VIDEO_EXTS = {'.mkv', '.mp4', '.m4v', '.avi', '.mov'}
+SUB_EXTS = {'.srt'}
+MAX_SUB_DEPTH = 2
+
+@dataclass
+class FolderScan:
+    path: str
+    mtime_ns: int = 0
+    videos: List[str] = field(default_factory=list)
+    subs: List[str] = field(default_factory=list)
+    tv: bool = False  # episodes: match subs by episode key first
+
+def _walk_subs(path: str, depth: int, subs: List[str], videos: List[str]):
+    subdirs = []
+    with os.scandir(path) as it:
+        for entry in it:
+            if entry.is_dir():
+                # like os.walk: symlinked dirs are listed but not followed
+                if depth < MAX_SUB_DEPTH and not entry.is_symlink():
+                    subdirs.append(entry.path)
+                continue
+            ext = os.path.splitext(entry.name)[1].lower()
+            if ext in SUB_EXTS:
+                subs.append(entry.path)
+            elif depth == 0 and ext in VIDEO_EXTS:
+                videos.append(entry.path)
+    # files of a directory before its subdirectories (os.walk top-down order)
+    for d in subdirs:
+        _walk_subs(d, depth + 1, subs, videos)
+
+def scan_folder(path: str, mtime_ns: int = 0) -> FolderScan:
+    scan = FolderScan(path=path, mtime_ns=mtime_ns)
+    try:
+        _walk_subs(path, 0, scan.subs, scan.videos)
+    except OSError as e:
+        print(f"[SKIP] Cannot scan {path}: {e}")
+    return scan
+
+def list_folders(root: str) -> List[os.DirEntry]:
+    with os.scandir(root) as it:
+        return sorted((e for e in it if e.is_dir()), key=lambda e: e.path)
+
+def iter_library(root: str, jobs: int = 1) -> Iterator[FolderScan]:
+    """Yield one FolderScan per top-level folder of root, in sorted order."""
+    folders = list_folders(root)
+
+    def scan(entry: os.DirEntry) -> FolderScan:
+        try:
+            mtime_ns = entry.stat().st_mtime_ns
+        except OSError:
+            mtime_ns = 0
+        return scan_folder(entry.path, mtime_ns)
+
+    if jobs <= 1:
+        for entry in folders:
+            yield scan(entry)
+        return
+    with ThreadPoolExecutor(max_workers=jobs, thread_name_prefix="scan") as pool:
+        yield from pool.map(scan, folders)
+
+# ---------- TV ----------
+
+def path_key(path: str) -> Tuple[str, ...]:
+    """Sort key matching the scan order (parents before children, siblings sorted)."""
+    return tuple(path.split(os.sep))
+
+def _walk_tv(path: str, owner: Optional[FolderScan], depth: int, units: List[FolderScan]):
+    videos, subs, subdirs = [], [], []
+    try:
+        with os.scandir(path) as it:
+            entries = sorted(it, key=lambda e: e.name)
+        mtime_ns = os.stat(path).st_mtime_ns
+    except OSError as e:
+        print(f"[SKIP] Cannot scan {path}: {e}")
+        return
+    for entry in entries:
+        if entry.is_dir():
+            if not entry.is_symlink():
+                subdirs.append(entry.path)
+            continue
+        ext = os.path.splitext(entry.name)[1].lower()
+        if ext in SUB_EXTS:
+            subs.append(entry.path)
+        elif ext in VIDEO_EXTS:
+            videos.append(entry.path)
+    if videos:
+        owner, depth = FolderScan(path=path, mtime_ns=mtime_ns, videos=videos, tv=True), 0
+        units.append(owner)
+    if owner is not None and depth <= MAX_SUB_DEPTH:
+        owner.subs.extend(subs)
+    for d in subdirs:
+        # deeper than MAX_SUB_DEPTH: no longer collecting subs, still looking for episodes
+        _walk_tv(d, owner if depth < MAX_SUB_DEPTH else None, depth + 1, units)
+
+def scan_tv_folder(path: str) -> List[FolderScan]:
+    """Every directory with videos under path (path included), in scan order."""
+    units: List[FolderScan] = []
+    _walk_tv(path, None, 0, units)
+    return units
+
+def iter_tv_library(root: str, jobs: int = 1) -> Iterator[FolderScan]:
+    """Yield one FolderScan per episode directory of a TV root, show by show."""
+    shows = [e.path for e in list_folders(root)]
+    if jobs <= 1:
+        for show in shows:
+            yield from scan_tv_folder(show)
+        return
+    with ThreadPoolExecutor(max_workers=jobs, thread_name_prefix="scan") as pool:
+        for units in pool.map(scan_tv_folder, shows):
+            yield from units
+
+def iter_libraries(roots: Iterable[Tuple[str, bool]], jobs: int = 1) -> Iterator[FolderScan]:
+    """(root, is_tv) pairs -> all their folders, roots in path_key order; missing roots are skipped."""
+    for root, tv in sorted(roots, key=lambda r: path_key(os.path.abspath(r[0]))):
+        if not os.path.isdir(root):
+            print(f"[SKIP] Library root not found: {root}")
+            continue
+        yield from (iter_tv_library if tv else iter_library)(root, jobs=jobs)
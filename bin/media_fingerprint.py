@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Sampled content fingerprints with a persistent index (duplicate videos/subtitles, main video).
+
+- fingerprint = BLAKE2b over the size plus SAMPLE_BYTES at the head, middle and tail, so
+  a 40GB remux costs ~3MB of reads; files up to 3 * SAMPLE_BYTES (every subtitle) are
+  hashed whole, so equal subtitle fingerprints mean byte-identical files
+- stored in SQLite under /srv/cache (override with MEDIA_FINGERPRINT_INDEX or
+  --fingerprint-index), validated against (size, mtime_ns, inode) like the probe cache
+- only files of equal size can share a fingerprint: duplicates() stats everything and
+  reads samples for size collisions only
+- main_video(): the largest content in a folder, byte-identical copies counted once,
+  instead of guessing from file names
+
+  media_fingerprint.py dupes [--kind video|sub|all] ROOT...   duplicate groups
+  media_fingerprint.py main DIR...                             main video per folder
+"""
+
+import argparse
+import hashlib
+import os
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import media_metrics
+from library_scan import SUB_EXTS, VIDEO_EXTS
+
+DEFAULT_INDEX_PATH = Path(os.environ.get("MEDIA_FINGERPRINT_INDEX", "/srv/cache/media-tools/fingerprint.sqlite"))
+DEFAULT_JOBS = 4
+SAMPLE_BYTES = 1024 * 1024  # per sample; head + middle + tail
+DIGEST_SIZE = 16
+
+# ---------- fingerprint ----------
+
+def fingerprint(path: Path, size: Optional[int] = None) -> str:
+    """Hex digest of the size plus head/middle/tail samples (the whole file when small)."""
+    h = hashlib.blake2b(digest_size=DIGEST_SIZE)
+    fd = os.open(str(path), os.O_RDONLY)
+    try:
+        size = os.fstat(fd).st_size if size is None else size
+        h.update(size.to_bytes(8, "little"))
+        if size <= 3 * SAMPLE_BYTES:
+            offsets = [(0, size)]
+        else:
+            offsets = [(0, SAMPLE_BYTES), ((size - SAMPLE_BYTES) // 2, SAMPLE_BYTES), (size - SAMPLE_BYTES, SAMPLE_BYTES)]
+        read = 0
+        for off, n in offsets:
+            while n > 0:
+                buf = os.pread(fd, min(n, SAMPLE_BYTES), off)
+                if not buf:
+                    break
+                h.update(buf)
+                off += len(buf)
+                n -= len(buf)
+                read += len(buf)
+    finally:
+        os.close(fd)
+    media_metrics.inc("bytes_total", read, kind="scanned")
+    return h.hexdigest()
+
+# ---------- index ----------
+
+class FingerprintIndex:
+    """SQLite-backed fingerprints. Safe to share between threads."""
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS fingerprint ("
+            " path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, inode INTEGER,"
+            " fp TEXT, hashed_at REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS fingerprint_fp ON fingerprint (fp)")
+        self._db.commit()
+
+    def get(self, path: Path, st: os.stat_result) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT size, mtime_ns, inode, fp FROM fingerprint WHERE path = ?", (str(path),)
+            ).fetchone()
+        if row and (row[0], row[1], row[2]) == (st.st_size, st.st_mtime_ns, st.st_ino):
+            return row[3]
+        return None
+
+    def put(self, path: Path, st: os.stat_result, fp: str):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO fingerprint (path, size, mtime_ns, inode, fp, hashed_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (str(path), st.st_size, st.st_mtime_ns, st.st_ino, fp, time.time()),
+            )
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+_index: Optional[FingerprintIndex] = None
+_index_configured = False
+
+def configure_index(db_path: Optional[Path]) -> Optional[FingerprintIndex]:
+    """Open the process-wide index at db_path (None: fingerprints are not persisted)."""
+    global _index, _index_configured
+    _index_configured = True
+    _index = None
+    if db_path is None:
+        return None
+    try:
+        _index = FingerprintIndex(db_path)
+    except (OSError, sqlite3.Error) as e:
+        print(f"WARN: fingerprint index unavailable ({db_path}): {e}; hashing without it.", file=sys.stderr)
+    return _index
+
+def get_index() -> Optional[FingerprintIndex]:
+    if not _index_configured:
+        configure_index(DEFAULT_INDEX_PATH)
+    return _index
+
+def lookup(path: Path, st: Optional[os.stat_result] = None) -> str:
+    """Fingerprint of path, served from the index while size/mtime/inode are unchanged."""
+    with media_metrics.phase("fingerprint"):
+        path = Path(path)
+        st = st or path.stat()
+        index = get_index()
+        if index is not None:
+            fp = index.get(path, st)
+            media_metrics.cache_lookup("fingerprint", fp is not None)
+            if fp is not None:
+                return fp
+        fp = fingerprint(path, st.st_size)
+        if index is not None:
+            index.put(path, st, fp)
+        return fp
+
+# ---------- queries ----------
+
+def duplicates(paths: Iterable[str], jobs: int = 1) -> List[List[str]]:
+    """
+    Groups (2+ paths) of files with equal fingerprints, the likely original first (oldest
+    mtime, then shortest name: "Movie.mkv" before "Movie.copy.mkv"); unreadable files are skipped.
+    """
+    by_size: Dict[int, List[Tuple[str, os.stat_result]]] = {}
+    for p in paths:
+        try:
+            st = os.stat(p)
+        except OSError:
+            continue
+        by_size.setdefault(st.st_size, []).append((p, st))
+    todo = [item for same in by_size.values() if len(same) > 1 for item in same]
+
+    def fp_of(item: Tuple[str, os.stat_result]) -> Optional[str]:
+        try:
+            return lookup(Path(item[0]), item[1])
+        except OSError as e:
+            print(f"[SKIP] Cannot read {item[0]}: {e}", file=sys.stderr)
+            return None
+
+    if jobs <= 1:
+        fps = [fp_of(item) for item in todo]
+    else:
+        with ThreadPoolExecutor(max_workers=jobs, thread_name_prefix="fingerprint") as pool:
+            fps = list(pool.map(fp_of, todo))
+    groups: Dict[str, List[Tuple[str, os.stat_result]]] = {}
+    for item, fp in zip(todo, fps):
+        if fp is not None:
+            groups.setdefault(fp, []).append(item)
+    return [[p for p, _ in sorted(g, key=lambda i: (i[1].st_mtime_ns, len(i[0]), i[0]))]
+            for g in groups.values() if len(g) > 1]
+
+def main_video(videos: List[str]) -> Optional[str]:
+    """
+    The main feature among a folder's videos: the largest file; byte-identical copies
+    (same fingerprint) are one candidate, represented by the original (see duplicates()).
+    """
+    sizes = {}
+    for v in videos:
+        try:
+            sizes[v] = os.stat(v).st_size
+        except OSError:
+            continue
+    if not sizes:
+        return None
+    copies = {p for group in duplicates(list(sizes)) for p in group[1:]}
+    return max((v for v in sizes if v not in copies), key=lambda v: sizes[v])
+
+def match_candidates(videos: List[str], tv: bool = False) -> Tuple[List[str], List[str], Optional[str]]:
+    """
+    (videos, copies, main) for subtitle matching, shared by fix_movie_subs.py and
+    audit_movie_subs.py so the audit reports what --apply does:
+    - byte-identical copies are dropped, the original kept (see duplicates())
+    - main: the main video of a movie folder (main_video()); None for TV seasons,
+      whose episodes are told apart by episode key, and for single-video folders
+    """
+    if len(videos) < 2:
+        return videos, [], None
+    copies = sorted({v for group in duplicates(videos) for v in group[1:]})
+    videos = [v for v in videos if v not in copies]
+    return videos, copies, None if tv else main_video(videos)
+
+def same_content(a: str, b: str) -> bool:
+    """True when a and b have the same fingerprint (byte-identical for subtitles)."""
+    try:
+        return os.path.getsize(a) == os.path.getsize(b) and lookup(Path(a)) == lookup(Path(b))
+    except OSError:
+        return False
+
+# ---------- CLI ----------
+
+def iter_files(roots: List[str], exts: set) -> Iterable[str]:
+    for root in roots:
+        if not os.path.isdir(root):
+            print(f"[SKIP] Library root not found: {root}", file=sys.stderr)
+            continue
+        for dirpath, dirs, files in os.walk(root):
+            dirs.sort()
+            for name in sorted(files):
+                if os.path.splitext(name)[1].lower() in exts:
+                    yield os.path.join(dirpath, name)
+
+def top_level_videos(folder: str) -> List[str]:
+    try:
+        with os.scandir(folder) as it:
+            return sorted(e.path for e in it if e.is_file() and os.path.splitext(e.name)[1].lower() in VIDEO_EXTS)
+    except OSError as e:
+        print(f"[SKIP] Cannot scan {folder}: {e}", file=sys.stderr)
+        return []
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Content fingerprints: duplicate files and main videos.")
+    ap.add_argument("--fingerprint-index", default=str(DEFAULT_INDEX_PATH), help="SQLite index path (default: %(default)s)")
+    ap.add_argument("--no-index", action="store_true", help="hash without reading or writing the index")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    dp = sub.add_parser("dupes", help="print groups of duplicate files under the roots")
+    dp.add_argument("roots", nargs="+")
+    dp.add_argument("--kind", choices=["video", "sub", "all"], default="all")
+    dp.add_argument("--jobs", type=int, default=DEFAULT_JOBS, help="files hashed in parallel (default: %(default)s)")
+    mp = sub.add_parser("main", help="print the main video of each folder (top-level videos only)")
+    mp.add_argument("folders", nargs="+")
+    args = ap.parse_args(argv)
+    configure_index(None if args.no_index else Path(args.fingerprint_index))
+
+    if args.cmd == "main":
+        for folder in args.folders:
+            video = main_video(top_level_videos(folder))
+            if video:
+                print(video)
+        return 0
+
+    exts = {"video": VIDEO_EXTS, "sub": SUB_EXTS, "all": VIDEO_EXTS | SUB_EXTS}[args.kind]
+    groups = duplicates(iter_files(args.roots, exts), jobs=args.jobs)
+    wasted = 0
+    for group in sorted(groups, key=lambda g: g[0]):
+        size = os.path.getsize(group[0])
+        wasted += size * (len(group) - 1)
+        print(f"== {len(group)} x {size / 1024 / 1024:.1f}MB")
+        for p in group:
+            print(f"  {p}")
+    print(f"\n{len(groups)} duplicate groups, {wasted / 1024 / 1024:.1f}MB in extra copies", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Library inventory CSVs (size, duration, resolution, codec, MB/min, languages) per video file.
+
+Replaces the per-file ffprobe/awk loops of scan_movies_inventory.sh and scan_tv_inventory.sh:
+- movies and TV in one run, one CSV per library (<name>_inventory.csv)
+- one ffprobe call per file, served from the probe cache when unchanged (media_probe.py),
+  probed ahead on a bounded pool (--jobs) and written in walk order
+- all math done in-process; each CSV goes to <out>.partial and is renamed when complete
+- extra columns: audio / embedded subtitle languages and sidecar .srt languages,
+  plus a per-library language summary on stdout
+"""
+
+import argparse
+import csv
+import os
+import sys
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import media_probe
+from sub_lang import parse_lang_flags
+
+VIDEO_EXTS = {".mkv", ".mp4", ".m4v", ".avi", ".mov"}
+COLUMNS = ["path", "size_bytes", "size_mb", "duration_s", "minutes", "width", "height", "codec", "mb_per_min", "resolution",
+           "audio_langs", "sub_langs", "ext_sub_langs"]
+DEFAULT_LIBRARIES = {"movies": "/srv/media/movies", "tv": "/srv/media/tv"}
+DEFAULT_OUT_DIR = "/srv/backup/reports"
+
+def iter_videos(root: Path) -> Iterator[Tuple[Path, List[str]]]:
+    """(video, .srt names in the same directory), in sorted walk order."""
+    for dirpath, dirs, files in os.walk(root):
+        dirs.sort()
+        files.sort()
+        srts = [n for n in files if n.lower().endswith(".srt")]
+        for name in files:
+            if os.path.splitext(name)[1].lower() in VIDEO_EXTS:
+                yield Path(dirpath) / name, srts
+
+def resolution_label(height: int) -> str:
+    if height >= 2160: return "2160p"
+    if height >= 1440: return "1440p"
+    if height >= 1080: return "1080p"
+    if height >= 720: return "720p"
+    return "SD"
+
+def sidecar_languages(video: Path, srts: List[str]) -> List[str]:
+    """Languages of the .srt files named after this video (Movie.en.srt, Movie.es.forced.srt, ...)."""
+    stem = video.stem.lower()
+    langs: List[str] = []
+    for name in srts:
+        if name.lower().startswith(stem + ".") or name.lower() == stem + ".srt":
+            lang = parse_lang_flags(name[len(stem):])[0] or "und"
+            if lang not in langs:
+                langs.append(lang)
+    return langs
+
+def inventory_row(path: Path, data: Optional[Dict], srts: List[str] = ()) -> List:
+    size_b = path.stat().st_size
+    size_mb = round(size_b / 1024 / 1024, 2)
+    data = data or {}
+    v = media_probe.first_video_stream(data) or {}
+    width = int(v.get("width") or 0)
+    height = int(v.get("height") or 0)
+    dur_s = round(media_probe.duration_seconds(data) or 0)
+    mins = round(dur_s / 60, 2) if dur_s > 0 else 0.0
+    mbpm = round(size_mb / mins, 2) if mins > 0 else 0.0
+    return [str(path), size_b, f"{size_mb:.2f}", dur_s, f"{mins:.2f}", width, height,
+            v.get("codec_name", ""), f"{mbpm:.2f}", resolution_label(height),
+            ";".join(media_probe.stream_languages(data, "audio")),
+            ";".join(media_probe.stream_languages(data, "subtitle")),
+            ";".join(sidecar_languages(path, list(srts)))]
+
+def write_inventory(root: Path, out: Path, jobs: int, timeout: Optional[float]) -> Dict[str, Counter]:
+    """Probe every video under root and write the CSV; returns language/file counters."""
+    summary = {"files": Counter(), "audio": Counter(), "subs": Counter(), "ext_subs": Counter()}
+    videos = list(iter_videos(root))
+    srts = dict(videos)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out.with_name(out.name + ".partial")
+    with tmp.open("w", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(COLUMNS)
+        for p, data, err in media_probe.probe_ordered((p for p, _ in videos), jobs=jobs, timeout=timeout):
+            if err is not None:
+                print(f"WARN: probe failed for {p}: {err}", file=sys.stderr)
+            try:
+                row = inventory_row(p, data, srts[p])
+            except OSError as e:
+                print(f"WARN: skipping {p}: {e}", file=sys.stderr)
+                continue
+            w.writerow(row)
+            summary["files"]["ok" if err is None else "probe_failed"] += 1
+            for key, cell in zip(("audio", "subs", "ext_subs"), row[10:13]):
+                summary[key].update(cell.split(";") if cell else ["none"])
+    tmp.replace(out)
+    return summary
+
+def parse_library(spec: str) -> Tuple[str, str]:
+    name, sep, root = spec.partition("=")
+    if not sep or not name or not root:
+        raise argparse.ArgumentTypeError(f"expected NAME=ROOT, got {spec!r}")
+    return name, root
+
+def main():
+    parser = argparse.ArgumentParser(description="Write CSV inventories of the video files in the media libraries.")
+    parser.add_argument("--library", action="append", type=parse_library, metavar="NAME=ROOT",
+                        help="Library to scan into <out-dir>/NAME_inventory.csv; repeatable "
+                             "(default: movies=/srv/media/movies tv=/srv/media/tv).")
+    parser.add_argument("--out-dir", default=DEFAULT_OUT_DIR, help="Directory for the CSVs (default: %(default)s).")
+    parser.add_argument("--root", help="Scan a single library root instead (with --out).")
+    parser.add_argument("--out", help="CSV path for --root.")
+    parser.add_argument("--jobs", type=int, default=media_probe.DEFAULT_JOBS, help="Max concurrent ffprobe processes (default: %(default)s).")
+    parser.add_argument("--probe-timeout", type=float, default=media_probe.DEFAULT_TIMEOUT_S, help="Seconds before a single ffprobe is abandoned (default: %(default)s).")
+    parser.add_argument("--probe-cache", default=str(media_probe.DEFAULT_CACHE_PATH), help="SQLite probe cache path (default: %(default)s).")
+    parser.add_argument("--no-probe-cache", action="store_true", help="Always run ffprobe; do not read or write the probe cache.")
+    args = parser.parse_args()
+
+    if args.root:
+        if args.library:
+            parser.error("--root and --library are mutually exclusive")
+        targets = [(Path(args.root), Path(args.out or Path(args.out_dir) / f"{Path(args.root).name}_inventory.csv"))]
+    else:
+        libraries = args.library or list(DEFAULT_LIBRARIES.items())
+        targets = [(Path(root), Path(args.out_dir) / f"{name}_inventory.csv") for name, root in libraries]
+
+    cache = media_probe.configure_cache(None if args.no_probe_cache else Path(args.probe_cache))
+    media_probe.ffprobe_bin()
+
+    for root, out in targets:
+        if not root.is_dir():
+            print(f"WARN: library root not found, skipping: {root}", file=sys.stderr)
+            continue
+        summary = write_inventory(root, out, max(args.jobs, 1), args.probe_timeout)
+        files = sum(summary["files"].values())
+        print(f"Wrote: {out} ({files} files, {summary['files']['probe_failed']} probe failures)")
+        print("  audio:     " + ", ".join(f"{k}={n}" for k, n in summary["audio"].most_common()))
+        print("  subtitles: " + ", ".join(f"{k}={n}" for k, n in summary["subs"].most_common()))
+        print("  .srt:      " + ", ".join(f"{k}={n}" for k, n in summary["ext_subs"].most_common()))
+    if cache is not None:
+        print(f"Probe cache: {cache.hits} hits, {cache.misses} misses")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Prometheus instrumentation shared by the media maintenance scripts (no client library).
+
+- counters / gauges / histograms in one process-wide registry, thread-safe
+- phase("probe"|"backup"|"edit"|"remux"|"match"|"rename"|...) times a block into
+  media_tools_phase_seconds_total / media_tools_phase_runs_total
+- finish() writes <job>.prom for node_exporter's textfile collector (temp file +
+  rename, as the collector requires) into MEDIA_METRICS_TEXTFILE_DIR, default
+  /var/lib/prometheus/node-exporter; skipped quietly when that directory is missing
+- serve(port) exposes the same text live on http://0.0.0.0:<port>/metrics
+  (MEDIA_METRICS_PORT enables it for scripts without a CLI flag)
+Every series carries a job="<script>" label.
+"""
+
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+DEFAULT_TEXTFILE_DIR = Path(os.environ.get("MEDIA_METRICS_TEXTFILE_DIR", "/var/lib/prometheus/node-exporter"))
+textfile_dir: Optional[Path] = DEFAULT_TEXTFILE_DIR  # where finish() writes by default; None = never
+PREFIX = "media_tools_"
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+HELP = {
+    "phase_seconds_total": ("counter", "Wall time spent per phase (summed over threads)."),
+    "phase_runs_total": ("counter", "Times each phase ran."),
+    "bytes_total": ("counter", "Bytes by kind: written, avoided, scanned."),
+    "files_total": ("counter", "Files handled, by result."),
+    "folders_total": ("counter", "Library folders processed by the watch daemon, by result (ok/failed)."),
+    "cache_requests_total": ("counter", "Cache lookups by cache and result (hit/miss)."),
+    "ffprobe_seconds": ("histogram", "ffprobe process latency."),
+    "mkv_tracks_total": ("counter", "MKV track listings by source: ebml (native read) or ffprobe (fallback)."),
+    "run_seconds": ("gauge", "Duration of the last run."),
+    "files_per_second": ("gauge", "Files handled per second in the last run."),
+    "last_run_timestamp_seconds": ("gauge", "Unix time the last run finished."),
+    "last_run_success": ("gauge", "1 if the last run finished cleanly."),
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+def _num(v: float) -> str:
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.job = os.path.splitext(os.path.basename(sys.argv[0] or "media_tools"))[0]
+        self.started = time.monotonic()
+        self.values: Dict[Tuple[str, Labels], float] = {}
+        self.histograms: Dict[Tuple[str, Labels], list] = {}  # [bucket counts..., sum, count]
+
+    def _key(self, name: str, labels: Dict[str, str]) -> Tuple[str, Labels]:
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels):
+        with self._lock:
+            self.values[self._key(name, labels)] = value
+
+    def observe(self, name: str, value: float, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            h = self.histograms.get(key)
+            if h is None:
+                h = self.histograms[key] = [0] * (len(LATENCY_BUCKETS) + 2)
+            for i, le in enumerate(LATENCY_BUCKETS):
+                if value <= le:
+                    h[i] += 1
+            h[-2] += value
+            h[-1] += 1
+
+    def render(self) -> str:
+        def fmt(labels: Labels, extra: Labels = ()) -> str:
+            pairs = (("job", self.job),) + labels + extra
+            esc = lambda v: v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+            return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in pairs) + "}"
+
+        with self._lock:
+            values = sorted(self.values.items())
+            histograms = sorted((k, list(v)) for k, v in self.histograms.items())
+        lines, seen = [], set()
+
+        def header(name: str):
+            if name not in seen:
+                seen.add(name)
+                kind, text = HELP.get(name, ("untyped", name))
+                lines.append(f"# HELP {PREFIX}{name} {text}")
+                lines.append(f"# TYPE {PREFIX}{name} {kind}")
+
+        for (name, labels), v in values:
+            header(name)
+            lines.append(f"{PREFIX}{name}{fmt(labels)} {_num(v)}")
+        for (name, labels), h in histograms:
+            header(name)
+            for le, n in zip(LATENCY_BUCKETS, h):
+                lines.append(f"{PREFIX}{name}_bucket{fmt(labels, (('le', f'{le:g}'),))} {n}")
+            lines.append(f"{PREFIX}{name}_bucket{fmt(labels, (('le', '+Inf'),))} {h[-1]}")
+            lines.append(f"{PREFIX}{name}_sum{fmt(labels)} {_num(h[-2])}")
+            lines.append(f"{PREFIX}{name}_count{fmt(labels)} {h[-1]}")
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+inc, set_gauge, observe = registry.inc, registry.set, registry.observe
+
+@contextmanager
+def phase(name: str):
+    """Time a block into the per-phase counters (also when it raises)."""
+    t0 = time.monotonic()
+    try:
+        yield
+    finally:
+        inc("phase_seconds_total", time.monotonic() - t0, phase=name)
+        inc("phase_runs_total", phase=name)
+
+def cache_lookup(cache: str, hit: bool):
+    inc("cache_requests_total", cache=cache, result="hit" if hit else "miss")
+
+# ---------- exposition ----------
+
+def write_textfile(directory: Path = DEFAULT_TEXTFILE_DIR) -> Optional[Path]:
+    """Atomically write <job>.prom into directory. None when the directory does not exist."""
+    directory = Path(directory)
+    if not directory.is_dir():
+        return None
+    out = directory / f"{registry.job}.prom"
+    tmp = directory / f".{registry.job}.prom.{os.getpid()}"
+    try:
+        tmp.write_text(registry.render())
+        os.replace(tmp, out)
+    except OSError as e:
+        print(f"WARN: cannot write metrics to {out}: {e}", file=sys.stderr)
+        tmp.unlink(missing_ok=True)
+        return None
+    return out
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def serve(port: int, addr: str = "0.0.0.0") -> Optional[ThreadingHTTPServer]:
+    """Serve /metrics from a daemon thread for the life of the process."""
+    try:
+        server = ThreadingHTTPServer((addr, port), _Handler)
+    except OSError as e:
+        print(f"WARN: metrics endpoint unavailable on :{port}: {e}", file=sys.stderr)
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+def env_port() -> Optional[int]:
+    """MEDIA_METRICS_PORT, or None when unset / not a number."""
+    port = os.environ.get("MEDIA_METRICS_PORT", "").strip()
+    return int(port) if port.isdigit() else None
+
+def serve_from_env() -> Optional[ThreadingHTTPServer]:
+    port = env_port()
+    return serve(port) if port else None
+
+def finish(files: Optional[int] = None, success: bool = True, directory: Optional[Path] = None) -> Optional[Path]:
+    """
+    Record run-level gauges and write the textfile into directory (default: the
+    module's textfile_dir; nothing is written while that is None).
+    files defaults to everything counted in files_total.
+    """
+    if files is None:
+        files = sum(v for (name, _), v in list(registry.values.items()) if name == "files_total")
+    elapsed = time.monotonic() - registry.started
+    set_gauge("run_seconds", elapsed)
+    set_gauge("files_per_second", files / max(elapsed, 1e-6))
+    set_gauge("last_run_timestamp_seconds", time.time())
+    set_gauge("last_run_success", 1 if success else 0)
+    directory = directory or textfile_dir
+    return write_textfile(directory) if directory is not None else None
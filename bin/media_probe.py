@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Shared ffprobe helpers with a persistent on-disk probe cache.
+
+- One `ffprobe -show_streams -show_format` call per file fills the cache
+- Cache entries are keyed by path and validated against (size, mtime_ns, inode),
+  so an unchanged file costs a single stat() instead of a process spawn
+- Stored in SQLite under /srv/cache (override with MEDIA_PROBE_CACHE or --probe-cache)
+- probe_ordered(): bounded thread pool that probes a list of files ahead of time
+  and hands results back in input order
+"""
+
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import media_metrics
+
+DEFAULT_CACHE_PATH = Path(os.environ.get("MEDIA_PROBE_CACHE", "/srv/cache/media-tools/probe.sqlite"))
+DEFAULT_JOBS = 4
+DEFAULT_TIMEOUT_S = 60.0
+
+# ---------- ffprobe ----------
+
+def ffprobe_bin() -> str:
+    path = shutil.which("ffprobe")
+    if not path:
+        print("ERROR: 'ffprobe' not in PATH. Install via: sudo apt install -y ffmpeg", file=sys.stderr)
+        sys.exit(1)
+    return path
+
+def ffprobe_json(file_path: Path, timeout: Optional[float] = None) -> Dict:
+    """Single ffprobe call returning both streams and format sections."""
+    t0 = time.monotonic()
+    try:
+        p = subprocess.run(
+            [ffprobe_bin(), "-v", "error", "-show_streams", "-show_format", "-of", "json", str(file_path)],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=timeout,
+        )
+    except subprocess.TimeoutExpired:
+        raise RuntimeError(f"ffprobe timed out after {timeout:g}s")
+    finally:
+        media_metrics.observe("ffprobe_seconds", time.monotonic() - t0)
+    if p.returncode != 0:
+        raise RuntimeError(f"ffprobe failed: {p.stderr.strip()}")
+    data = json.loads(p.stdout or "{}")
+    return {"streams": data.get("streams", []), "format": data.get("format", {})}
+
+# ---------- cache ----------
+
+class ProbeCache:
+    """SQLite-backed probe results. Safe to share between threads."""
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS probe ("
+            " path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, inode INTEGER,"
+            " data TEXT, probed_at REAL)"
+        )
+        self._db.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path: Path, st: os.stat_result) -> Optional[Dict]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT size, mtime_ns, inode, data FROM probe WHERE path = ?", (str(path),)
+            ).fetchone()
+            if row and (row[0], row[1], row[2]) == (st.st_size, st.st_mtime_ns, st.st_ino):
+                self.hits += 1
+                return json.loads(row[3])
+            self.misses += 1
+        return None
+
+    def put(self, path: Path, st: os.stat_result, data: Dict):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO probe (path, size, mtime_ns, inode, data, probed_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (str(path), st.st_size, st.st_mtime_ns, st.st_ino, json.dumps(data), time.time()),
+            )
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+_cache: Optional[ProbeCache] = None
+_cache_configured = False
+
+def configure_cache(db_path: Optional[Path]) -> Optional[ProbeCache]:
+    """Open the process-wide cache at db_path (None disables caching)."""
+    global _cache, _cache_configured
+    _cache_configured = True
+    _cache = None
+    if db_path is None:
+        return None
+    try:
+        _cache = ProbeCache(db_path)
+    except (OSError, sqlite3.Error) as e:
+        print(f"WARN: probe cache unavailable ({db_path}): {e}; probing without cache.", file=sys.stderr)
+    return _cache
+
+def get_cache() -> Optional[ProbeCache]:
+    if not _cache_configured:
+        configure_cache(DEFAULT_CACHE_PATH)
+    return _cache
+
+def probe(file_path: Path, timeout: Optional[float] = None) -> Dict:
+    """Probe data for file_path, served from the cache when the file is unchanged."""
+    with media_metrics.phase("probe"):
+        file_path = Path(file_path)
+        st = file_path.stat()
+        cache = get_cache()
+        if cache is not None:
+            data = cache.get(file_path, st)
+            media_metrics.cache_lookup("probe", data is not None)
+            if data is not None:
+                return data
+        data = ffprobe_json(file_path, timeout=timeout)
+        if cache is not None:
+            cache.put(file_path, st, data)
+        return data
+
+def probe_ordered(paths: Iterable[Path], jobs: int = DEFAULT_JOBS,
+                  timeout: Optional[float] = DEFAULT_TIMEOUT_S) -> Iterator[Tuple[Path, Optional[Dict], Optional[Exception]]]:
+    """
+    Probe all paths on a pool of at most `jobs` concurrent ffprobe processes.
+    Yields (path, data, error) in input order; a failed or timed-out probe yields
+    its exception instead of stopping the pool.
+    """
+    paths = list(paths)
+    if jobs <= 1:
+        for p in paths:
+            try:
+                yield p, probe(p, timeout=timeout), None
+            except Exception as e:
+                yield p, None, e
+        return
+    pool = ThreadPoolExecutor(max_workers=jobs, thread_name_prefix="probe")
+    try:
+        futures = [pool.submit(probe, p, timeout) for p in paths]
+        for p, fut in zip(paths, futures):
+            try:
+                yield p, fut.result(), None
+            except Exception as e:
+                yield p, None, e
+    finally:
+        # consumer stopped early (quit/rollback): drop queued probes
+        pool.shutdown(wait=False, cancel_futures=True)
+
+# ---------- views over probe data ----------
+
+def audio_streams(data: Dict) -> List[Dict]:
+    audio = []
+    for s in data.get("streams", []):
+        if s.get("codec_type") != "audio":
+            continue
+        tags = s.get("tags") or {}
+        audio.append({
+            "ff_index": s.get("index"),
+            "codec": s.get("codec_name"),
+            "channels": s.get("channels"),
+            "layout": s.get("channel_layout"),
+            "language": (tags.get("language") or "und"),
+            "title": tags.get("title", ""),
+            "default": bool((s.get("disposition") or {}).get("default")),
+            "forced": bool((s.get("disposition") or {}).get("forced")),
+        })
+    return audio
+
+def subtitle_streams(data: Dict) -> List[Dict]:
+    subs = []
+    for s in data.get("streams", []):
+        if s.get("codec_type") != "subtitle":
+            continue
+        tags = s.get("tags") or {}
+        disposition = s.get("disposition") or {}
+        subs.append({
+            "ff_index": s.get("index"),
+            "codec": s.get("codec_name"),
+            "language": (tags.get("language") or "und"),
+            "title": tags.get("title", ""),
+            "default": bool(disposition.get("default")),
+            "forced": bool(disposition.get("forced")),
+        })
+    return subs
+
+def stream_languages(data: Dict, codec_type: str) -> List[str]:
+    """Distinct language tags of one stream type ('audio', 'subtitle'), in stream order."""
+    langs: List[str] = []
+    for s in data.get("streams", []):
+        if s.get("codec_type") == codec_type:
+            lang = ((s.get("tags") or {}).get("language") or "und").lower()
+            if lang not in langs:
+                langs.append(lang)
+    return langs
+
+def duration_seconds(data: Dict) -> Optional[float]:
+    try:
+        return float(data.get("format", {}).get("duration"))
+    except (TypeError, ValueError):
+        return None
+
+def first_video_stream(data: Dict) -> Optional[Dict]:
+    for s in data.get("streams", []):
+        if s.get("codec_type") == "video":
+            return s
+    return None
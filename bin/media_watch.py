@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+Watch the media libraries and tidy new imports as they land (daemon mode).
+
+- filesystem events from fs_watch.py (inotify, polling fallback with --poll or when
+  inotify is unavailable); each event marks the top-level folder it falls in
+  (movie folder / show folder) as pending; show folders are fixed season by season
+- a pending folder is processed once it has been quiet for --debounce seconds and
+  its file sizes/mtimes did not change across one more debounce period, so copies
+  in progress (rsync, *arr imports, slow SMB writes) are never touched half-written
+- ready folders go to a bounded worker pool (--workers); a folder is never processed
+  twice at once and events arriving meanwhile queue it again afterwards
+- per folder: the subtitle fix (fix_movie_subs.py plan/apply) and, with --rules, the
+  rule-based audio tagging (tag_audio_lang.py run_rules, journaled; tagging runs one
+  folder at a time since the run journal admits a single run)
+- backup copies and remuxes share io_sched.py's per-disk limits (--max-io-rate,
+  --io-per-device, --io-idle), so a big import does not starve playback
+- our own renames/edits raise events too: the folder's state after processing is
+  remembered and a later wake-up that finds the same state is dropped
+Dry-run by default; --apply changes files. SIGINT/SIGTERM finish the running folders.
+
+  python3 media_watch.py --apply --rules /etc/media-tools/tag_audio_rules.yaml
+"""
+
+import argparse
+import os
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+import fix_movie_subs
+import fs_watch
+import io_sched
+import library_scan
+import media_metrics
+import media_probe
+import run_journal
+import tag_audio_lang
+
+DEFAULT_ROOTS = [fix_movie_subs.ROOT]
+DEFAULT_TV_ROOTS = [fix_movie_subs.TV_ROOT]
+DEFAULT_DEBOUNCE_S = 30.0
+DEFAULT_WORKERS = 2
+DEFAULT_POLL_INTERVAL_S = 120.0
+
+Signature = Tuple[Tuple[str, int, int], ...]
+
+def log(msg: str):
+    print(f"{time.strftime('%Y-%m-%d %H:%M:%S')} {msg}", flush=True)
+
+def folder_signature(folder: str) -> Signature:
+    """(relpath, size, mtime_ns) of every file below folder, sorted."""
+    out = []
+    for dirpath, _, files in os.walk(folder):
+        for name in files:
+            p = os.path.join(dirpath, name)
+            try:
+                st = os.stat(p)
+            except OSError:
+                continue
+            out.append((os.path.relpath(p, folder), st.st_size, st.st_mtime_ns))
+    return tuple(sorted(out))
+
+# ---------- debounce queue ----------
+
+class FolderQueue:
+    """Pending folders -> ready once quiet for `debounce` seconds and size-stable."""
+
+    def __init__(self, roots: List[str], debounce: float):
+        self.roots = [os.path.abspath(r) for r in roots]
+        self.debounce = debounce
+        self.pending: Dict[str, Tuple[float, Optional[Signature]]] = {}  # folder -> (last event, last signature)
+        self.done: Dict[str, Signature] = {}  # folder -> state we left it in
+
+    def folder_of(self, path: str) -> Optional[str]:
+        path = os.path.abspath(path)
+        for root in self.roots:
+            rel = os.path.relpath(path, root)
+            if rel == "." or rel.startswith(".."):
+                continue
+            return os.path.join(root, rel.split(os.sep, 1)[0])
+        return None
+
+    def touch(self, path: str, now: float):
+        folder = self.folder_of(path)
+        if folder is not None:
+            _, sig = self.pending.get(folder, (0.0, None))
+            self.pending[folder] = (now, sig)
+
+    def ready(self, now: float, busy: Set[str], limit: int) -> List[str]:
+        out = []
+        for folder, (last, sig) in list(self.pending.items()):
+            if len(out) >= limit:
+                break
+            if folder in busy or now - last < self.debounce:
+                continue
+            if not os.path.isdir(folder):
+                del self.pending[folder]  # removed / renamed away
+                self.done.pop(folder, None)
+                continue
+            current = folder_signature(folder)
+            if current != sig:
+                self.pending[folder] = (now, current)  # still changing (or first look): wait one more period
+                continue
+            del self.pending[folder]
+            if self.done.get(folder) == current:
+                continue  # only our own edits since the last run
+            out.append(folder)
+        return out
+
+# ---------- per-folder work ----------
+
+class FolderWorker:
+    def __init__(self, args: argparse.Namespace, rules: Optional[List[Dict]], tv_roots: List[str]):
+        self.args = args
+        self.rules = rules
+        self.tv_roots = {os.path.abspath(r) for r in tv_roots}
+        self.tag_lock = threading.Lock()
+
+    def fix_subs(self, folder: str):
+        if os.path.dirname(folder) in self.tv_roots:
+            scans = library_scan.scan_tv_folder(folder)
+        else:
+            scans = [library_scan.scan_folder(folder)]
+        for scan in scans:
+            self.fix_scan(scan)
+
+    def fix_scan(self, scan: library_scan.FolderScan):
+        folder = scan.path
+        ops, _ = fix_movie_subs.plan_folder(scan, self.args.detect_content)
+        if not self.args.apply:
+            for src, dst in ops:
+                log(f"[DRY] {fix_movie_subs.describe(src, dst)} {src} -> {dst}")
+            return
+        if ops:
+            changed, moved, failed = fix_movie_subs.apply_folder(ops)
+            log(f"subs: {folder}: changed={changed} moved={moved} failed={failed}")
+
+    def tag_audio(self, folder: str):
+        with self.tag_lock:
+            journal = None
+            if self.args.apply and not self.args.no_journal:
+                try:
+                    journal = run_journal.RunJournal(Path(self.args.journal))
+                except run_journal.JournalBusy:
+                    raise  # a manual tag_audio_lang.py run; retried later
+                except OSError as e:
+                    log(f"WARN: run journal unavailable ({e}); tagging {folder} without it")
+                if journal is not None and journal.incomplete_runs():
+                    journal.close()
+                    raise RuntimeError(f"{self.args.journal} has incomplete run(s); run tag_audio_lang.py --recover first")
+            tracker = tag_audio_lang.ChangeTracker(keep_backups=False, backup_strategy=self.args.backup_strategy, journal=journal)
+            if journal is not None:
+                journal.begin(sys.argv + ["--watch-folder", folder])
+            try:
+                tag_audio_lang.run_rules(Path(folder), self.rules, tracker, None, not self.args.apply,
+                                         jobs=1, probe_timeout=self.args.probe_timeout)
+                tracker.cleanup_backups()
+                tracker.finish("ok")
+            except BaseException:
+                tracker.revert_all()
+                tracker.finish("rolled_back")
+                raise
+
+    def __call__(self, folder: str) -> Signature:
+        t0 = time.monotonic()
+        log(f"processing {folder}")
+        with media_metrics.phase("watch_folder"):
+            self.fix_subs(folder)
+            if self.rules is not None:
+                self.tag_audio(folder)
+        log(f"done {folder} in {time.monotonic() - t0:.1f}s")
+        return folder_signature(folder)
+
+# ---------- main loop ----------
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Watch the media libraries and fix subtitles / tag audio of new imports.")
+    ap.add_argument("--root", action="append", help="movie library root to watch; repeatable")
+    ap.add_argument("--tv-root", action="append", help="TV library root to watch; repeatable "
+                                                       "(default without either option: %s)" % " ".join(DEFAULT_ROOTS + DEFAULT_TV_ROOTS))
+    ap.add_argument("--apply", action="store_true", help="change files (default: dry-run, log what would be done)")
+    ap.add_argument("--debounce", type=float, default=DEFAULT_DEBOUNCE_S, help="quiet seconds before a folder is processed (default: %(default)s)")
+    ap.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="folders processed at once (default: %(default)s)")
+    ap.add_argument("--poll", action="store_true", help="poll instead of inotify (NFS/SMB mounts)")
+    ap.add_argument("--poll-interval", type=float, default=DEFAULT_POLL_INTERVAL_S, help="seconds between polls (default: %(default)s)")
+    ap.add_argument("--detect-content", action="store_true", help="untagged subs: read the text before falling back to the default language")
+    ap.add_argument("--rules", help="tag_audio_lang YAML/JSON policy; enables audio tagging")
+    ap.add_argument("--backup-strategy", choices=tag_audio_lang.BACKUP_STRATEGIES, default="auto", help="see tag_audio_lang.py (default: %(default)s)")
+    ap.add_argument("--journal", default=str(tag_audio_lang.DEFAULT_JOURNAL_PATH), help="tagging run journal (default: %(default)s)")
+    ap.add_argument("--no-journal", action="store_true", help="tag without the run journal")
+    ap.add_argument("--probe-cache", default=str(media_probe.DEFAULT_CACHE_PATH), help="SQLite probe cache path (default: %(default)s)")
+    ap.add_argument("--probe-timeout", type=float, default=media_probe.DEFAULT_TIMEOUT_S, help="seconds before a single ffprobe is abandoned (default: %(default)s)")
+    ap.add_argument("--max-io-rate", type=float, metavar="MB_S", help="cap backup copies and remuxes at MB_S per disk (default: no cap)")
+    ap.add_argument("--io-per-device", type=int, default=1, help="heavy file operations at once per disk (default: %(default)s)")
+    ap.add_argument("--io-idle", action="store_true", help="heavy file operations in the idle I/O class (BFQ only)")
+    ap.add_argument("--metrics-port", type=int,
+                    help="serve live metrics on http://0.0.0.0:PORT/metrics (default: $MEDIA_METRICS_PORT, else off)")
+    args = ap.parse_args(argv)
+
+    if not args.root and not args.tv_root:
+        args.root, args.tv_root = DEFAULT_ROOTS, DEFAULT_TV_ROOTS
+    roots, tv_roots = [], []
+    for r, tv in [(r, False) for r in args.root or []] + [(r, True) for r in args.tv_root or []]:
+        if os.path.isdir(r):
+            roots.append(r)
+            if tv:
+                tv_roots.append(r)
+        else:
+            log(f"WARN: root not found, skipping: {r}")
+    if not roots:
+        log("ERROR: nothing to watch")
+        return 1
+    rules = None
+    if args.rules:
+        try:
+            rules = tag_audio_lang.load_rules(Path(args.rules))
+        except (OSError, ValueError) as e:
+            log(f"ERROR: bad rules file: {e}")
+            return 1
+        media_probe.configure_cache(Path(args.probe_cache))
+        tag_audio_lang.which_or_die("ffprobe", "ffmpeg")
+        tag_audio_lang.which_or_die("ffmpeg", "ffmpeg")
+    io_sched.configure(args.io_per_device, args.max_io_rate, args.io_idle)
+    metrics_port = args.metrics_port if args.metrics_port is not None else media_metrics.env_port()
+    if metrics_port:
+        media_metrics.serve(metrics_port)
+
+    stop = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stop.set())
+
+    watcher = fs_watch.open_watcher(roots, poll=args.poll, interval=args.poll_interval)
+    queue = FolderQueue(roots, args.debounce)
+    worker = FolderWorker(args, rules, tv_roots)
+    running: Dict[str, Future] = {}
+    log(f"watching {', '.join(roots)} ({type(watcher).__name__}, debounce {args.debounce:g}s, "
+        f"{args.workers} workers, {'APPLY' if args.apply else 'DRY-RUN'})")
+
+    with ThreadPoolExecutor(max_workers=max(args.workers, 1), thread_name_prefix="watch") as pool:
+        try:
+            while not stop.is_set():
+                now = time.monotonic()
+                for path in watcher.read(timeout=1.0):
+                    queue.touch(path, now)
+                if watcher.overflowed:
+                    watcher.overflowed = False
+                    log("WARN: inotify queue overflowed; events were lost, run fix_movie_subs.py / tag_audio_lang.py by hand")
+
+                for folder, fut in list(running.items()):
+                    if not fut.done():
+                        continue
+                    del running[folder]
+                    try:
+                        queue.done[folder] = fut.result()
+                        media_metrics.inc("folders_total", result="ok")
+                    except run_journal.JournalBusy:
+                        log(f"journal busy, retrying later: {folder}")
+                        queue.touch(folder, now)
+                    except SystemExit as e:
+                        # sys.exit() deep in a worker (e.g. a tool missing from PATH) fails this folder, not the daemon
+                        log(f"ERROR: {folder}: worker exited with status {e.code}")
+                        media_metrics.inc("folders_total", result="failed")
+                    except Exception as e:
+                        log(f"ERROR: {folder}: {e}")
+                        media_metrics.inc("folders_total", result="failed")
+
+                for folder in queue.ready(now, set(running), max(args.workers, 1) - len(running)):
+                    running[folder] = pool.submit(worker, folder)
+        finally:
+            log(f"stopping; waiting for {len(running)} folder(s)")
+            watcher.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
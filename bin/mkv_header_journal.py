@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Header-region journal for MKV rollback (instead of a whole-file backup).
+
+mkvpropedit rewrites the track headers in place: it touches the EBML/Segment headers,
+SeekHead, Info, Tracks and the Void elements it grows into, and appends an element at
+EOF when one no longer fits. The journal snapshots exactly those byte ranges plus the
+original length, so backup I/O per file is a few KB regardless of movie size.
+The same journal covers in-place MP4 edits (mp4_boxes.py), given their patch ranges.
+
+Journal file: one JSON line {"version", "size", "atime_ns", "mtime_ns", "ranges"},
+followed by the raw bytes of each range in order.
+"""
+
+import json
+import mmap
+import os
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import ebml
+
+JOURNAL_VERSION = 1
+JOURNALED_IDS = {ebml.SEEKHEAD, ebml.INFO, ebml.TRACKS, ebml.VOID}
+
+def merge_ranges(ranges: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    out: List[List[int]] = []
+    for off, length in sorted(ranges):
+        if out and off <= out[-1][0] + out[-1][1]:
+            out[-1][1] = max(out[-1][1], off + length - out[-1][0])
+        else:
+            out.append([off, length])
+    return [(o, l) for o, l in out]
+
+def header_ranges(buf) -> List[Tuple[int, int]]:
+    """Byte ranges mkvpropedit may rewrite for a track-header edit."""
+    seg, leading, sought = ebml.header_layout(buf)
+    end = ebml.segment_end(buf, seg)
+    ranges = [(0, seg.data_offset)]  # EBML header + Segment id/size (size changes on append)
+    for el in leading:
+        if el.id in JOURNALED_IDS:
+            ranges.append((el.offset, min(el.end, end) - el.offset))
+    for els in sought.values():
+        for el in els:
+            ranges.append((el.offset, min(el.end, end) - el.offset))
+            # a Void right after a relocated element is where it grows
+            if el.end < end:
+                nxt = ebml.read_element(buf, el.end)
+                if nxt.id == ebml.VOID:
+                    ranges.append((nxt.offset, min(nxt.end, end) - nxt.offset))
+    return merge_ranges(ranges)
+
+def write_journal(file_path: Path, journal_path: Path, ranges: Optional[List[Tuple[int, int]]] = None) -> int:
+    """
+    Snapshot the header ranges of file_path (or the given (offset, length) ranges)
+    into journal_path (fsync'd). Returns journal size.
+    """
+    st = file_path.stat()
+    with file_path.open("rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        ranges = header_ranges(mm) if ranges is None else merge_ranges(ranges)
+        meta = {"version": JOURNAL_VERSION, "size": st.st_size, "atime_ns": st.st_atime_ns,
+                "mtime_ns": st.st_mtime_ns, "ranges": ranges}
+        with journal_path.open("wb") as j:
+            j.write((json.dumps(meta) + "\n").encode())
+            for off, length in ranges:
+                j.write(mm[off:off + length])
+            j.flush()
+            os.fsync(j.fileno())
+    return journal_path.stat().st_size
+
+def restore_journal(journal_path: Path, file_path: Path):
+    """Patch the journaled ranges back into file_path and cut anything appended after it."""
+    with journal_path.open("rb") as j:
+        meta = json.loads(j.readline())
+        if meta.get("version") != JOURNAL_VERSION:
+            raise ValueError(f"unsupported journal version in {journal_path}")
+        with file_path.open("r+b") as f:
+            for off, length in meta["ranges"]:
+                data = j.read(length)
+                if len(data) != length:
+                    raise ValueError(f"truncated journal {journal_path}")
+                f.seek(off)
+                f.write(data)
+            f.truncate(meta["size"])
+            f.flush()
+            os.fsync(f.fileno())
+    os.utime(file_path, ns=(meta["atime_ns"], meta["mtime_ns"]))
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Minimal ISO-BMFF (MP4/M4V) box reader and in-place track metadata patcher.
+
+Reads only box headers plus moov/trak/{tkhd, mdia/{mdhd, hdlr}, udta/name}, so
+inspecting a multi-GB MP4 costs a few KB. Audio and subtitle traks are edited from one
+change-set (track_edits.py); edits never move a byte of moov:
+- tkhd flags: bit 0x1 (track enabled) is what ffmpeg reads/writes as "default"
+- mdhd language: packed ISO-639-2 code, fixed 2 bytes
+- udta/name (track title): rewritten in its own slot; a shorter title leaves a
+  'free' box (or NUL padding) in the rest of the slot
+Anything that would need moov to grow (no name box yet, longer title, elng box,
+non ISO-639 language) raises NeedsRemux and the caller falls back to ffmpeg.
+"""
+
+import mmap
+import os
+import struct
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+TKHD_ENABLED = 0x1
+# hdlr types per change-set kind ('sbtl': mov_text in MP4, 'text': QuickTime text)
+HANDLERS = {"audio": {"soun"}, "subtitle": {"sbtl", "subt", "text", "clcp"}}
+
+class MP4Error(ValueError): pass
+
+class NeedsRemux(Exception):
+    """The edit does not fit in the existing boxes."""
+
+@dataclass
+class Box:
+    type: str
+    offset: int        # absolute offset of the size field
+    header_size: int   # 8, or 16 with a 64-bit size
+    size: int          # whole box, header included
+
+    @property
+    def data_offset(self) -> int:
+        return self.offset + self.header_size
+
+    @property
+    def end(self) -> int:
+        return self.offset + self.size
+
+@dataclass
+class Track:
+    index: int                  # trak order == ffprobe stream index
+    handler: str                # 'soun', 'vide', 'subt', ...
+    tkhd: Box
+    mdhd: Box
+    name: Optional[Box] = None  # udta/name (title)
+    name_slot_end: int = 0      # end of name plus any 'free' boxes right after it
+    elng: bool = False          # extended language box present
+
+def read_box(buf, pos: int, limit: int) -> Box:
+    if pos + 8 > limit:
+        raise MP4Error(f"truncated box header at {pos}")
+    size, kind = struct.unpack_from(">I4s", buf, pos)
+    header = 8
+    if size == 1:
+        if pos + 16 > limit:
+            raise MP4Error(f"truncated 64-bit box header at {pos}")
+        size, = struct.unpack_from(">Q", buf, pos + 8)
+        header = 16
+    elif size == 0:
+        size = limit - pos  # extends to the end of the parent / file
+    if size < header or pos + size > limit:
+        raise MP4Error(f"box '{kind.decode('latin-1')}' at {pos} has bad size {size}")
+    return Box(kind.decode("latin-1"), pos, header, size)
+
+def iter_boxes(buf, start: int, end: int) -> Iterator[Box]:
+    pos = start
+    while pos + 8 <= end:
+        box = read_box(buf, pos, end)
+        yield box
+        pos = box.end
+
+def child(buf, parent: Box, kind: str) -> Optional[Box]:
+    for box in iter_boxes(buf, parent.data_offset, parent.end):
+        if box.type == kind:
+            return box
+    return None
+
+def find_moov(buf) -> Box:
+    for box in iter_boxes(buf, 0, len(buf)):
+        if box.type == "moov":
+            return box
+    raise MP4Error("no moov box")
+
+def decode_language(packed: int) -> str:
+    if packed < 0x400:  # QuickTime Macintosh language code, not ISO-639
+        return ""
+    return "".join(chr(((packed >> s) & 0x1F) + 0x60) for s in (10, 5, 0))
+
+def encode_language(code: str) -> int:
+    if len(code) != 3 or not all("a" <= c <= "z" for c in code):
+        raise NeedsRemux(f"language {code!r} is not a 3-letter ISO-639-2 code")
+    return sum((ord(c) - 0x60) << s for c, s in zip(code, (10, 5, 0)))
+
+def _mdhd_language_offset(buf, mdhd: Box) -> int:
+    version = buf[mdhd.data_offset]
+    return mdhd.data_offset + (32 if version == 1 else 20)
+
+def _title_slot(buf, udta: Optional[Box]) -> Tuple[Optional[Box], int]:
+    name, end = None, 0
+    for box in iter_boxes(buf, udta.data_offset, udta.end) if udta else ():
+        if name is None and box.type == "name":
+            name, end = box, box.end
+        elif name is not None:
+            if box.type != "free":
+                break
+            end = box.end  # left behind by an earlier, shorter title
+    return name, end
+
+def parse_tracks(buf) -> List[Track]:
+    moov = find_moov(buf)
+    tracks = []
+    for trak in (b for b in iter_boxes(buf, moov.data_offset, moov.end) if b.type == "trak"):
+        tkhd, mdia, udta = child(buf, trak, "tkhd"), child(buf, trak, "mdia"), child(buf, trak, "udta")
+        mdhd = child(buf, mdia, "mdhd") if mdia else None
+        hdlr = child(buf, mdia, "hdlr") if mdia else None
+        if tkhd is None or mdhd is None or hdlr is None:
+            raise MP4Error(f"trak at {trak.offset} is missing tkhd/mdhd/hdlr")
+        handler = bytes(buf[hdlr.data_offset + 8:hdlr.data_offset + 12]).decode("latin-1")
+        name, name_slot_end = _title_slot(buf, udta)
+        tracks.append(Track(index=len(tracks), handler=handler, tkhd=tkhd, mdhd=mdhd, name=name,
+                            name_slot_end=name_slot_end, elng=child(buf, mdia, "elng") is not None))
+    return tracks
+
+def track_title(buf, track: Track) -> str:
+    if track.name is None:
+        return ""
+    return bytes(buf[track.name.data_offset:track.name.end]).decode("utf-8", "replace").rstrip("\0")
+
+def _name_patch(buf, track: Track, title: str) -> Tuple[int, bytes]:
+    slot = track.name
+    if slot is None or slot.header_size != 8:
+        raise NeedsRemux("track has no title box to rewrite")
+    if bytes(buf[slot.data_offset + 4:slot.data_offset + 8]) == b"data":
+        raise NeedsRemux("iTunes-style title box")
+    raw = title.encode("utf-8")
+    new = struct.pack(">I4s", 8 + len(raw), b"name") + raw
+    spare = track.name_slot_end - slot.offset - len(new)
+    if spare < 0:
+        raise NeedsRemux("title does not fit in the existing title box")
+    if spare < 8:
+        # too small for a 'free' box: NUL-pad the title (readers stop at the NUL)
+        return slot.offset, struct.pack(">I4s", 8 + len(raw) + spare, b"name") + raw + b"\0" * spare
+    return slot.offset, new + struct.pack(">I4s", spare, b"free") + b"\0" * (spare - 8)
+
+def plan_track_edits(buf, changes) -> List[Tuple[int, bytes]]:
+    """
+    Patches (offset, new bytes) applying a change-set (track_edits.TrackChange list:
+    kind, ff_index = trak order, language/title/default, None = leave alone). Unchanged
+    bytes are not included. Raises NeedsRemux when moov would have to grow or a field
+    has no slot in the boxes (the forced flag).
+    """
+    tracks = parse_tracks(buf)
+    patches = []
+    for c in changes:
+        if not 0 <= c.ff_index < len(tracks) or tracks[c.ff_index].handler not in HANDLERS[c.kind]:
+            raise NeedsRemux(f"stream {c.ff_index} is not a {c.kind} trak")
+        if c.forced is not None:
+            raise NeedsRemux("MP4 tracks have no forced flag")
+        t = tracks[c.ff_index]
+        if c.default is not None:
+            flags_off = t.tkhd.data_offset + 1
+            flags = int.from_bytes(buf[flags_off:flags_off + 3], "big")
+            want = flags | TKHD_ENABLED if c.default else flags & ~TKHD_ENABLED
+            if want != flags:
+                patches.append((flags_off, want.to_bytes(3, "big")))
+        if c.language is not None:
+            if t.elng:
+                raise NeedsRemux("track has an extended language (elng) box")
+            lang_off = _mdhd_language_offset(buf, t.mdhd)
+            packed = encode_language(c.language)
+            if int.from_bytes(buf[lang_off:lang_off + 2], "big") & 0x7FFF != packed:
+                patches.append((lang_off, packed.to_bytes(2, "big")))
+        if c.title is not None and track_title(buf, t) != c.title:
+            patches.append(_name_patch(buf, t, c.title))
+    return patches
+
+def plan_file(path: Path, changes) -> List[Tuple[int, bytes]]:
+    with path.open("rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        return plan_track_edits(mm, changes)
+
+def apply_patches(path: Path, patches: List[Tuple[int, bytes]]):
+    """Write the patches through a shared mapping and make them durable."""
+    if not patches:
+        return
+    with path.open("r+b") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_WRITE) as mm:
+        for off, data in patches:
+            mm[off:off + len(data)] = data
+        mm.flush()
+        os.fsync(f.fileno())
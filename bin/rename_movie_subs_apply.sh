@@ -1,12 +1,15 @@
 #!/usr/bin/env bash
 set -euo pipefail
 ROOT="/srv/media/movies"
+BIN="$(dirname -- "$(readlink -f -- "$0")")"
 shopt -s nullglob nocaseglob
 
 find "$ROOT" -mindepth 1 -maxdepth 1 -type d -print0 | while IFS= read -r -d '' dir; do
   vids=( "$dir"/*.{mkv,mp4,m4v,avi,mov} )
   [ ${#vids[@]} -eq 0 ] && continue
-  main="$(printf '%s\n' "${vids[@]}" | xargs -I{} du -b "{}" 2>/dev/null | sort -nr | head -n1 | cut -f2-)"
+  # largest video, identical copies counted once (content fingerprints, cached)
+  main="$(python3 "$BIN/media_fingerprint.py" main "$dir")"
+  [ -n "$main" ] || continue
   base="${main%.*}"
   for s in "$dir"/*.srt "$dir"/*.SRT; do
     [ -e "$s" ] || continue
@@ -1,14 +1,17 @@
 #!/usr/bin/env bash
 set -euo pipefail
 ROOT="/srv/media/movies"
+BIN="$(dirname -- "$(readlink -f -- "$0")")"
 shopt -s nullglob nocaseglob
 
 # Look at each movie folder (one level down)
 find "$ROOT" -mindepth 1 -maxdepth 1 -type d -print0 | while IFS= read -r -d '' dir; do
-  # Pick the largest video file in the folder as the main movie
+  # Pick the largest video file in the folder as the main movie (identical copies
+  # counted once; content fingerprints, cached)
   vids=( "$dir"/*.{mkv,mp4,m4v,avi,mov} )
   [ ${#vids[@]} -eq 0 ] && continue
-  main="$(printf '%s\n' "${vids[@]}" | xargs -I{} du -b "{}" 2>/dev/null | sort -nr | head -n1 | cut -f2-)"
+  main="$(python3 "$BIN/media_fingerprint.py" main "$dir")"
+  [ -n "$main" ] || continue
   base="${main%.*}"
 
   # For every .srt next to the movie, propose a rename to match the video base
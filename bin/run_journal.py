@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Crash-safe write-ahead journal for file-modifying runs.
+
+Each operation (backup intent, backup done, temp file, replace, done, revert) is
+appended as one fsync'd JSON line *before* the filesystem change it describes, so a
+run killed mid-way (OOM, SSH drop, kill -9) can be rolled back on the next start.
+
+- One run at a time per journal file (flock); a live run blocks others
+- Runs without an 'end' record are incomplete and must be recovered first
+- The journal is truncated once every run in it has ended
+"""
+
+import fcntl
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List
+
+class JournalBusy(RuntimeError): pass
+
+class RunJournal:
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._f = self.path.open("a+")
+        try:
+            fcntl.flock(self._f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._f.close()
+            raise JournalBusy(f"another run holds {self.path}")
+        self.run_id = ""
+        self._lock = threading.Lock()  # edits on different disks run on their own threads
+
+    def records(self) -> List[Dict]:
+        self._f.seek(0)
+        out = []
+        for line in self._f:
+            try:
+                out.append(json.loads(line))
+            except json.JSONDecodeError:
+                break  # torn last line from a crash mid-write
+        return out
+
+    def incomplete_runs(self) -> "OrderedDict[str, List[Dict]]":
+        runs: "OrderedDict[str, List[Dict]]" = OrderedDict()
+        ended = set()
+        for r in self.records():
+            if r.get("op") == "end":
+                ended.add(r.get("run"))
+            runs.setdefault(r.get("run"), []).append(r)
+        for run_id in ended:
+            runs.pop(run_id, None)
+        return runs
+
+    def write(self, op: str, run: str = "", **fields):
+        rec = {"op": op, "run": run or self.run_id, "ts": time.time(), **fields}
+        with self._lock:
+            self._f.seek(0, os.SEEK_END)
+            self._f.write(json.dumps(rec) + "\n")
+            self._f.flush()
+            os.fsync(self._f.fileno())
+
+    def begin(self, argv: List[str]):
+        self.run_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+        self.write("begin", pid=os.getpid(), argv=argv)
+
+    def end(self, status: str, run: str = ""):
+        self.write("end", run=run, status=status)
+
+    def compact(self):
+        """Drop the journal contents once no incomplete run is left."""
+        if not self.incomplete_runs():
+            self._f.truncate(0)
+            self._f.flush()
+            os.fsync(self._f.fileno())
+
+    def close(self):
+        fcntl.flock(self._f.fileno(), fcntl.LOCK_UN)
+        self._f.close()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Offline subtitle language detection from file content (no network, no models).
+
+- reads only the first READ_BYTES of each .srt; cue numbers, timings and tags dropped
+- scores stopword hits per language plus a few language-specific characters,
+  and detects Cyrillic/Hangul/Kana/Han text by Unicode script
+- results cached in SQLite by content hash (head bytes + size), with a path/stat
+  shortcut so an unchanged file costs one stat(); a renamed file is a hash hit
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import sys
+import threading
+from pathlib import Path
+from typing import Optional, Tuple
+
+import media_metrics
+
+READ_BYTES = 64 * 1024
+MIN_HITS = 12          # stopword hits needed before trusting a latin-script guess
+MIN_MARGIN = 1.5       # best score must beat the runner-up by this factor
+DEFAULT_CACHE_PATH = Path(os.environ.get("SUB_DETECT_CACHE", "/srv/cache/media-tools/sub_detect.sqlite"))
+DETECTOR_VERSION = 1   # bump to invalidate cached results when scoring changes
+
+# ISO 639-1 codes, same vocabulary as sub_lang.LANG_MAP values
+STOPWORDS = {
+    'en': "the you i to and a of it is that in what this me we don't know not be have for your on are was he my just no with do can all so but there they here get right about like".split(),
+    'es': "que de no la el y es en un lo a los se por qué me una te las con para mi está pero eso del bien sí esto cómo ya muy tu hay todo aquí".split(),
+    'pt': "que não de o a é e um se você eu para uma com do da os me isso está em mas por no na vai bem sim aqui como ele ela meu".split(),
+    'fr': "je de est pas le vous la tu que un il et à ne les ce en on ça une pour qui moi mais me nous bien suis elle dans oui avec c'est".split(),
+    'it': "non di che è e la il un per mi a sono ti ma cosa no si lo questo ho bene come io una sei qui le del hai mio della".split(),
+    'de': "ich sie das ist du nicht die und es der wir was zu ein in mir mit ja den wie auf mich hier dich so eine haben noch auch".split(),
+}
+# characters that (almost) only one of the latin-script languages uses
+CHAR_HINTS = {'ñ': 'es', '¿': 'es', '¡': 'es', 'ã': 'pt', 'õ': 'pt', 'ß': 'de', 'ä': 'de', 'ö': 'de', 'ü': 'de',
+              'è': 'it', 'ò': 'it', 'ù': 'it', 'ê': 'fr', 'î': 'fr', 'ô': 'fr', 'û': 'fr', 'œ': 'fr'}
+CHAR_WEIGHT = 0.5
+
+_WORD_INDEX = {}
+for _lang, _words in STOPWORDS.items():
+    for _w in _words:
+        _WORD_INDEX.setdefault(_w, []).append(_lang)
+
+_TIMING = re.compile(r'^\s*\d+\s*$|-->', re.M)
+_TAGS = re.compile(r'<[^>]*>|\{[^}]*\}')
+_WORDS = re.compile(r"[^\W\d_]+(?:'[^\W\d_]+)?")
+_SCRIPTS = [
+    ('ja', re.compile(r'[぀-ヿ]')),   # hiragana/katakana (checked before Han)
+    ('ko', re.compile(r'[가-힯]')),
+    ('zh', re.compile(r'[一-鿿]')),
+    ('ru', re.compile(r'[Ѐ-ӿ]')),
+]
+
+# ---------- text ----------
+
+def decode(raw: bytes) -> str:
+    if raw.startswith((b'\xff\xfe', b'\xfe\xff')):
+        return raw.decode('utf-16', errors='replace')
+    try:
+        return raw.decode('utf-8-sig')
+    except UnicodeDecodeError as e:
+        if e.start >= len(raw) - 3:  # cut mid-character at READ_BYTES
+            return raw[:e.start].decode('utf-8-sig', errors='replace')
+        return raw.decode('cp1252', errors='replace')  # common for older Spanish/European subs
+
+def dialogue(text: str) -> str:
+    lines = [l for l in text.splitlines() if l.strip() and not _TIMING.search(l)]
+    return _TAGS.sub(' ', '\n'.join(lines))
+
+def score_text(text: str) -> Optional[Tuple[str, float]]:
+    """Text -> (ISO 639-1 code, confidence 0..1), or None when the evidence is too thin."""
+    text = dialogue(text)
+    for lang, rx in _SCRIPTS:
+        hits = len(rx.findall(text))
+        if hits >= 20:
+            return lang, min(hits / max(len(text), 1) * 2, 1.0)
+    scores = dict.fromkeys(STOPWORDS, 0.0)
+    lower = text.lower()
+    for w in _WORDS.findall(lower):
+        for lang in _WORD_INDEX.get(w, ()):
+            scores[lang] += 1
+    for ch, lang in CHAR_HINTS.items():
+        n = lower.count(ch)
+        if n:
+            scores[lang] += n * CHAR_WEIGHT
+    ranked = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)
+    (best, top), (_, second) = ranked[0], ranked[1]
+    if top < MIN_HITS or top < second * MIN_MARGIN:
+        return None
+    return best, round(1 - second / top, 3)
+
+# ---------- cache ----------
+
+class DetectCache:
+    """content hash -> result, plus path -> (size, mtime_ns, hash) so unchanged files skip the read."""
+
+    def __init__(self, db_path: Path):
+        db_path = Path(db_path)
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(db_path), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS result (hash TEXT PRIMARY KEY, lang TEXT, confidence REAL, version INTEGER)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS path (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, hash TEXT)")
+        self._db.commit()
+
+    def by_path(self, path: str, st: os.stat_result) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute("SELECT size, mtime_ns, hash FROM path WHERE path = ?", (path,)).fetchone()
+        return row[2] if row and (row[0], row[1]) == (st.st_size, st.st_mtime_ns) else None
+
+    def result(self, digest: str):
+        with self._lock:
+            row = self._db.execute("SELECT lang, confidence FROM result WHERE hash = ? AND version = ?",
+                                   (digest, DETECTOR_VERSION)).fetchone()
+        if row is None:
+            return False, None
+        return True, ((row[0], row[1]) if row[0] else None)
+
+    def put(self, path: str, st: os.stat_result, digest: str, res: Optional[Tuple[str, float]]):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO path VALUES (?, ?, ?, ?)", (path, st.st_size, st.st_mtime_ns, digest))
+            self._db.execute("INSERT OR REPLACE INTO result VALUES (?, ?, ?, ?)",
+                             (digest, res[0] if res else None, res[1] if res else None, DETECTOR_VERSION))
+            self._db.commit()
+
+_cache: Optional[DetectCache] = None
+_cache_configured = False
+
+def configure_cache(db_path: Optional[Path]) -> Optional[DetectCache]:
+    global _cache, _cache_configured
+    _cache_configured = True
+    _cache = None
+    if db_path is not None:
+        try:
+            _cache = DetectCache(db_path)
+        except (OSError, sqlite3.Error) as e:
+            print(f"WARN: detection cache unavailable ({db_path}): {e}", file=sys.stderr)
+    return _cache
+
+def detect_file(path: str) -> Optional[Tuple[str, float]]:
+    """Language of a subtitle file from its first READ_BYTES, cached by content hash."""
+    if not _cache_configured:
+        configure_cache(DEFAULT_CACHE_PATH)
+    st = os.stat(path)
+    if _cache is not None:
+        digest = _cache.by_path(path, st)
+        if digest:
+            hit, res = _cache.result(digest)
+            if hit:
+                media_metrics.cache_lookup("sub_detect", True)
+                return res
+    with open(path, 'rb') as f:
+        raw = f.read(READ_BYTES)
+    digest = hashlib.sha1(raw + st.st_size.to_bytes(8, 'little')).hexdigest()
+    if _cache is not None:
+        hit, res = _cache.result(digest)
+        media_metrics.cache_lookup("sub_detect", hit)
+        if hit:
+            _cache.put(path, st, digest, res)
+            return res
+    res = score_text(decode(raw))
+    if _cache is not None:
+        _cache.put(path, st, digest, res)
+    return res
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Subtitle filename language/flag classifier shared by fix_movie_subs.py and audit_movie_subs.py.
+
+Same results as the old per-call regex loops, but:
+- one tokenizer compiled at import time; each token is a dict/set lookup
+- results memoized per basename in a bounded LRU (season packs repeat names a lot)
+Inputs the token view cannot reproduce exactly (newlines, non-ASCII case folding,
+a literal 'pt-br' in strip_lang_flags_only) take the original regex path.
+"""
+
+import re
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+LRU_SIZE = 65536
+
+# Canonicalize common language tokens -> ISO code
+LANG_MAP = {
+  'en':'en','eng':'en','english':'en',
+  'es':'es','spa':'es','spanish':'es','es-419':'es','es-es':'es',
+  'pt':'pt','por':'pt','pt-br':'pt','ptbr':'pt',
+  'fr':'fr','fra':'fr','french':'fr',
+  'it':'it','ita':'it',
+  'de':'de','deu':'de','ger':'de',
+  'ru':'ru','rus':'ru',
+  'zh':'zh','chi':'zh','chs':'zh','cht':'zh',
+  'ja':'ja','jpn':'ja',
+  'ko':'ko','kor':'ko'
+}
+# language words accepted as the trailing tag (parse_lang_flags' first pass)
+TRAILING_LANGS = {'en','eng','english','es','spa','spanish','fr','fra','french','pt','por','ptbr','pt-br',
+                  'it','ita','de','deu','ger','ru','rus','zh','chi','chs','cht','ja','jpn','ko','kor'}
+MAX_TRAILING = max(map(len, TRAILING_LANGS))
+LANG_KEYS = ['en','eng','english','es','spa','spanish','fr','fra','french','pt','por','pt-br','ptbr','it','ita','de','deu','ger','ru','rus','zh','chi','chs','cht','ja','jpn','ko','kor']
+FLAG_KEYS = ['forced','forcedsub','sdh','hi','hearing']
+FORCED_TOKENS = {'forced', 'forcedsub'}
+HI_TOKENS = {'sdh', 'hi', 'hearing'}
+
+_LOWER_TOKEN = re.compile(r'[a-z0-9]+')
+_LAST_LETTER = re.compile(r'[a-z](?=[^a-z]*$)')
+_SEGMENT = re.compile(r'[A-Za-z0-9]+|[^A-Za-z0-9]+')
+_COLLAPSE = re.compile(r'[^A-Za-z0-9\(\)]+')
+# LANG_MAP keys that span a separator; rank = position in LANG_MAP (first key wins)
+_KEYS = list(LANG_MAP)
+_KEY_RANK = {k: i for i, k in enumerate(_KEYS)}
+_SPANNING = [(i, k, re.compile(r'(?:^|[^a-z0-9])' + re.escape(k) + r'(?:[^a-z0-9]|$)'))
+             for i, k in enumerate(LANG_MAP) if not k.isalnum()]
+
+# ---------- original implementations (fallback path) ----------
+
+_TRAILING_RE = re.compile(r'(en|eng|english|es|spa|spanish|fr|fra|french|pt|por|pt-?br|it|ita|de|deu|ger|ru|rus|zh|chi|chs|cht|ja|jpn|ko|kor)(?!.*[a-z])')
+_ANYWHERE_RES = [(k, re.compile(r'(?:^|[^a-z0-9])' + re.escape(k) + r'(?:[^a-z0-9]|$)')) for k in LANG_MAP]
+_FORCED_RE = re.compile(r'(?:^|[^a-z0-9])(forced|forcedsub)(?:[^a-z0-9]|$)')
+_HI_RE = re.compile(r'(?:^|[^a-z0-9])(sdh|hi|hearing)(?:[^a-z0-9]|$)')
+_STRIP_RES = [re.compile(r'(?i)(?:^|[^A-Za-z0-9])' + re.escape(k) + r'(?:[^A-Za-z0-9]|$)') for k in LANG_KEYS + FLAG_KEYS]
+
+def _parse_lang_flags_regex(n: str) -> Tuple[Optional[str], bool, bool]:
+    m = _TRAILING_RE.search(n)
+    lang = None
+    if m:
+        lang = LANG_MAP.get(m.group(1).replace('-',''), None)
+    if not lang:
+        for k, rx in _ANYWHERE_RES:
+            if rx.search(n):
+                lang = LANG_MAP[k]; break
+    return lang, bool(_FORCED_RE.search(n)), bool(_HI_RE.search(n))
+
+def _strip_lang_flags_regex(s: str) -> str:
+    n = s
+    for rx in _STRIP_RES:
+        n = rx.sub(' ', n)
+    return _COLLAPSE.sub(' ', n).strip().lower()
+
+# ---------- token path ----------
+
+def _trailing_lang(n: str) -> Optional[str]:
+    # the old regex matched the leftmost language word with no [a-z] after it, i.e. the
+    # longest suffix of n that ends at its last letter and is a language word
+    m = _LAST_LETTER.search(n)
+    if not m:
+        return None
+    end = m.end()
+    for p in range(max(end - MAX_TRAILING, 0), end - 1):
+        word = n[p:end]
+        if word in TRAILING_LANGS:
+            return word
+    return None
+
+@lru_cache(maxsize=LRU_SIZE)
+def parse_lang_flags(name: str) -> Tuple[Optional[str], bool, bool]:
+    """Filename -> (ISO language or None, forced, hearing-impaired)."""
+    n = name.lower()
+    if '\n' in n:
+        return _parse_lang_flags_regex(n)
+    lang = None
+    word = _trailing_lang(n)
+    if word:
+        lang = LANG_MAP.get(word.replace('-',''), None)
+    tokens = set(_LOWER_TOKEN.findall(n))
+    if not lang:
+        # look anywhere as a fallback: first LANG_MAP key present as a whole token
+        ranks = [_KEY_RANK[t] for t in tokens if t in _KEY_RANK]
+        if '-' in n:
+            ranks += [i for i, _, rx in _SPANNING if rx.search(n)]
+        if ranks:
+            lang = LANG_MAP[_KEYS[min(ranks)]]
+    return lang, not tokens.isdisjoint(FORCED_TOKENS), not tokens.isdisjoint(HI_TOKENS)
+
+def _strip_pass(seps: List[str], toks: List[str], key: str) -> Tuple[List[str], List[str]]:
+    """One re.sub pass of a boundary-delimited key over [sep, tok, sep, ..., tok, sep]."""
+    out_seps, out_toks = [seps[0]], []
+    prev_avail = True  # char before toks[i] not consumed by the previous match
+    last = len(toks) - 1
+    for i, t in enumerate(toks):
+        before, after = out_seps[-1], seps[i + 1]
+        at_start = i == 0 and seps[0] == ''
+        if (t.lower() == key and (at_start or (before and prev_avail)) and (after or i == last)):
+            # the boundary char on each side is consumed and the match becomes one space
+            out_seps[-1] = (before if at_start else before[:-1]) + ' ' + after[1:]
+            prev_avail = len(after) >= 2
+        else:
+            out_toks.append(t)
+            out_seps.append(after)
+            prev_avail = True
+    return out_seps, out_toks
+
+@lru_cache(maxsize=LRU_SIZE)
+def strip_lang_flags_only(s: str) -> str:
+    """Drop language and forced/SDH tokens, collapse separators, lowercase."""
+    if not s.isascii() or 'pt-br' in s.lower():
+        return _strip_lang_flags_regex(s)
+    segs = _SEGMENT.findall(s)
+    seps, toks = [''], []
+    for seg in segs:
+        if seg[0].isalnum():
+            toks.append(seg)
+            seps.append('')
+        else:
+            seps[-1] = seg
+    present = {t.lower() for t in toks}
+    for key in LANG_KEYS + FLAG_KEYS:
+        if key in present:
+            seps, toks = _strip_pass(seps, toks, key)
+    n = seps[0] + ''.join(t + sp for t, sp in zip(toks, seps[1:]))
+    return _COLLAPSE.sub(' ', n).strip().lower()
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Subtitle -> video matching shared by fix_movie_subs.py and audit_movie_subs.py.
+
+Scores are identical to the old per-pair loops (SequenceMatcher ratio + 0.2 per shared
+release tag + up to 0.4 for long video names), but per folder:
+- every video is normalized and gets its SequenceMatcher (seq2) built once
+- a trigram inverted index seeds the search with the most similar videos
+- O(1) real_quick_ratio / O(n) quick_ratio upper bounds skip videos that cannot win
+TV folders (episode_keys=True): SxxEyy / 1x02 / absolute episode numbers are pulled
+from the names and subs are matched through a key -> video dict; fuzzy scoring only
+runs for subs without a key (or a key shared by several videos).
+main= (a path, e.g. media_fingerprint.main_video()): that video alone gets the
+MAIN_VIDEO_BONUS instead of every video getting a bonus for a long file name.
+"""
+
+import os
+import re
+from collections import Counter
+from difflib import SequenceMatcher
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Tokens that often appear in releases; used to improve matching
+RES_TAGS = ['2160p','1080p','720p','480p','x265','hevc','x264','h264','remux','bluray','web','webrip','web-dl','dvdrip','hdr','hdr10','dv','atmos','dts','aac']
+
+_NON_WORD = re.compile(r'\W+')
+_BRACKETED = re.compile(r'[\[\(][^\]\)]*[\]\)]')
+_NON_ALNUM = re.compile(r'[^a-z0-9]+')
+# applied one by one, in RES_TAGS order, exactly like the original loop
+_RES_TAG_RES = [(t, re.compile(r'(?:^|[^a-z0-9])' + re.escape(t) + r'(?:[^a-z0-9]|$)')) for t in RES_TAGS]
+
+SEED_CANDIDATES = 3
+KEY_MATCH_SCORE = 1.0  # floor for a sub matched by episode key (a "2_English.srt" scores low otherwise)
+MAIN_VIDEO_BONUS = 0.4  # same as the longest possible name bonus
+
+# (season, episode); season None for absolute numbering. First episode of multi-episode files.
+_SXXEYY = re.compile(r'(?<![a-z0-9])s(\d{1,2})[ ._-]?e(\d{1,3})(?!\d)', re.I)
+_NXNN = re.compile(r'(?<![a-z0-9])(\d{1,2})x(\d{2,3})(?![a-z0-9])', re.I)
+_SEASON_EPISODE = re.compile(r'season[ ._-]?(\d{1,2})[ ._-]*episode[ ._-]?(\d{1,3})(?!\d)', re.I)
+# "Show - 012 [1080p]", "Show.E12", "Episode 12", "Show - 05v2"; not H.264 / 1080p / 10bit / years
+_ABSOLUTE = re.compile(r'(?<![a-z0-9])(?<![hx]\.)(?:e|ep|episode)?[ ._-]?(\d{2,4})(?:v\d)?(?![a-z0-9])', re.I)
+_YEAR = re.compile(r'(?:19|20)\d\d$')
+
+EpisodeKey = Tuple[Optional[int], int]
+
+def episode_key(name: str, absolute: bool = True) -> Optional[EpisodeKey]:
+    """Episode key of a file/dir name (no extension): SxxEyy, 1x02, 'Season 1 Episode 2', else absolute."""
+    for rx in (_SXXEYY, _NXNN, _SEASON_EPISODE):
+        m = rx.search(name)
+        if m:
+            return int(m.group(1)), int(m.group(2))
+    if absolute:
+        nums = [m.group(1) for m in _ABSOLUTE.finditer(_BRACKETED.sub(' ', name)) if not _YEAR.match(m.group(1))]
+        if nums:
+            return None, int(nums[-1])  # the title may hold numbers too; the episode comes last
+    return None
+
+def norm_loose(base: str) -> str:
+    """fix_movie_subs.py normalizer: lowercase, punctuation runs -> one space."""
+    return _NON_WORD.sub(' ', base.lower())
+
+def norm_for_score(s: str) -> str:
+    """audit_movie_subs.py normalizer: also drops bracketed text and release tags."""
+    s = s.lower()
+    s = _BRACKETED.sub(' ', s)  # remove bracketed text
+    for t, rx in _RES_TAG_RES:
+        if t in s:
+            s = rx.sub(' ', s)
+    return _NON_ALNUM.sub(' ', s).strip()
+
+def _tags_in(name_lower: str) -> Tuple[bool, ...]:
+    return tuple(t in name_lower for t in RES_TAGS)
+
+def _trigrams(s: str):
+    return {s[i:i + 3] for i in range(len(s) - 2)} if len(s) >= 3 else {s}
+
+class _Video:
+    __slots__ = ("path", "norm", "tags", "len_bonus", "matcher")
+
+    def __init__(self, path: str, normalize: Callable[[str], str], lower_len: bool, main: Optional[str] = None):
+        vbase = os.path.splitext(os.path.basename(path))[0]
+        self.path = path
+        self.norm = normalize(vbase)
+        self.tags = _tags_in(vbase.lower())
+        if main is not None:
+            self.len_bonus = MAIN_VIDEO_BONUS if path == main else 0.0
+        else:
+            # prefer longer video names a bit (often the main cut)
+            self.len_bonus = min(len(vbase.lower() if lower_len else vbase)/200.0, 0.4)
+        self.matcher = SequenceMatcher(None, "", self.norm)
+
+class VideoIndex:
+    """
+    Built once per folder; best() returns the same (video, score) as scoring every
+    video in order and keeping the first strictly-better one.
+    """
+
+    def __init__(self, videos: List[str], normalize: Callable[[str], str] = norm_loose, lower_len: bool = True,
+                 episode_keys: bool = False, main: Optional[str] = None):
+        self.normalize = normalize
+        self.videos = [_Video(v, normalize, lower_len, main) for v in videos]
+        self.by_trigram = {}
+        for i, v in enumerate(self.videos):
+            for g in _trigrams(v.norm):
+                self.by_trigram.setdefault(g, []).append(i)
+        self.by_key: Dict[EpisodeKey, List[int]] = {}
+        self.folder = os.path.dirname(videos[0]) if videos else ""
+        if episode_keys:
+            for i, v in enumerate(self.videos):
+                key = episode_key(os.path.splitext(os.path.basename(v.path))[0])
+                if key:
+                    self.by_key.setdefault(key, []).append(i)
+
+    def sub_key(self, sub_path: str) -> Optional[EpisodeKey]:
+        """Key from the sub's name, else from its folders below the video folder (Subs/<episode>/2_English.srt)."""
+        stem = os.path.splitext(os.path.basename(sub_path))[0]
+        names = [stem]
+        d = os.path.dirname(sub_path)
+        while d and d != self.folder and len(d) > len(self.folder):
+            names.append(os.path.basename(d))
+            d = os.path.dirname(d)
+        for name in names:
+            key = episode_key(name, absolute=False)
+            if key:
+                return key
+        return episode_key(stem)
+
+    def best_by_key(self, sub_path: str) -> Optional[Tuple[str, float]]:
+        """(video, score) when the sub's episode key picks the video; None -> fuzzy match."""
+        hits = self.by_key.get(self.sub_key(sub_path)) if self.by_key else None
+        if not hits:
+            return None
+        sbase = os.path.splitext(os.path.basename(sub_path))[0]
+        s_norm, s_tags = self.normalize(sbase), _tags_in(sbase.lower())
+        best_i, bestscore = -1, -1.0
+        for i in hits:  # several versions of one episode: the usual score decides
+            m = self.videos[i].matcher
+            m.set_seq1(s_norm)
+            score = self._bonus(s_tags, self.videos[i], m.ratio())
+            if score > bestscore:
+                best_i, bestscore = i, score
+        return self.videos[best_i].path, max(bestscore, KEY_MATCH_SCORE)
+
+    def _bonus(self, s_tags: Tuple[bool, ...], v: _Video, base: float) -> float:
+        score = base
+        for st, vt in zip(s_tags, v.tags):
+            if st and vt:
+                score += 0.2
+        score += v.len_bonus
+        return score
+
+    def best(self, sub_path: str) -> Tuple[Optional[str], float]:
+        if not self.videos:
+            return None, -1.0
+        keyed = self.best_by_key(sub_path)
+        if keyed:
+            return keyed
+        sbase = os.path.splitext(os.path.basename(sub_path))[0]
+        s_norm = self.normalize(sbase)
+        s_tags = _tags_in(sbase.lower())
+        la = len(s_norm)
+
+        best_i, bestscore = -1, -1.0
+
+        def consider(i: int, score: float):
+            nonlocal best_i, bestscore
+            if score > bestscore or (score == bestscore and i < best_i):
+                best_i, bestscore = i, score
+
+        def exact(i: int) -> float:
+            m = self.videos[i].matcher
+            m.set_seq1(s_norm)
+            return self._bonus(s_tags, self.videos[i], m.ratio())
+
+        def beaten(i: int, bound: float) -> bool:
+            return bound < bestscore or (bound == bestscore and i > best_i)
+
+        # seed with the videos sharing the most trigrams -> a high bar early
+        shared = Counter()
+        for g in _trigrams(s_norm):
+            for i in self.by_trigram.get(g, ()):
+                shared[i] += 1
+        seeds = [i for i, _ in shared.most_common(SEED_CANDIDATES)]
+        for i in seeds:
+            consider(i, exact(i))
+
+        # O(1) bound from lengths alone, then O(n) multiset bound, then the real ratio
+        bounds = []
+        for i, v in enumerate(self.videos):
+            if i in seeds:
+                continue
+            lb = len(v.norm)
+            rqr = 2.0 * min(la, lb) / (la + lb) if la + lb else 1.0
+            bounds.append((self._bonus(s_tags, v, rqr), i))
+        bounds.sort(key=lambda b: (-b[0], b[1]))
+        for bound, i in bounds:
+            if bound < bestscore:
+                break
+            if beaten(i, bound):
+                continue
+            m = self.videos[i].matcher
+            m.set_seq1(s_norm)
+            if beaten(i, self._bonus(s_tags, self.videos[i], m.quick_ratio())):
+                continue
+            consider(i, self._bonus(s_tags, self.videos[i], m.ratio()))
+        return self.videos[best_i].path, bestscore
+
+def best_video_for(sub_path: str, videos: List[str], normalize: Callable[[str], str] = norm_loose,
+                   lower_len: bool = True) -> Tuple[Optional[str], float]:
+    """One-off match; build a VideoIndex instead when scoring many subs against one folder."""
+    return VideoIndex(videos, normalize, lower_len).best(sub_path)
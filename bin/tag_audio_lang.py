@@ -1,27 +1,71 @@
 #!/usr/bin/env python3
 """
-Tag (and set default) audio language on MKV/MP4 without re-encoding.
+Tag (and set default) audio language, and set subtitle default/forced flags, on MKV/MP4
+without re-encoding.
 
 Adds:
 - Progress bars for big file ops:
   * MKV: backup copy
-  * MP4: ffmpeg remux (reads -progress and shows %)
+  * MP4: ffmpeg remux (ffmpeg_remux.py: pipes drained concurrently, time-throttled
+    redraws, fsync'd temp file next to the original, MB/s reported per file)
 - Quit safely with 'q' at any prompt; full rollback of files touched in this run
 - Language menu: 1) English 2) Spanish 3) Manual; also updates track TITLE to match
 - Backups policy: by default deletes .bak.* after a fully successful run; keep via --keep-backups
+- Probe results cached on disk (media_probe.py); unchanged files are not re-probed
+- Directory walks probe ahead on a bounded pool (--jobs), results consumed in walk order
+- MKV audio tracks are read straight from the Tracks element (ebml.py, a few KB per
+  file, no ffprobe process); files it cannot vouch for fall back to ffprobe
+- Non-interactive --rules mode (YAML/JSON policy) for cron / Sonarr/Radarr hooks,
+  with a JSONL plan (--plan) and a throughput summary
+- Files whose tracks already match the requested language/title/default are skipped
+  before any backup or remux (zero I/O)
+- Backup strategies (--backup-strategy): reflink (FICLONE, btrfs/XFS) → zero-copy
+  copy_file_range/sendfile → chunked copy; the strategy used is recorded for rollback
+- none-header-journal strategy for MKV: journal only the header bytes mkvpropedit
+  rewrites (mkv_header_journal.py) instead of copying the whole file
+- MP4 language/title/default are patched in place (mp4_boxes.py, a few bytes journaled
+  for rollback); ffmpeg remux only when moov would have to grow
+- Prometheus metrics (media_metrics.py): per-phase timings, bytes, ffprobe latency and
+  cache hit rates written as a node_exporter textfile, optionally served on /metrics
+- Write-ahead run journal (run_journal.py): every backup/replace is fsync-logged first,
+  so a killed run can be rolled back (or committed) later with --recover
+- Heavy I/O (backup copies, remuxes) goes through io_sched.py: per-disk slots
+  (--io-per-device), an MB/s cap per disk (--max-io-rate) and optionally the idle I/O
+  class (--io-idle); in --rules mode files on different disks are edited in parallel
+- One change-set per file (track_edits.py) covers audio and subtitle tracks (language,
+  title, default, forced): a single mkvpropedit call or a single remux behind a single
+  backup, instead of one pass per track type
 """
 
 import argparse
+import errno
 import json
 import os
+import re
 import shutil
 import subprocess
 import sys
+import threading
 import time
+from collections import OrderedDict
+from contextlib import contextmanager
 from dataclasses import dataclass, field
 from pathlib import Path
 from typing import Dict, List, Tuple, Optional
 
+import ebml
+import ffmpeg_remux
+import io_sched
+import media_metrics
+import media_probe
+import mkv_header_journal
+import mp4_boxes
+import run_journal
+import track_edits
+from track_edits import TrackChange
+
+DEFAULT_JOURNAL_PATH = Path("/srv/cache/media-tools/tag_audio_lang.journal")
+
 # ---------- small utils ----------
 
 def which_or_die(cmd: str, pkg_hint: str) -> str:
@@ -40,6 +84,20 @@ def is_media_file(p: Path) -> bool:
 
 def human(v): return v if v else "-"
 
+@dataclass
+class IOStats:
+    bytes_written: int = 0
+    bytes_avoided: int = 0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def add(self, written: int = 0, avoided: int = 0):
+        """Thread-safe: edits on different disks run on their own threads."""
+        with self._lock:
+            self.bytes_written += written
+            self.bytes_avoided += avoided
+
+io_stats = IOStats()
+
 def human_bytes(n: int) -> str:
     for unit in ("B","KB","MB","GB","TB"):
         if n < 1024:
@@ -51,6 +109,8 @@ def human_bytes(n: int) -> str:
 
 def print_bar(prefix: str, frac: float, extra: str = ""):
     frac = min(max(frac, 0.0), 1.0)
+    if io_sched.scheduler.active > 1 and frac < 1.0:
+        return  # several disks busy: one \r-line cannot show them all; print only the final bars
     width = 30
     done = int(frac * width)
     bar = "█"*done + "·"*(width-done)
@@ -61,31 +121,117 @@ def print_bar(prefix: str, frac: float, extra: str = ""):
 def end_bar():
     print()  # newline
 
+class FileOutput:
+    """
+    sys.stdout stand-in while run_rules applies files on several disks at once: a
+    thread inside file(name) writes whole lines (and flushed progress bars), each
+    prefixed "[name] ", so lines of concurrent edits interleave but never mix.
+    Other threads write through unchanged.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._open = None  # thread owning an unterminated terminal line (a progress bar)
+
+    @contextmanager
+    def file(self, name: str):
+        local = self._local
+        local.prefix, local.pending, local.at_start = f"[{name}] ", "", True
+        try:
+            yield
+        finally:
+            if local.pending:
+                self._emit(local.pending + "\n")
+            local.prefix, local.pending = None, ""
+
+    def write(self, s: str) -> int:
+        local = self._local
+        if getattr(local, "prefix", None) is None:
+            with self._lock:
+                return self.stream.write(s)
+        local.pending += s
+        if "\n" in local.pending:
+            head, _, local.pending = local.pending.rpartition("\n")
+            self._emit(head + "\n")
+        return len(s)
+
+    def flush(self):
+        local = self._local
+        if getattr(local, "prefix", None) is not None and local.pending:
+            self._emit(local.pending)
+            local.pending = ""
+        with self._lock:
+            self.stream.flush()
+
+    def _emit(self, text: str):
+        local = self._local
+        out = []
+        for piece in re.split(r"([\r\n])", text):
+            if piece in ("\r", "\n"):
+                local.at_start = True
+            elif piece:
+                if local.at_start:
+                    out.append(local.prefix)
+                local.at_start = False
+            out.append(piece)
+        out = "".join(out)
+        me = threading.get_ident()
+        with self._lock:
+            if self._open not in (None, me):
+                self.stream.write("\n")  # end another file's progress bar first
+            self.stream.write(out)
+            self._open = None if out.endswith("\n") else me
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
 # ---------- rollback tracker ----------
 
 @dataclass
 class Change:
     original: Path
     backup: Path
+    strategy: str = "copy"  # how the backup was made: reflink / copy_file_range / sendfile / chunked / header-journal
+
+    def restore(self):
+        if self.strategy == "header-journal":
+            mkv_header_journal.restore_journal(self.backup, self.original)
+            self.backup.unlink()
+        else:
+            self.backup.replace(self.original)
 
 @dataclass
 class ChangeTracker:
     keep_backups: bool = False
+    backup_strategy: str = "auto"
+    journal: Optional[run_journal.RunJournal] = None
     changes: List[Change] = field(default_factory=list)
 
-    def record_backup(self, original: Path, backup: Path):
+    def log(self, op: str, **fields):
+        """Write-ahead record; call before the filesystem change it describes."""
+        if self.journal is not None:
+            self.journal.write(op, **{k: str(v) if isinstance(v, Path) else v for k, v in fields.items()})
+
+    def record_backup(self, original: Path, backup: Path, strategy: str = "copy"):
         for c in self.changes:
             if c.original == original:
                 return
-        self.changes.append(Change(original=original, backup=backup))
+        self.log("backup_ok", original=original, backup=backup, strategy=strategy)
+        self.changes.append(Change(original=original, backup=backup, strategy=strategy))
+
+    def revert_file(self, c: Change):
+        c.restore()
+        self.log("reverted", original=c.original)
 
     def revert_all(self):
         print("\nReverting all changes from this run...")
         for c in self.changes:
             try:
                 if c.backup.exists():
-                    c.backup.replace(c.original)
-                    print(f"  restored: {c.original}")
+                    self.revert_file(c)
+                    print(f"  restored: {c.original} ({c.strategy} backup)")
             except Exception as e:
                 print(f"  WARN: failed to restore {c.original}: {e}")
         print("Rollback complete.")
@@ -102,165 +248,262 @@ class ChangeTracker:
             except Exception as e:
                 print(f"  WARN: failed to delete backup {c.backup}: {e}")
 
+    def finish(self, status: str):
+        """Close the run in the journal; an ended run never needs recovery."""
+        if self.journal is not None:
+            self.journal.end(status)
+            self.journal.compact()
+            self.journal.close()
+            self.journal = None
+
 # ---------- probing ----------
 
 def ffprobe_streams(file_path: Path) -> List[Dict]:
-    ffprobe = which_or_die("ffprobe", "ffmpeg")
-    code, out, err = run([
-        ffprobe, "-v", "error",
-        "-show_entries", "stream=index,codec_type,codec_name,channels,channel_layout:stream_tags=language,title",
-        "-of", "json", str(file_path)
-    ])
-    if code != 0:
-        raise RuntimeError(f"ffprobe failed: {err.strip()}")
-    data = json.loads(out or "{}")
-    return data.get("streams", [])
-
-def list_audio_streams(file_path: Path) -> List[Dict]:
-    streams = ffprobe_streams(file_path)
-    audio = []
-    for s in streams:
-        if s.get("codec_type") != "audio":
-            continue
-        tags = s.get("tags") or {}
-        audio.append({
-            "ff_index": s.get("index"),
-            "codec": s.get("codec_name"),
-            "channels": s.get("channels"),
-            "layout": s.get("channel_layout"),
-            "language": (tags.get("language") or "und"),
-            "title": tags.get("title", "")
-        })
-    return audio
+    # one cached ffprobe call (-show_streams -show_format) per file; see media_probe.py
+    return media_probe.probe(file_path).get("streams", [])
+
+native_mkv = True  # MKV tracks from the Tracks element (ebml.py); False = always ffprobe
+
+def list_streams(file_path: Path, probed: Optional[Dict] = None) -> track_edits.Tracks:
+    """{"audio": [...], "subtitle": [...]} stream dicts; probed = ffprobe data already at hand."""
+    if probed is None and native_mkv and file_path.suffix.lower() == ".mkv":
+        with media_metrics.phase("probe"):
+            try:
+                audio, subs = ebml.read_track_streams(file_path)
+            except (ebml.EBMLError, ValueError, OSError) as e:
+                media_metrics.inc("mkv_tracks_total", source="ffprobe")
+                print(f"Native MKV read not possible ({e}); using ffprobe.")
+            else:
+                media_metrics.inc("mkv_tracks_total", source="ebml")
+                return {"audio": audio, "subtitle": subs}
+    data = probed if probed is not None else media_probe.probe(file_path)
+    return {"audio": media_probe.audio_streams(data), "subtitle": media_probe.subtitle_streams(data)}
 
 def ffprobe_duration_seconds(file_path: Path) -> Optional[float]:
-    ffprobe = which_or_die("ffprobe", "ffmpeg")
-    code, out, err = run([ffprobe, "-v", "error", "-show_entries", "format=duration", "-of", "default=nw=1:nk=1", str(file_path)])
-    if code != 0: return None
     try:
-        return float(out.strip())
+        return media_probe.duration_seconds(media_probe.probe(file_path))
     except Exception:
         return None
 
 # ---------- file ops with progress ----------
 
-def copy_with_progress(src: Path, dst: Path, label: str = "Backing up"):
+BACKUP_STRATEGIES = ("auto", "reflink", "copy", "none-header-journal")
+FICLONE = 0x40049409  # _IOW(0x94, 9, int) from linux/fs.h
+# errors meaning "this zero-copy syscall can't do this pair of files", not "the copy failed"
+ZERO_COPY_FALLBACK_ERRNOS = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EBADF, errno.ENOTSUP}
+
+def reflink(src: Path, dst: Path) -> bool:
+    """Copy-on-write clone of src into dst (btrfs/XFS). False if the filesystem can't."""
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    try:
+        with src.open("rb") as r, dst.open("wb") as w:
+            fcntl.ioctl(w.fileno(), FICLONE, r.fileno())
+    except OSError:
+        try:
+            dst.unlink()
+        except FileNotFoundError:
+            pass
+        return False
+    shutil.copystat(src, dst)
+    return True
+
+def copy_with_progress(src: Path, dst: Path, label: str = "Backing up") -> str:
+    """
+    Copy src -> dst with a progress bar. Tries os.copy_file_range, then os.sendfile
+    (both stay in the kernel), then a chunked read/write loop. Returns the method used.
+    Holds an io_sched slot on dst's disk and stays under its rate cap.
+    """
+    with io_sched.scheduler.slot(dst) as device:
+        return _copy_with_progress(src, dst, label, device)
+
+def _copy_with_progress(src: Path, dst: Path, label: str, device: io_sched.Device) -> str:
     total = src.stat().st_size
     copied = 0
-    chunk = 16 * 1024 * 1024  # 16MB
+    chunk = io_sched.THROTTLED_CHUNK if io_sched.scheduler.limited else 16 * 1024 * 1024  # 16MB
     start = time.time()
+    method = "chunked"
+
+    def progress(n: int):
+        nonlocal copied
+        device.throttle(n)
+        copied += n
+        io_stats.add(written=n)
+        elapsed = max(time.time() - start, 0.001)
+        speed = f"{human_bytes(int(copied/elapsed))}/s"
+        print_bar(f"{label}: {src.name}", copied/max(total, 1), f"{human_bytes(copied)}/{human_bytes(total)} {speed} [{method}]")
+
     with src.open("rb") as r, dst.open("wb") as w:
-        while True:
-            buf = r.read(chunk)
-            if not buf:
+        rfd, wfd = r.fileno(), w.fileno()
+        for name in ("copy_file_range", "sendfile"):
+            if not hasattr(os, name):
+                continue
+            method = name
+            try:
+                os.lseek(wfd, copied, os.SEEK_SET)
+                while copied < total:
+                    if name == "copy_file_range":
+                        n = os.copy_file_range(rfd, wfd, min(chunk, total - copied), copied, copied)
+                    else:
+                        n = os.sendfile(wfd, rfd, copied, min(chunk, total - copied))
+                    if n == 0:
+                        break
+                    progress(n)
                 break
-            w.write(buf)
-            copied += len(buf)
-            elapsed = max(time.time() - start, 0.001)
-            speed = f"{human_bytes(int(copied/elapsed))}/s"
-            print_bar(f"{label}: {src.name}", copied/total, f"{human_bytes(copied)}/{human_bytes(total)} {speed}")
+            except OSError as e:
+                if e.errno not in ZERO_COPY_FALLBACK_ERRNOS:
+                    raise
+                method = "chunked"
+        if copied < total:
+            r.seek(copied)
+            w.seek(copied)
+            while True:
+                buf = r.read(chunk)
+                if not buf:
+                    break
+                w.write(buf)
+                progress(len(buf))
+        w.truncate(copied)
     shutil.copystat(src, dst)
     end_bar()
+    return method
 
-# ---------- mkv ops ----------
+def fsync_path(path: Path):
+    with path.open("rb") as f:
+        os.fsync(f.fileno())
 
-def mkv_backup(file_path: Path) -> Path:
+def backup_file(file_path: Path, label: str, tracker: ChangeTracker,
+                ranges: Optional[List[Tuple[int, int]]] = None) -> Tuple[Path, str]:
+    """
+    Make a .bak.<ts> (or .hdrj.<ts>) next to file_path, durable on disk before it is
+    recorded. Returns (backup path, method used). `ranges` = the only bytes an in-place
+    edit will touch; those are journaled unless a full copy/reflink was asked for.
+    """
+    with media_metrics.phase("backup"):
+        return _backup_file(file_path, label, tracker, ranges)
+
+def _backup_file(file_path: Path, label: str, tracker: ChangeTracker,
+                 ranges: Optional[List[Tuple[int, int]]]) -> Tuple[Path, str]:
+    strategy = tracker.backup_strategy
     ts = time.strftime("%Y%m%d-%H%M%S")
+    in_place = ranges is not None and strategy in ("auto", "none-header-journal")
+    if strategy == "none-header-journal" or in_place:
+        if in_place or file_path.suffix.lower() == ".mkv":
+            journal = file_path.with_suffix(file_path.suffix + f".hdrj.{ts}")
+            tracker.log("backup", original=file_path, backup=journal)
+            try:
+                size = mkv_header_journal.write_journal(file_path, journal, ranges)
+            except (ebml.EBMLError, ValueError) as e:
+                journal.unlink(missing_ok=True)
+                print(f"WARN: header journal not possible ({e}); falling back to a full backup.")
+            else:
+                io_stats.add(written=size, avoided=max(file_path.stat().st_size - size, 0))
+                print(f"{label}: {file_path.name} header journal {human_bytes(size)}")
+                return journal, "header-journal"
+        strategy = "auto"  # MP4 is rewritten by a remux; needs a real backup
     backup = file_path.with_suffix(file_path.suffix + f".bak.{ts}")
-    copy_with_progress(file_path, backup, label="Backup MKV")
-    return backup
+    tracker.log("backup", original=file_path, backup=backup)
+    method = None
+    if strategy in ("auto", "reflink"):
+        if reflink(file_path, backup):
+            print_bar(f"{label}: {file_path.name}", 1.0, "reflink (copy-on-write, no data copied)")
+            end_bar()
+            method = "reflink"
+        elif strategy == "reflink":
+            raise RuntimeError(f"reflink not supported for {file_path.parent} (use --backup-strategy auto or copy)")
+    if method is None:
+        method = copy_with_progress(file_path, backup, label=label)
+    fsync_path(backup)
+    return backup, method
+
+# ---------- mkv ops ----------
 
-def mkv_apply(file_path: Path, audio_streams: List[Dict], ff_index_selected: int, lang_code: str, title_text: str, tracker: ChangeTracker):
+def mkv_apply(file_path: Path, tracks: track_edits.Tracks, changes: List[TrackChange], tracker: ChangeTracker):
+    """The whole change-set in one mkvpropedit call (track:aN / track:sN = Nth audio / subtitle track)."""
     mkvpropedit = which_or_die("mkvpropedit", "mkvtoolnix")
-    # map ff_index -> ordinal aN among AUDIO streams (1-based)
-    ord_map = {}
-    ordinal = 1
-    for s in audio_streams:
-        ord_map[s["ff_index"]] = ordinal
-        ordinal += 1
-    if ff_index_selected not in ord_map:
-        raise ValueError("Selected index not in audio streams.")
-    sel_ord = ord_map[ff_index_selected]
+    edits = track_edits.mkvpropedit_edits(tracks, changes)  # raises before the backup if a track is missing
 
     # backup first, record for rollback
-    backup = mkv_backup(file_path)
-    tracker.record_backup(file_path, backup)
-
-    edits = []
-    # selected: language + default=1 + name/title
-    edits += ["--edit", f"track:a{sel_ord}", "--set", f"language={lang_code}", "--set", "flag-default=1", "--set", f"name={title_text}"]
-    # others default=0
-    for s in audio_streams:
-        if s["ff_index"] == ff_index_selected: continue
-        ord_i = ord_map[s["ff_index"]]
-        edits += ["--edit", f"track:a{ord_i}", "--set", "flag-default=0"]
+    backup, method = backup_file(file_path, "Backup MKV", tracker)
+    tracker.record_backup(file_path, backup, method)
 
     # mkvpropedit is fast; no progress here
-    code, out, err = run([mkvpropedit, str(file_path)] + edits)
+    with media_metrics.phase("edit"):
+        code, out, err = run([mkvpropedit, str(file_path)] + edits)
     if code != 0:
         raise RuntimeError(f"mkvpropedit failed: {err.strip()}")
 
 # ---------- mp4 ops (ffmpeg with progress) ----------
 
-def ffmpeg_remux_with_progress(src: Path, dst: Path, args: List[str], duration_s: Optional[float]):
+remux_options = ffmpeg_remux.RemuxOptions()
+
+def ffmpeg_remux_with_progress(src: Path, dst: Path, args: List[str], duration_s: Optional[float]) -> ffmpeg_remux.RemuxResult:
     """
-    Run ffmpeg with -progress pipe:1 and show % based on out_time_ms.
+    Remux src into dst (ffmpeg_remux.remux) with a time-throttled progress bar.
     args should contain the mapping/copy/disposition/metadata bits (excluding -i/-progress/-loglevel/-nostats and output).
     """
     ffmpeg = which_or_die("ffmpeg", "ffmpeg")
-    cmd = [ffmpeg, "-y", "-nostats", "-loglevel", "error", "-progress", "pipe:1", "-i", str(src)] + args + [str(dst)]
-    # Use Popen to read progress from stdout
-    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, bufsize=1)
-    frac = 0.0
+
+    def progress(frac: Optional[float], size: int, rate: float):
+        print_bar("Remux MP4", frac if frac is not None else 0.0, f"{human_bytes(size)} {rate:.1f} MB/s")
+
     try:
-        if proc.stdout is not None:
-            for line in proc.stdout:
-                line = line.strip()
-                if line.startswith("out_time_ms=") and duration_s and duration_s > 0:
-                    # out_time_ms is microseconds; convert to seconds
-                    us = int(line.split("=",1)[1])
-                    frac = min(us / (duration_s * 1_000_000.0), 1.0)
-                    print_bar("Remux MP4", frac)
-                elif line.startswith("progress=end"):
-                    frac = 1.0
-                    print_bar("Remux MP4", frac)
-        proc.wait()
+        with media_metrics.phase("remux"), io_sched.scheduler.slot(src) as device:
+            res = ffmpeg_remux.remux(src, dst, args, duration_s, remux_options, progress, ffmpeg=ffmpeg, pace=device.pace)
     finally:
         end_bar()
-    if proc.returncode != 0:
-        _, err = proc.communicate()
-        raise RuntimeError(f"ffmpeg failed with code {proc.returncode}. {err}")
+    print(f"Remux MP4: {human_bytes(res.bytes_out)} in {res.seconds:.1f}s ({res.mb_per_s:.1f} MB/s)")
+    return res
 
-def mp4_apply(file_path: Path, audio_streams: List[Dict], ff_index_selected: int, lang_code: str, title_text: str, tracker: ChangeTracker):
-    # backup original first for rollback
-    ts = time.strftime("%Y%m%d-%H%M%S")
-    backup = file_path.with_suffix(file_path.suffix + f".bak.{ts}")
-    copy_with_progress(file_path, backup, label="Backup MP4")
-    tracker.record_backup(file_path, backup)
+def mp4_apply_in_place(file_path: Path, changes: List[TrackChange], tracker: ChangeTracker) -> bool:
+    """Patch tkhd/mdhd/udta bytes directly (mp4_boxes.py). False when moov would have to grow."""
+    try:
+        patches = mp4_boxes.plan_file(file_path, changes)
+    except mp4_boxes.NeedsRemux as e:
+        print(f"In-place MP4 edit not possible ({e}); remuxing.")
+        return False
+    except (mp4_boxes.MP4Error, ValueError) as e:
+        print(f"WARN: cannot parse MP4 boxes ({e}); remuxing.")
+        return False
+    if not patches:
+        # ffprobe saw a difference the box view does not; let ffmpeg settle it
+        print("In-place MP4 edit found nothing to patch; remuxing.")
+        return False
+    backup, method = backup_file(file_path, "Backup MP4", tracker, ranges=[(off, len(b)) for off, b in patches])
+    tracker.record_backup(file_path, backup, method)
+    with media_metrics.phase("edit"):
+        mp4_boxes.apply_patches(file_path, patches)
+    patched = sum(len(b) for _, b in patches)
+    io_stats.add(written=patched, avoided=max(file_path.stat().st_size - patched, 0))
+    print(f"Patched MP4 in place: {len(patches)} field(s), {patched} bytes")
+    return True
 
-    # find index within audio-only list for ffmpeg's :a:N
-    audio_ff_indices = [s["ff_index"] for s in audio_streams]
-    if ff_index_selected not in audio_ff_indices:
-        raise ValueError("Selected audio index not present.")
-    a_pos = audio_ff_indices.index(ff_index_selected)  # 0-based
+def mp4_apply(file_path: Path, tracks: track_edits.Tracks, changes: List[TrackChange], tracker: ChangeTracker):
+    """The whole change-set as in-place box patches, else as one stream-copy remux."""
+    # ffmpeg's :a:N / :s:N positions; raises before any backup if a track is missing
+    args = track_edits.ffmpeg_args(tracks, changes, media_probe.probe(file_path).get("streams", []))
+
+    if mp4_apply_in_place(file_path, changes, tracker):
+        return
+
+    # backup original first for rollback
+    backup, method = backup_file(file_path, "Backup MP4", tracker)
+    tracker.record_backup(file_path, backup, method)
 
     dst = file_path.with_suffix(".tmp" + file_path.suffix)
     duration_s = ffprobe_duration_seconds(file_path)
 
-    args = [
-        "-map", "0",
-        "-c", "copy",
-        "-disposition:a", "0",
-        "-disposition:a:%d" % a_pos, "default",
-        "-metadata:s:a:%d" % a_pos, f"language={lang_code}",
-        "-metadata:s:a:%d" % a_pos, f"title={title_text}",
-        "-movflags", "use_metadata_tags",
-    ]
-    ffmpeg_remux_with_progress(file_path, dst, args, duration_s)
+    tracker.log("tmp", original=file_path, path=dst)
+    res = ffmpeg_remux_with_progress(file_path, dst, args, duration_s)  # dst is fsync'd
+    io_stats.add(written=res.bytes_out)
 
+    tracker.log("replace", original=file_path, src=dst)
     dst.replace(file_path)
+    ffmpeg_remux.fsync_dir(file_path.parent)
 
-# ---------- prompts / flow ----------
+# ---------- prompts ----------
 
 class UserCancelled(Exception): pass
 
@@ -299,27 +542,181 @@ def prompt_lang_menu(default_code: str = "eng") -> Tuple[str, str]:
         if ans == "3":
             code = prompt_line("Enter language code (e.g., eng, spa, en-US): ")
             # default title guess
-            default_title = {"eng": "English", "spa": "Spanish"}.get(code.lower(), code)
+            default_title = lang_title(code)
             title = input(f"Enter track title (default '{default_title}'): ").strip() or default_title
             return code, title
         print("Please enter 1, 2, 3 or 'q' to cancel.")
 
-def suggest_audio_index(audio_streams: List[Dict]) -> int:
-    eng_idxs = [s["ff_index"] for s in audio_streams
-                if (s["language"] or "").lower().startswith("en") or ("english" in (s["title"] or "").lower())]
-    if eng_idxs:
-        return eng_idxs[0]
+# ISO 639-2/B code (what mkvmerge writes) -> (ISO 639-1 code, display title)
+LANG_INFO = {
+    "eng": ("en", "English"), "spa": ("es", "Spanish"), "fre": ("fr", "French"), "ger": ("de", "German"),
+    "ita": ("it", "Italian"), "por": ("pt", "Portuguese"), "dut": ("nl", "Dutch"), "rus": ("ru", "Russian"),
+    "pol": ("pl", "Polish"), "cze": ("cs", "Czech"), "hun": ("hu", "Hungarian"), "gre": ("el", "Greek"),
+    "tur": ("tr", "Turkish"), "swe": ("sv", "Swedish"), "dan": ("da", "Danish"), "nor": ("no", "Norwegian"),
+    "fin": ("fi", "Finnish"), "ara": ("ar", "Arabic"), "heb": ("he", "Hebrew"), "hin": ("hi", "Hindi"),
+    "tha": ("th", "Thai"), "chi": ("zh", "Chinese"), "jpn": ("ja", "Japanese"), "kor": ("ko", "Korean"),
+}
+# other spellings -> LANG_INFO key: ISO 639-2/T codes and ISO 639-1 codes
+LANG_ALIASES = {"fra": "fre", "deu": "ger", "nld": "dut", "ces": "cze", "ell": "gre", "zho": "chi",
+                **{iso1: code for code, (iso1, _) in LANG_INFO.items()}}
+
+def canonical_lang(code: str) -> Optional[str]:
+    """LANG_INFO key for any spelling of a language ('de', 'deu', 'ger', 'en-US'); None if unknown."""
+    code = (code or "").lower().split("-")[0]
+    return code if code in LANG_INFO else LANG_ALIASES.get(code)
+
+def lang_title(code: str) -> str:
+    known = canonical_lang(code)
+    return LANG_INFO[known][1] if known else code
+
+def same_language(a: str, b: str) -> bool:
+    known = canonical_lang(a)
+    return known == canonical_lang(b) if known else (a or "").lower() == (b or "").lower()
+
+def lang_matches(stream: Dict, code: str) -> bool:
+    """
+    The track is tagged `code` (any spelling), or its title names the language as a
+    whole word ("English" matches, "Dolby Digital" is not 'ita'). Unknown codes
+    ('und', 'xyz') only match the tag itself, never the title.
+    """
+    if same_language(stream["language"] or "", code):
+        return True
+    known = canonical_lang(code)
+    return bool(known) and re.search(rf"\b{re.escape(LANG_INFO[known][1])}\b", stream["title"] or "", re.I) is not None
+
+def suggest_audio_index(audio_streams: List[Dict], lang: str = "eng", prefer: str = "first",
+                        fallback: bool = True) -> Optional[int]:
+    """
+    Pick a track in `lang` (first one, or highest channel count with prefer='channels').
+    Without a match, fall back to the highest-channel track (or None if fallback=False).
+    """
+    matches = [s for s in audio_streams if lang_matches(s, lang)]
+    if matches:
+        if prefer == "channels":
+            return max(matches, key=lambda s: (s.get("channels") or 0, -s["ff_index"]))["ff_index"]
+        return matches[0]["ff_index"]
+    if not fallback:
+        return None
     # fallback: highest channels
     best = max(audio_streams, key=lambda s: (s.get("channels") or 0, -s["ff_index"]))
     return best["ff_index"]
 
-def handle_file(file_path: Path, tracker: ChangeTracker):
+def prompt_subtitle_flags(subs: List[Dict]) -> Tuple[Optional[int], Optional[List[int]]]:
+    """(default, forced) for subtitle_choice(); Enter keeps the current flags."""
+    choices = {str(s["ff_index"]) for s in subs}
+    while True:
+        ans = input("Default subtitle ffprobe index ('n' = none, Enter = keep, 'q' to cancel): ").strip().lower()
+        if ans in {"q", "quit"}: raise UserCancelled
+        if ans == "":
+            default = None
+            break
+        if ans in {"n", "none"}:
+            default = NO_SUBTITLE
+            break
+        if ans in choices:
+            default = int(ans)
+            break
+        print("Invalid selection. Enter one of:", ", ".join(sorted(choices, key=int)), "'n', Enter or 'q'.")
+    while True:
+        ans = input("Forced subtitle ffprobe index(es), comma-separated ('n' = none, Enter = keep): ").strip().lower()
+        if ans in {"q", "quit"}: raise UserCancelled
+        if ans == "":
+            return default, None
+        if ans in {"n", "none"}:
+            return default, []
+        picked = [a.strip() for a in ans.split(",")]
+        if all(a in choices for a in picked):
+            return default, [int(a) for a in picked]
+        print("Invalid selection. Enter one or more of:", ", ".join(sorted(choices, key=int)), "'n', Enter or 'q'.")
+
+# ---------- change-sets ----------
+
+NO_SUBTITLE = -1  # subtitle "index" meaning: no default subtitle track
+
+def audio_choice(audio: List[Dict], chosen: int, lang_code: str, title_text: str) -> List[TrackChange]:
+    """`chosen` becomes the only default audio track, with the given language and title."""
+    if chosen not in [s["ff_index"] for s in audio]:
+        raise ValueError("Selected index not in audio streams.")
+    return [TrackChange("audio", s["ff_index"], language=lang_code, title=title_text, default=True)
+            if s["ff_index"] == chosen else TrackChange("audio", s["ff_index"], default=False)
+            for s in audio]
+
+def subtitle_choice(subs: List[Dict], default: Optional[int] = None,
+                    forced: Optional[List[int]] = None) -> List[TrackChange]:
+    """
+    default: ff_index of the only default subtitle, NO_SUBTITLE for none, None = leave alone.
+    forced: ff_indices of the only forced subtitles, None = leave alone.
+    One TrackChange per track, so a remux writes each disposition once.
+    """
+    changes = []
+    for s in subs:
+        c = TrackChange("subtitle", s["ff_index"])
+        if default is not None:
+            c.default = s["ff_index"] == default
+        if forced is not None:
+            c.forced = s["ff_index"] in forced
+        if c.default is not None or c.forced is not None:
+            changes.append(c)
+    return changes
+
+def for_container(file_path: Path, changes: List[TrackChange]) -> List[TrackChange]:
+    """Drop what the container cannot store: MP4 has no forced flag (ffmpeg would not write one)."""
+    if file_path.suffix.lower() in {".mp4", ".m4v"}:
+        return [TrackChange(c.kind, c.ff_index, c.language, c.title, c.default) for c in changes]
+    return changes
+
+def apply_changes(file_path: Path, tracks: track_edits.Tracks, changes: List[TrackChange],
+                  tracker: ChangeTracker) -> str:
+    """
+    Apply one change-set (mkv/mp4 dispatch); on failure revert this file from its backup.
+    Returns 'applied', 'unchanged' (already matches; nothing touched), 'skipped' or 'error'.
+    """
+    ext = file_path.suffix.lower()
+    changes = for_container(file_path, changes)
+    todo = track_edits.pending(tracks, changes)
+    if ext in {".mkv", ".mp4", ".m4v"} and not todo:
+        # MKV would cost a backup copy; MP4 a backup plus a full remux
+        avoided = file_path.stat().st_size * (1 if ext == ".mkv" else 2)
+        io_stats.add(avoided=avoided)
+        print(f"SKIP: tracks already match ({track_edits.describe(changes)}); avoided {human_bytes(avoided)} of I/O")
+        return "unchanged"
+    try:
+        if ext == ".mkv":
+            which_or_die("mkvpropedit", "mkvtoolnix")
+            mkv_apply(file_path, tracks, todo, tracker)
+        elif ext in {".mp4", ".m4v"}:
+            mp4_apply(file_path, tracks, todo, tracker)
+        else:
+            print(f"Skipping unsupported extension: {ext}")
+            return "skipped"
+        tracker.log("done", original=file_path)
+        print(f"OK: updated → {track_edits.describe(todo)}")
+        return "applied"
+    except Exception as e:
+        print(f"ERROR updating: {e}")
+        # best-effort revert for this file
+        for c in tracker.changes:
+            if c.original == file_path and c.backup.exists():
+                try:
+                    tracker.revert_file(c)
+                    print("Reverted this file from backup.")
+                except Exception as ex:
+                    print(f"WARN: revert failed: {ex}")
+        return "error"
+
+# ---------- interactive flow ----------
+
+def handle_file(file_path: Path, tracker: ChangeTracker,
+                probed: Optional[Dict] = None, probe_error: Optional[Exception] = None):
     print(f"\n—— {file_path} ——")
     try:
-        audio = list_audio_streams(file_path)
+        if probe_error is not None:
+            raise probe_error
+        tracks = list_streams(file_path, probed)
     except Exception as e:
         print(f"ERROR: probe failed: {e}")
         return
+    audio, subs = tracks["audio"], tracks["subtitle"]
 
     if not audio:
         print("No audio streams found; skipping.")
@@ -340,49 +737,390 @@ def handle_file(file_path: Path, tracker: ChangeTracker):
 
     # choose language via menu (eng/spa/manual + title update)
     lang_code, title_text = prompt_lang_menu(default_code="eng")
+    changes = audio_choice(audio, chosen, lang_code, title_text)
+
+    # subtitle flags go into the same change-set: one backup, one edit/remux
+    if subs:
+        print("\nSubtitle tracks (ffprobe index):")
+        print(" idx | codec             | lang | def | forced | title")
+        print("-----+-------------------+------+-----+--------+----------------")
+        for s in subs:
+            print(f"{s['ff_index']:>3} | {human(s['codec']):17} | {s['language'][:4]:4} | "
+                  f"{'yes' if s['default'] else '':3} | {'yes' if s['forced'] else '':6} | {human(s['title'])}")
+        if file_path.suffix.lower() in {".mp4", ".m4v"}:
+            print("(MP4 has no forced flag; only the default subtitle can be changed.)")
+        default, forced = prompt_subtitle_flags(subs)
+        changes += subtitle_choice(subs, default, forced)
 
     # do it
-    try:
-        ext = file_path.suffix.lower()
-        if ext == ".mkv":
-            which_or_die("mkvpropedit", "mkvtoolnix")
-            mkv_apply(file_path, audio, chosen, lang_code, title_text, tracker)
-        elif ext in {".mp4", ".m4v"}:
-            mp4_apply(file_path, audio, chosen, lang_code, title_text, tracker)
-        else:
-            print(f"Skipping unsupported extension: {ext}")
-            return
-        print(f"OK: updated → default audio idx {chosen}, language={lang_code}, title='{title_text}'")
-    except Exception as e:
-        print(f"ERROR updating: {e}")
-        # best-effort revert for this file
-        for c in tracker.changes:
-            if c.original == file_path and c.backup.exists():
-                try:
-                    c.backup.replace(c.original)
-                    print("Reverted this file from backup.")
-                except Exception as ex:
-                    print(f"WARN: revert failed: {ex}")
+    status = apply_changes(file_path, tracks, changes, tracker)
+    media_metrics.inc("files_total", result=status)
 
-def walk_path(target: Path, tracker: ChangeTracker):
+def iter_probed(target: Path, jobs: int = media_probe.DEFAULT_JOBS,
+                probe_timeout: Optional[float] = media_probe.DEFAULT_TIMEOUT_S):
+    """Yield (path, probed, error) for every media file under target, in walk order."""
     if target.is_file():
         if is_media_file(target):
-            handle_file(target, tracker)
+            yield target, None, None
         else:
             print(f"Skipping non-media file: {target}")
         return
+    candidates = []
     for root, _, files in os.walk(target):
         for name in sorted(files):
             p = Path(root) / name
             if is_media_file(p):
-                handle_file(p, tracker)
+                candidates.append(p)
+    # probe everything ahead on the pool; consumers only wait on the first file.
+    # MKVs are left out: consumers read their Tracks natively (list_streams)
+    native = {p for p in candidates if native_mkv and p.suffix.lower() == ".mkv"}
+    probed = media_probe.probe_ordered([p for p in candidates if p not in native], jobs=jobs, timeout=probe_timeout)
+    for p in candidates:
+        yield (p, None, None) if p in native else next(probed)
+
+def walk_path(target: Path, tracker: ChangeTracker, jobs: int = media_probe.DEFAULT_JOBS,
+              probe_timeout: Optional[float] = media_probe.DEFAULT_TIMEOUT_S):
+    for p, probed, err in iter_probed(target, jobs, probe_timeout):
+        handle_file(p, tracker, probed=probed, probe_error=err)
+
+# ---------- rules / batch mode ----------
+#
+# Policy file (YAML or JSON); first matching rule wins per file:
+#
+#   rules:
+#     - name: und-only-is-english
+#       when: {only_language: und}              # every audio track is 'und'
+#       set: {language: eng}                    # title defaults to "English"
+#     - name: default-spanish
+#       select: {language: spa}                 # rule applies only if a spa track exists
+#     - name: best-english
+#       select: {language: eng, prefer: channels}
+#       subs: {default: eng, forced: title}     # same pass: subtitle flags too
+#
+# when:   only_language, has_language, missing_language, audio_count (all must hold)
+# select: language (default: suggest_audio_index's eng-or-highest-channels), prefer: first|channels
+# set:    language (default: select.language), title (default: derived from language)
+# subs:   default: language whose first non-forced subtitle becomes the only default one,
+#         or none (no default subtitle); left alone when no subtitle matches
+#         forced: title (forced flag = "forced" in the track title; MKV only, MP4 has no
+#         forced flag)
+# A rule with only subs leaves the audio tracks alone.
+
+RULE_WHEN_KEYS = {"only_language", "has_language", "missing_language", "audio_count"}
+RULE_SUBS_KEYS = {"default", "forced"}
+
+def load_rules(path: Path) -> List[Dict]:
+    text = path.read_text()
+    if path.suffix.lower() == ".json":
+        doc = json.loads(text)
+    else:
+        try:
+            import yaml
+        except ImportError:
+            raise ValueError("PyYAML is required for YAML rules (sudo apt install -y python3-yaml); or use a .json policy.")
+        doc = yaml.safe_load(text)
+    rules = (doc or {}).get("rules") if isinstance(doc, dict) else doc
+    if not isinstance(rules, list) or not rules:
+        raise ValueError(f"{path}: expected a non-empty 'rules' list")
+    for i, r in enumerate(rules):
+        if not isinstance(r, dict):
+            raise ValueError(f"{path}: rule #{i + 1} is not a mapping")
+        r.setdefault("name", f"rule{i + 1}")
+        when, select, st = r.get("when") or {}, r.get("select") or {}, r.get("set") or {}
+        subs = r.get("subs") or {}
+        unknown = set(when) - RULE_WHEN_KEYS
+        if unknown:
+            raise ValueError(f"{path}: rule '{r['name']}': unknown 'when' keys {sorted(unknown)}")
+        if select.get("prefer", "first") not in {"first", "channels"}:
+            raise ValueError(f"{path}: rule '{r['name']}': select.prefer must be 'first' or 'channels'")
+        if set(subs) - RULE_SUBS_KEYS:
+            raise ValueError(f"{path}: rule '{r['name']}': unknown 'subs' keys {sorted(set(subs) - RULE_SUBS_KEYS)}")
+        if subs.get("forced", "title") != "title":
+            raise ValueError(f"{path}: rule '{r['name']}': subs.forced must be 'title'")
+        if (select or st) and not (st.get("language") or select.get("language")):
+            raise ValueError(f"{path}: rule '{r['name']}': needs set.language or select.language")
+        if not (select or st or subs):
+            raise ValueError(f"{path}: rule '{r['name']}': needs select/set (audio) or subs")
+    return rules
+
+def rule_matches(rule: Dict, audio: List[Dict]) -> bool:
+    when = rule.get("when") or {}
+    langs = [s["language"].lower() for s in audio]
+    if "audio_count" in when and len(audio) != int(when["audio_count"]):
+        return False
+    if "only_language" in when and any(not same_language(l, when["only_language"]) for l in langs):
+        return False
+    if "has_language" in when and not any(lang_matches(s, when["has_language"]) for s in audio):
+        return False
+    if "missing_language" in when and any(lang_matches(s, when["missing_language"]) for s in audio):
+        return False
+    return True
+
+def subtitle_plan(subs: List[Dict], policy: Dict) -> Dict:
+    """A rule's subs policy -> {'subtitle_default': ff_index | NO_SUBTITLE, 'subtitle_forced': [ff_index]}."""
+    plan = {}
+    forced = [s["ff_index"] for s in subs if s.get("forced")]
+    if policy.get("forced") == "title":
+        forced = [s["ff_index"] for s in subs if "forced" in (s["title"] or "").lower()]
+        plan["subtitle_forced"] = forced
+    want = policy.get("default")
+    if want and str(want).lower() == "none":
+        plan["subtitle_default"] = NO_SUBTITLE
+    elif want:
+        matches = [s for s in subs if lang_matches(s, want)]
+        full = [s for s in matches if s["ff_index"] not in forced]  # a forced track only covers foreign dialogue
+        if matches:
+            plan["subtitle_default"] = (full or matches)[0]["ff_index"]
+    return plan
+
+def plan_for(tracks: track_edits.Tracks, rules: List[Dict]) -> Optional[Dict]:
+    """
+    First matching rule -> {'rule', 'ff_index', 'language', 'title'} (audio part, when the
+    rule has one) plus subtitle_plan() keys; None if nothing applies.
+    """
+    audio = tracks["audio"]
+    for rule in rules:
+        if not rule_matches(rule, audio):
+            continue
+        select, st = rule.get("select") or {}, rule.get("set") or {}
+        plan = {"rule": rule["name"]}
+        if select or st:
+            if not audio:
+                continue
+            if select.get("language"):
+                chosen = suggest_audio_index(audio, lang=select["language"], prefer=select.get("prefer", "first"), fallback=False)
+                if chosen is None:
+                    continue
+            else:
+                chosen = suggest_audio_index(audio, prefer=select.get("prefer", "first"))
+            lang_code = st.get("language") or select["language"]
+            plan.update(ff_index=chosen, language=lang_code, title=st.get("title") or lang_title(lang_code))
+        if rule.get("subs"):
+            plan.update(subtitle_plan(tracks["subtitle"], rule["subs"]))
+        return plan
+    return None
+
+def plan_changes(tracks: track_edits.Tracks, plan: Dict) -> List[TrackChange]:
+    """The plan as one change-set covering audio and subtitle tracks."""
+    changes = []
+    if "ff_index" in plan:
+        changes += audio_choice(tracks["audio"], plan["ff_index"], plan["language"], plan["title"])
+    return changes + subtitle_choice(tracks["subtitle"], plan.get("subtitle_default"), plan.get("subtitle_forced"))
+
+def run_rules(target: Path, rules: List[Dict], tracker: ChangeTracker, plan_out: Optional[Path],
+              dry_run: bool, jobs: int, probe_timeout: Optional[float]):
+    start = time.time()
+    counts = {"seen": 0, "applied": 0, "planned": 0, "unchanged": 0, "no_rule": 0, "error": 0}
+    bytes_scanned = 0
+    plan_f = plan_out.open("w") if plan_out else None
+    # edits run on one small pool per disk (io_sched): different disks in parallel,
+    # while this thread keeps probing and planning ahead
+    pool = io_sched.DevicePool()
+    applying = []  # (future, rec, plan), in walk order
+    output = FileOutput(sys.stdout)
+
+    def emit(rec: Dict):
+        media_metrics.inc("files_total", result=rec["action"])
+        if plan_f:
+            plan_f.write(json.dumps(rec) + "\n")
+            plan_f.flush()
+
+    def apply_one(p: Path, tracks: track_edits.Tracks, plan: Dict, changes: List[TrackChange]) -> str:
+        with output.file(p.name):
+            print(f"\n—— {p} —— rule={plan['rule']}")
+            return apply_changes(p, tracks, changes, tracker)
+
+    def settle(block: bool):
+        while applying and (block or applying[0][0].done()):
+            fut, rec, plan = applying.pop(0)
+            status = fut.result()
+            counts[status] = counts.get(status, 0) + 1
+            rec.update(action=status, **plan)
+            emit(rec)
+
+    stdout, sys.stdout = sys.stdout, output
+    try:
+        for p, probed, err in iter_probed(target, jobs, probe_timeout):
+            counts["seen"] += 1
+            rec = {"path": str(p)}
+            try:
+                if err is not None:
+                    raise err
+                tracks = list_streams(p, probed)
+                bytes_scanned += p.stat().st_size
+                media_metrics.inc("bytes_total", p.stat().st_size, kind="scanned")
+            except Exception as e:
+                counts["error"] += 1
+                rec.update(action="error", reason=f"probe failed: {e}")
+                tracks = None
+            if tracks is not None:
+                has_tracks = tracks["audio"] or tracks["subtitle"]
+                plan = plan_for(tracks, rules) if has_tracks else None
+                changes = for_container(p, plan_changes(tracks, plan)) if plan else []
+                diff = track_edits.diff(tracks, changes) if plan else []
+                if plan is None:
+                    counts["no_rule"] += 1
+                    rec.update(action="skip", reason="no audio or subtitle streams" if not has_tracks else "no rule matched")
+                elif not diff:
+                    counts["unchanged"] += 1
+                    io_stats.add(avoided=p.stat().st_size * (1 if p.suffix.lower() == ".mkv" else 2))
+                    rec.update(action="unchanged", **plan)
+                elif dry_run:
+                    counts["planned"] += 1
+                    rec.update(action="plan", changes=diff, **plan)
+                else:
+                    applying.append((pool.submit(p, apply_one, p, tracks, plan, changes), rec, plan))
+                    settle(block=False)
+                    continue
+            emit(rec)
+        settle(block=True)
+    except BaseException:
+        pool.shutdown(cancel=True)  # Ctrl+C/errors: interrupt running edits (each reverts its file), drop queued ones
+        raise
+    finally:
+        pool.shutdown()
+        sys.stdout = stdout
+        if plan_f:
+            plan_f.close()
+    elapsed = max(time.time() - start, 0.001)
+    print(f"\nSummary: files={counts['seen']} applied={counts['applied']} planned={counts['planned']} "
+          f"unchanged={counts['unchanged']} no_rule={counts['no_rule']} errors={counts['error']} mode={'DRY-RUN' if dry_run else 'APPLY'}")
+    print(f"Throughput: {counts['seen']/elapsed:.1f} files/s, scanned {human_bytes(bytes_scanned)}, "
+          f"rewritten {human_bytes(io_stats.bytes_written)}, avoided {human_bytes(io_stats.bytes_avoided)} in {elapsed:.1f}s")
+
+# ---------- crash recovery ----------
+
+def recover_runs(journal: run_journal.RunJournal, mode: str, keep_backups: bool):
+    """
+    Settle runs that never wrote 'end'. mode='rollback' restores every file the run
+    touched; mode='commit' keeps files whose edit finished and restores only in-flight ones.
+    Unconfirmed (partial) backups and ffmpeg temp files are deleted either way.
+    """
+    runs = journal.incomplete_runs()
+    if not runs:
+        print("Nothing to recover.")
+    for run_id, recs in runs.items():
+        print(f"Recovering run {run_id} ({mode})...")
+        files: Dict[str, Dict] = OrderedDict()
+        for r in recs:
+            orig = r.get("original")
+            if not orig:
+                continue
+            st = files.setdefault(orig, {"intended": [], "change": None, "tmp": [], "done": False, "reverted": False})
+            if r["op"] == "backup":
+                st["intended"].append(r["backup"])
+            elif r["op"] == "backup_ok":
+                st["change"] = Change(original=Path(orig), backup=Path(r["backup"]), strategy=r["strategy"])
+            elif r["op"] == "tmp":
+                st["tmp"].append(r["path"])
+            elif r["op"] == "done":
+                st["done"] = True
+            elif r["op"] == "reverted":
+                st["reverted"] = True
+        for orig, st in files.items():
+            c = st["change"]
+            stray = st["tmp"] + [b for b in st["intended"] if c is None or b != str(c.backup)]
+            for p in map(Path, stray):
+                if p.exists():
+                    p.unlink()
+                    print(f"  removed stray: {p}")
+            if c is None or st["reverted"] or not c.backup.exists():
+                continue
+            try:
+                if mode == "commit" and st["done"]:
+                    if not keep_backups:
+                        c.backup.unlink()
+                    print(f"  kept edit: {c.original}")
+                else:
+                    c.restore()
+                    journal.write("reverted", run=run_id, original=orig)
+                    print(f"  restored: {c.original} ({c.strategy} backup)")
+            except Exception as e:
+                print(f"  WARN: failed to recover {c.original}: {e}")
+        journal.end(f"recovered-{mode}", run=run_id)
+    journal.compact()
 
 def main():
-    parser = argparse.ArgumentParser(description="Set default audio & language on MKV/MP4 (eng/spa/manual) without re-encode.")
-    parser.add_argument("path", help="File or directory (movie or TV path)")
+    parser = argparse.ArgumentParser(description="Set default audio & language (and subtitle default/forced flags) on MKV/MP4 without re-encode.")
+    parser.add_argument("path", nargs="?", help="File or directory (movie or TV path)")
     parser.add_argument("--keep-backups", action="store_true", help="Keep .bak.* files after success (default is delete).")
+    parser.add_argument("--probe-cache", default=str(media_probe.DEFAULT_CACHE_PATH), help="SQLite probe cache path (default: %(default)s).")
+    parser.add_argument("--no-probe-cache", action="store_true", help="Always run ffprobe; do not read or write the probe cache.")
+    parser.add_argument("--jobs", type=int, default=media_probe.DEFAULT_JOBS, help="Max concurrent ffprobe processes for directory walks (default: %(default)s).")
+    parser.add_argument("--probe-timeout", type=float, default=media_probe.DEFAULT_TIMEOUT_S, help="Seconds before a single ffprobe is abandoned (default: %(default)s).")
+    parser.add_argument("--ffprobe-mkv", action="store_true", help="Probe MKVs with ffprobe too, instead of reading their Tracks element directly.")
+    parser.add_argument("--backup-strategy", choices=BACKUP_STRATEGIES, default="auto",
+                        help="auto: reflink, else zero-copy, else chunked copy; reflink: clone or fail; copy: never reflink; "
+                             "none-header-journal: MKV journals only the edited header bytes, MP4 remuxes use auto. "
+                             "In-place MP4 edits journal only the patched bytes under auto and none-header-journal (default: %(default)s).")
+    parser.add_argument("--journal", default=str(DEFAULT_JOURNAL_PATH), help="Write-ahead run journal (default: %(default)s).")
+    parser.add_argument("--no-journal", action="store_true", help="Do not journal operations (a killed run cannot be recovered).")
+    parser.add_argument("--recover", choices=("rollback", "commit"),
+                        help="Settle runs left incomplete in the journal, then exit. rollback: restore every touched file; "
+                             "commit: keep finished edits, restore only in-flight ones.")
+    parser.add_argument("--genpts", action="store_true", help="MP4 remux: pass -fflags +genpts (sources with missing timestamps).")
+    parser.add_argument("--max-muxing-queue-size", type=int, metavar="N",
+                        help="MP4 remux: -max_muxing_queue_size N (for 'Too many packets buffered' failures).")
+    parser.add_argument("--max-io-rate", type=float, metavar="MB_S",
+                        help="Cap backup copies and remuxes at MB_S per disk, leaving bandwidth for streaming (default: no cap).")
+    parser.add_argument("--io-per-device", type=int, default=1,
+                        help="Heavy file operations running at once per disk; other disks run in parallel (default: %(default)s).")
+    parser.add_argument("--io-idle", action="store_true",
+                        help="Run heavy file operations in the idle I/O class (like ionice -c3; BFQ scheduler only).")
+    parser.add_argument("--progress-interval", type=float, default=ffmpeg_remux.RemuxOptions.redraw_interval,
+                        help="Seconds between remux progress redraws (default: %(default)s).")
+    parser.add_argument("--metrics-dir", default=str(media_metrics.DEFAULT_TEXTFILE_DIR),
+                        help="node_exporter textfile directory for tag_audio_lang.prom; skipped if missing (default: %(default)s).")
+    parser.add_argument("--metrics-port", type=int,
+                        help="Also serve live metrics on http://0.0.0.0:PORT/metrics (default: $MEDIA_METRICS_PORT, else off).")
+    parser.add_argument("--rules", help="YAML/JSON policy; run non-interactively (no prompts).")
+    parser.add_argument("--plan", help="With --rules: write one JSON line per file (path, rule, action, track).")
+    parser.add_argument("--dry-run", action="store_true", help="With --rules: plan only, do not modify files.")
     args = parser.parse_args()
 
+    rules = None
+    if args.rules:
+        try:
+            rules = load_rules(Path(args.rules))
+        except (OSError, ValueError) as e:
+            print(f"ERROR: bad rules file: {e}", file=sys.stderr)
+            sys.exit(1)
+    elif args.plan or args.dry_run:
+        parser.error("--plan/--dry-run require --rules")
+    if not args.path and not args.recover:
+        parser.error("path is required (unless --recover)")
+
+    journal = None
+    if not args.no_journal:
+        try:
+            journal = run_journal.RunJournal(Path(args.journal))
+        except run_journal.JournalBusy as e:
+            print(f"ERROR: {e}", file=sys.stderr)
+            sys.exit(1)
+        except OSError as e:
+            if args.recover:
+                print(f"ERROR: cannot open journal: {e}", file=sys.stderr)
+                sys.exit(1)
+            print(f"WARN: run journal unavailable ({e}); a killed run will not be recoverable.", file=sys.stderr)
+    elif args.recover:
+        parser.error("--recover needs the journal")
+    if args.recover:
+        recover_runs(journal, args.recover, args.keep_backups)
+        journal.close()
+        return
+    if journal is not None and journal.incomplete_runs():
+        print(f"ERROR: {journal.path} has incomplete run(s) from an earlier crash; "
+              "run with --recover rollback (or --recover commit) first.", file=sys.stderr)
+        sys.exit(1)
+
+    media_probe.configure_cache(None if args.no_probe_cache else Path(args.probe_cache))
+    global native_mkv
+    native_mkv = not args.ffprobe_mkv
+    remux_options.genpts = args.genpts
+    remux_options.max_muxing_queue_size = args.max_muxing_queue_size
+    remux_options.redraw_interval = max(args.progress_interval, 0.0)
+    io_sched.configure(args.io_per_device, args.max_io_rate, args.io_idle)
+
     which_or_die("ffprobe", "ffmpeg")
     which_or_die("ffmpeg", "ffmpeg")
 
@@ -391,19 +1129,43 @@ def main():
         print(f"ERROR: path not found: {target}", file=sys.stderr)
         sys.exit(1)
 
-    tracker = ChangeTracker(keep_backups=args.keep_backups)
+    tracker = ChangeTracker(keep_backups=args.keep_backups, backup_strategy=args.backup_strategy, journal=journal)
+    if journal is not None:
+        journal.begin(sys.argv)
+    metrics_port = args.metrics_port if args.metrics_port is not None else media_metrics.env_port()
+    if metrics_port:
+        media_metrics.serve(metrics_port)
+    success = False
     try:
-        walk_path(target, tracker)
+        if rules is not None:
+            run_rules(target, rules, tracker, Path(args.plan) if args.plan else None,
+                      args.dry_run, jobs=max(args.jobs, 1), probe_timeout=args.probe_timeout)
+        else:
+            walk_path(target, tracker, jobs=max(args.jobs, 1), probe_timeout=args.probe_timeout)
         tracker.cleanup_backups()
+        tracker.finish("ok")
+        if io_stats.bytes_avoided:
+            print(f"Skipped already-tagged files: avoided {human_bytes(io_stats.bytes_avoided)} of backup/remux I/O.")
         print("\nDone.")
+        success = True
     except KeyboardInterrupt:
         tracker.revert_all()
+        tracker.finish("rolled_back")
         print("\nCancelled (Ctrl+C).")
         sys.exit(130)
+    except SystemExit:
+        tracker.revert_all()
+        tracker.finish("rolled_back")
+        raise
     except Exception as e:
         tracker.revert_all()
+        tracker.finish("rolled_back")
         print(f"\nFailed: {e}")
         sys.exit(1)
+    finally:
+        media_metrics.inc("bytes_total", io_stats.bytes_written, kind="written")
+        media_metrics.inc("bytes_total", io_stats.bytes_avoided, kind="avoided")
+        media_metrics.finish(success=success, directory=Path(args.metrics_dir))
 
 if __name__ == "__main__":
     main()
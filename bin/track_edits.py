@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Declarative track change-sets (audio + subtitle) for tag_audio_lang.py.
+
+A change-set is a list of TrackChange, one per track to touch; a field left at None
+is not touched. One change-set per file is
+- diffed against the probed tracks first (nothing differs -> no backup, no I/O)
+- turned into the edits of a single mkvpropedit call (MKV), or into in-place box
+  patches (mp4_boxes.py) / the arguments of a single ffmpeg remux (MP4)
+so fixing audio and subtitle flags together costs one backup and one pass.
+Tracks are given as {"audio": [...], "subtitle": [...]} stream dicts (media_probe.py /
+ebml.py), each list in stream order; mkvpropedit and ffmpeg address a track by its
+position within its type.
+"""
+
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+KIND_LETTER = {"audio": "a", "subtitle": "s"}
+FIELDS = ("language", "title", "default", "forced")
+Tracks = Dict[str, List[Dict]]
+
+@dataclass
+class TrackChange:
+    kind: str                       # "audio" | "subtitle"
+    ff_index: int                   # ffprobe stream index
+    language: Optional[str] = None
+    title: Optional[str] = None
+    default: Optional[bool] = None
+    forced: Optional[bool] = None
+
+    @property
+    def label(self) -> str:
+        return f"{KIND_LETTER[self.kind]}{self.ff_index}"
+
+def position(tracks: Tracks, change: TrackChange) -> int:
+    """0-based position of the changed track among the tracks of its kind."""
+    for i, s in enumerate(tracks.get(change.kind, [])):
+        if s["ff_index"] == change.ff_index:
+            return i
+    raise ValueError(f"{change.kind} stream {change.ff_index} not present")
+
+def _current(stream: Dict, field: str):
+    if field == "language":
+        return stream.get("language") or "und"
+    if field == "title":
+        return stream.get("title") or ""
+    return bool(stream.get(field))
+
+def _show(field: str, value) -> str:
+    if field == "title":
+        return f"'{value}'"
+    return str(int(value)) if isinstance(value, bool) else str(value)
+
+def _differs(stream: Dict, field: str, want) -> bool:
+    have = _current(stream, field)
+    return have.lower() != want.lower() if field == "language" else have != want
+
+def pending(tracks: Tracks, changes: List[TrackChange]) -> List[TrackChange]:
+    """The change-set reduced to the fields that actually differ (tracks with none dropped)."""
+    out = []
+    for c in changes:
+        stream = tracks[c.kind][position(tracks, c)]
+        kept = TrackChange(c.kind, c.ff_index)
+        for field in FIELDS:
+            want = getattr(c, field)
+            if want is not None and _differs(stream, field, want):
+                setattr(kept, field, want)
+        if any(getattr(kept, f) is not None for f in FIELDS):
+            out.append(kept)
+    return out
+
+def diff(tracks: Tracks, changes: List[TrackChange]) -> List[str]:
+    """Fields that differ between the probed tracks and the change-set (empty = no-op)."""
+    out = []
+    for c in pending(tracks, changes):
+        stream = tracks[c.kind][position(tracks, c)]
+        for field in FIELDS:
+            want = getattr(c, field)
+            if want is not None:
+                out.append(f"{c.label}.{field} {_show(field, _current(stream, field))}->{_show(field, want)}")
+    return out
+
+def mkvpropedit_edits(tracks: Tracks, changes: List[TrackChange]) -> List[str]:
+    """--edit/--set arguments for one mkvpropedit call (track:a1 = first audio track)."""
+    edits = []
+    for c in changes:
+        sets = []
+        if c.language is not None:
+            sets += ["--set", f"language={c.language}"]
+        if c.title is not None:
+            sets += ["--set", f"name={c.title}"]
+        if c.default is not None:
+            sets += ["--set", f"flag-default={int(c.default)}"]
+        if c.forced is not None:
+            sets += ["--set", f"flag-forced={int(c.forced)}"]
+        if sets:
+            edits += ["--edit", f"track:{KIND_LETTER[c.kind]}{position(tracks, c) + 1}"] + sets
+    return edits
+
+def ffmpeg_args(tracks: Tracks, changes: List[TrackChange], probe_streams: List[Dict]) -> List[str]:
+    """
+    Stream-copy remux arguments applying the change-set. A stream's disposition is
+    written whole, so the flags the change-set does not touch are carried over from
+    ffprobe's view of it (probe_streams).
+    """
+    dispositions = {s.get("index"): {k for k, v in (s.get("disposition") or {}).items() if v} for s in probe_streams}
+    args = ["-map", "0", "-c", "copy"]
+    for c in changes:
+        spec = f"{KIND_LETTER[c.kind]}:{position(tracks, c)}"
+        if c.default is not None or c.forced is not None:
+            flags = set(dispositions.get(c.ff_index, ()))
+            for name, want in (("default", c.default), ("forced", c.forced)):
+                if want:
+                    flags.add(name)
+                elif want is not None:
+                    flags.discard(name)
+            args += [f"-disposition:{spec}", "+".join(sorted(flags)) or "0"]
+        if c.language is not None:
+            args += [f"-metadata:s:{spec}", f"language={c.language}"]
+        if c.title is not None:
+            args += [f"-metadata:s:{spec}", f"title={c.title}"]
+    return args + ["-movflags", "use_metadata_tags"]
+
+def describe(changes: List[TrackChange]) -> str:
+    """One line for logs: a1 language=eng title='English' default=1; s3 forced=1"""
+    parts = []
+    for c in changes:
+        fields = [f"{f}={_show(f, getattr(c, f))}" for f in FIELDS if getattr(c, f) is not None]
+        if fields:
+            parts.append(f"{c.label} " + " ".join(fields))
+    return "; ".join(parts) or "no changes"